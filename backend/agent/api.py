@@ -1,10 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Body, File, UploadFile, Form, Query
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 import asyncio
 import json
 import traceback
 import base64
-from datetime import datetime, timezone
+import hashlib
+from datetime import datetime, timedelta, timezone
 import uuid
 from typing import Optional, List, Dict, Any
 import jwt
@@ -13,9 +14,14 @@ import tempfile
 import os
 
 from agentpress.thread_manager import ThreadManager
+from agentpress.message_cache import thread_message_cache
 from services.supabase import DBConnection
 from services import redis
-from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stream_auth, verify_thread_access, verify_admin_api_key
+from services.response_stream import (
+    run_uses_stream, read_stream, get_all_responses, append_stream_control,
+    format_sse, STREAM_START_ID,
+)
+from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stream_auth, verify_thread_access, verify_admin_api_key, invalidate_ownership_cache
 from utils.logger import logger, structlog
 from services.billing import check_billing_status, can_use_model
 from utils.config import config
@@ -238,11 +244,9 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
     final_status = "failed" if error_message else "stopped"
 
     # Attempt to fetch final responses from Redis
-    response_list_key = f"agent_run:{agent_run_id}:responses"
     all_responses = []
     try:
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        all_responses = await get_all_responses(agent_run_id)
         logger.info(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
     except Exception as e:
         logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
@@ -260,6 +264,7 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
     # Send STOP signal to the global control channel
     global_control_channel = f"agent_run:{agent_run_id}:control"
     try:
+        await append_stream_control(agent_run_id, "STOP")
         await redis.publish(global_control_channel, "STOP")
         logger.debug(f"Published STOP signal to global channel {global_control_channel}")
     except Exception as e:
@@ -728,7 +733,11 @@ async def stream_agent_run(
     token: Optional[str] = None,
     request: Request = None
 ):
-    """Stream the responses of an agent run using Redis Lists and Pub/Sub."""
+    """Stream the responses of an agent run using Redis Lists and Pub/Sub, or a Redis Stream.
+
+    For runs on the stream transport, every event carries the stream entry ID as
+    its SSE id, and clients may resume after a given event with `Last-Event-ID`.
+    """
     logger.info(f"Starting stream for agent run: {agent_run_id}")
     client = await db.client
 
@@ -744,6 +753,53 @@ async def stream_agent_run(
     response_channel = f"agent_run:{agent_run_id}:new_response"
     control_channel = f"agent_run:{agent_run_id}:control" # Global control channel
 
+    async def stream_generator_from_stream(agent_run_data, last_event_id: str):
+        logger.debug(f"Streaming responses for {agent_run_id} from Redis stream after {last_event_id}")
+        initial_yield_complete = False
+        try:
+            # 1. Replay stored responses; if the run is no longer running, end after the replay
+            current_status = agent_run_data.get('status') if agent_run_data else None
+            follow = current_status == 'running'
+            if follow:
+                structlog.contextvars.bind_contextvars(
+                    thread_id=agent_run_data.get('thread_id'),
+                )
+
+            # 2. A single blocking XREAD per client replaces pub/sub plus LRANGE polling
+            async for entry_id, fields in read_stream(agent_run_id, last_event_id, follow=follow):
+                if "control" in fields:
+                    control_signal = fields["control"]
+                    if not follow:
+                        continue
+                    logger.info(f"Received control signal '{control_signal}' for {agent_run_id}")
+                    yield format_sse(json.dumps({'type': 'status', 'status': control_signal}), entry_id)
+                    return
+
+                response_json = fields.get("data")
+                if response_json is None:
+                    continue
+                yield format_sse(response_json, entry_id)
+                initial_yield_complete = True
+
+                if follow:
+                    response = json.loads(response_json)
+                    if response.get('type') == 'status' and response.get('status') in ['completed', 'failed', 'stopped']:
+                        logger.info(f"Detected run completion via status message in stream: {response.get('status')}")
+                        return
+
+            if not follow:
+                logger.info(f"Agent run {agent_run_id} is not running (status: {current_status}). Ending stream.")
+                yield f"data: {json.dumps({'type': 'status', 'status': 'completed'})}\n\n"
+
+        except asyncio.CancelledError:
+            logger.info(f"Stream generator cancelled for {agent_run_id}")
+        except Exception as e:
+            logger.error(f"Error streaming agent run {agent_run_id} from Redis stream: {e}", exc_info=True)
+            if not initial_yield_complete:
+                yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Failed to start stream: {e}'})}\n\n"
+            else:
+                yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Stream failed: {e}'})}\n\n"
+
     async def stream_generator(agent_run_data):
         logger.debug(f"Streaming responses for {agent_run_id} using Redis list {response_list_key} and channel {response_channel}")
         last_processed_index = -1
@@ -913,7 +969,13 @@ async def stream_agent_run(
             await asyncio.sleep(0.1)
             logger.debug(f"Streaming cleanup complete for agent run: {agent_run_id}")
 
-    return StreamingResponse(stream_generator(agent_run_data), media_type="text/event-stream", headers={
+    if await run_uses_stream(agent_run_id):
+        last_event_id = (request.headers.get("Last-Event-ID") if request else None) or STREAM_START_ID
+        generator = stream_generator_from_stream(agent_run_data, last_event_id)
+    else:
+        generator = stream_generator(agent_run_data)
+
+    return StreamingResponse(generator, media_type="text/event-stream", headers={
         "Cache-Control": "no-cache, no-transform", "Connection": "keep-alive",
         "X-Accel-Buffering": "no", "Content-Type": "text/event-stream",
         "Access-Control-Allow-Origin": "*"
@@ -2469,6 +2531,8 @@ async def delete_agent(agent_id: str, user_id: str = Depends(get_current_user_id
             logger.warning(f"No agent was deleted for agent_id: {agent_id}, user_id: {user_id}")
             raise HTTPException(status_code=403, detail="Unable to delete agent - permission denied or agent not found")
         
+        await invalidate_ownership_cache("agent", agent_id)
+        
         try:
             from utils.cache import Cache
             await Cache.invalidate(f"agent_count_limit:{user_id}")
@@ -2994,101 +3058,123 @@ async def get_agent_tools(
 
 
 
+THREAD_LIST_COLUMNS = 'thread_id, account_id, project_id, metadata, is_public, created_at, updated_at'
+PROJECT_SUMMARY_COLUMNS = 'project_id, name, description, account_id, is_public, created_at, updated_at'
+
+
+MESSAGE_SUMMARY_COLUMNS = 'message_id, thread_id, type, is_llm_message, metadata, agent_id, agent_version_id, created_at, updated_at'
+MESSAGE_BATCH_SIZE = 1000
+# Rows do not become visible in created_at order: a run's MessageWriter stamps created_at
+# before its batched insert (plus retries), while other inserts get the database's now().
+# Polls with `after` therefore re-read this window behind the cursor; clients dedupe by message_id.
+MESSAGE_CURSOR_OVERLAP = timedelta(seconds=10)
+
+
+def _encode_cursor(created_at: str, row_id: str) -> str:
+    """Opaque keyset cursor for a row ordered by (created_at, id)."""
+    raw = json.dumps([created_at, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        datetime.fromisoformat(created_at)
+        uuid.UUID(row_id)
+        return created_at, row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _keyset_condition(cursor: str, op: str, id_column: str) -> str:
+    """PostgREST `or` filter for rows before (op=lt) or after (op=gt) the cursor in (created_at, id) order."""
+    created_at, row_id = _decode_cursor(cursor)
+    return f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",{id_column}.{op}.{row_id})'
+
+
 @router.get("/threads")
 async def get_user_threads(
     user_id: str = Depends(get_current_user_id_from_jwt),
     page: Optional[int] = Query(1, ge=1, description="Page number (1-based)"),
-    limit: Optional[int] = Query(1000, ge=1, le=1000, description="Number of items per page (max 1000)")
+    limit: Optional[int] = Query(1000, ge=1, le=1000, description="Number of items per page (max 1000)"),
+    cursor: Optional[str] = Query(None, description="Cursor from pagination.next_cursor; switches to keyset pagination and ignores page"),
+    count: Optional[str] = Query(None, pattern="^(exact|estimated|none)$", description="How to compute pagination.total: exact, estimated (from the query planner) or none. Defaults to exact for page-based requests and none for cursor requests")
 ):
-    """Get all threads for the current user with associated project data."""
-    logger.info(f"Fetching threads with project data for user: {user_id} (page={page}, limit={limit})")
+    """Get the current user's threads, newest first, with a summary of their projects.
+
+    Threads are paged on `(created_at, thread_id)`: every response carries
+    `pagination.next_cursor`, and passing it back as `cursor` returns the next
+    page without counting or skipping the rows before it. `page` still works
+    for existing clients and is translated to an offset on the same ordering.
+    """
+    logger.info(f"Fetching threads with project data for user: {user_id} (page={page}, cursor={cursor is not None}, limit={limit})")
     client = await db.client
+    count_method = count or ('none' if cursor else 'exact')
     try:
-        offset = (page - 1) * limit
-        
-        # First, get threads for the user
-        threads_result = await client.table('threads').select('*').eq('account_id', user_id).order('created_at', desc=True).execute()
-        
-        if not threads_result.data:
-            logger.info(f"No threads found for user: {user_id}")
-            return {
-                "threads": [],
-                "pagination": {
-                    "page": page,
-                    "limit": limit,
-                    "total": 0,
-                    "pages": 0
-                }
-            }
-        
-        total_count = len(threads_result.data)
-        
-        # Apply pagination to threads
-        paginated_threads = threads_result.data[offset:offset + limit]
-        
-        # Extract unique project IDs from threads that have them
-        project_ids = [
-            thread['project_id'] for thread in paginated_threads 
-            if thread.get('project_id')
-        ]
-        unique_project_ids = list(set(project_ids)) if project_ids else []
-        
-        # Fetch projects if we have project IDs
+        query = client.table('threads').select(
+            THREAD_LIST_COLUMNS, count=None if count_method == 'none' else count_method
+        ).eq('account_id', user_id)
+
+        if cursor:
+            query = query.or_(_keyset_condition(cursor, 'lt', 'thread_id'))
+            offset = 0
+        else:
+            offset = (page - 1) * limit
+
+        # One extra row tells whether there is a next page without counting
+        threads_result = await query.order('created_at', desc=True).order('thread_id', desc=True) \
+            .range(offset, offset + limit).execute()
+
+        threads = threads_result.data or []
+        has_more = len(threads) > limit
+        threads = threads[:limit]
+        total_count = threads_result.count if count_method != 'none' else None
+
+        # Fetch a summary of the projects of this page
         projects_by_id = {}
+        unique_project_ids = list({thread['project_id'] for thread in threads if thread.get('project_id')})
         if unique_project_ids:
-            projects_result = await client.table('projects').select('*').in_('project_id', unique_project_ids).execute()
-            
-            if projects_result.data:
-                logger.info(f"[API] Raw projects from DB: {len(projects_result.data)}")
-                # Create a lookup map of projects by ID
-                projects_by_id = {
-                    project['project_id']: project 
-                    for project in projects_result.data
-                }
-        
-        # Map threads with their associated projects
+            projects_result = await client.table('projects').select(PROJECT_SUMMARY_COLUMNS).in_('project_id', unique_project_ids).execute()
+            projects_by_id = {project['project_id']: project for project in projects_result.data or []}
+
         mapped_threads = []
-        for thread in paginated_threads:
-            project_data = None
-            if thread.get('project_id') and thread['project_id'] in projects_by_id:
-                project = projects_by_id[thread['project_id']]
-                project_data = {
-                    "project_id": project['project_id'],
-                    "name": project.get('name', ''),
-                    "description": project.get('description', ''),
-                    "account_id": project['account_id'],
-                    "sandbox": project.get('sandbox', {}),
-                    "is_public": project.get('is_public', False),
-                    "created_at": project['created_at'],
-                    "updated_at": project['updated_at']
-                }
-            
-            mapped_thread = {
+        for thread in threads:
+            project = projects_by_id.get(thread.get('project_id'))
+            mapped_threads.append({
                 "thread_id": thread['thread_id'],
                 "account_id": thread['account_id'],
                 "project_id": thread.get('project_id'),
-                "metadata": thread.get('metadata', {}),
+                "metadata": thread.get('metadata') or {},
                 "is_public": thread.get('is_public', False),
                 "created_at": thread['created_at'],
                 "updated_at": thread['updated_at'],
-                "project": project_data
-            }
-            mapped_threads.append(mapped_thread)
-        
-        total_pages = (total_count + limit - 1) // limit if total_count else 0
-        
+                "project": {
+                    "project_id": project['project_id'],
+                    "name": project.get('name') or '',
+                    "description": project.get('description') or '',
+                    "account_id": project['account_id'],
+                    "is_public": project.get('is_public', False),
+                    "created_at": project['created_at'],
+                    "updated_at": project['updated_at']
+                } if project else None
+            })
+
         logger.info(f"[API] Mapped threads for frontend: {len(mapped_threads)} threads, {len(projects_by_id)} unique projects")
-        
+
         return {
             "threads": mapped_threads,
             "pagination": {
-                "page": page,
+                "page": None if cursor else page,
                 "limit": limit,
                 "total": total_count,
-                "pages": total_pages
+                "pages": (total_count + limit - 1) // limit if total_count is not None else None,
+                "next_cursor": _encode_cursor(threads[-1]['created_at'], threads[-1]['thread_id']) if has_more else None,
+                "has_more": has_more
             }
         }
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching threads for user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch threads: {str(e)}")
@@ -3282,33 +3368,111 @@ async def create_thread(
 @router.get("/threads/{thread_id}/messages")
 async def get_thread_messages(
     thread_id: str,
+    request: Request,
     user_id: str = Depends(get_current_user_id_from_jwt),
-    order: str = Query("desc", description="Order by created_at: 'asc' or 'desc'")
+    order: str = Query("desc", description="Order by created_at: 'asc' or 'desc'"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Maximum number of messages to return (all when omitted)"),
+    after: Optional[str] = Query(None, description="Cursor: only messages after this one"),
+    before: Optional[str] = Query(None, description="Cursor: only messages before this one"),
+    since: Optional[str] = Query(None, description="ISO timestamp: only messages created after it"),
+    exclude_types: Optional[List[str]] = Query(None, description="Message types to leave out, e.g. status and browser_state"),
+    include_content: bool = Query(True, description="Include the content of each message; false returns the other columns only")
 ):
-    """Get all messages for a thread, fetching in batches of 1000 from the DB to avoid large queries."""
-    logger.info(f"Fetching all messages for thread: {thread_id}, order={order}")
+    """Get a window of a thread's messages.
+
+    Without parameters this returns every message, as before. `after`/`before`
+    take the `pagination.next_cursor` of a previous response, so clients can
+    page (order=desc&before=...) or poll for new rows (order=asc&after=...).
+    With `after`, rows up to `MESSAGE_CURSOR_OVERLAP` older than the cursor are
+    returned again, so rows committed late with an earlier created_at are not
+    missed; clients dedupe them by message_id. The cursor only advances over the
+    rows after it. The response carries an ETag; a request with a matching
+    If-None-Match gets 304 Not Modified.
+    """
+    logger.info(f"Fetching messages for thread: {thread_id}, order={order}, limit={limit}")
     client = await db.client
     await verify_thread_access(client, thread_id, user_id)
+
+    desc = order == "desc"
+    if since:
+        try:
+            datetime.fromisoformat(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid since timestamp")
+
+    def window_query(scan_cursor: Optional[str], overlap: bool = False):
+        query = client.table('messages').select('*' if include_content else MESSAGE_SUMMARY_COLUMNS).eq('thread_id', thread_id)
+        if exclude_types:
+            query = query.not_.in_('type', exclude_types)
+        if since:
+            query = query.gt('created_at', since)
+        conditions = []
+        if after and overlap:
+            # The window behind the cursor, which may hold rows that became visible after it was issued
+            cursor_created_at = datetime.fromisoformat(_decode_cursor(after)[0])
+            query = query.gt('created_at', (cursor_created_at - MESSAGE_CURSOR_OVERLAP).isoformat())
+            conditions.append(_keyset_condition(after, 'lt', 'message_id'))
+        elif after:
+            conditions.append(_keyset_condition(after, 'gt', 'message_id'))
+        if before:
+            conditions.append(_keyset_condition(before, 'lt', 'message_id'))
+        if scan_cursor:
+            conditions.append(_keyset_condition(scan_cursor, 'lt' if desc else 'gt', 'message_id'))
+        if len(conditions) == 1:
+            query = query.or_(conditions[0])
+        elif conditions:
+            query = query.or_('and(' + ','.join(f'or({condition})' for condition in conditions) + ')')
+        return query.order('created_at', desc=desc).order('message_id', desc=desc)
+
     try:
-        batch_size = 1000
-        offset = 0
-        all_messages = []
+        messages = []
+        has_more = False
+        scan_cursor = None
         while True:
-            query = client.table('messages').select('*').eq('thread_id', thread_id)
-            query = query.order('created_at', desc=(order == "desc"))
-            query = query.range(offset, offset + batch_size - 1)
-            messages_result = await query.execute()
+            # One extra row tells whether the window continues
+            batch_size = limit + 1 if limit else MESSAGE_BATCH_SIZE
+            messages_result = await window_query(scan_cursor).limit(batch_size).execute()
             batch = messages_result.data or []
-            all_messages.extend(batch)
-            logger.debug(f"Fetched batch of {len(batch)} messages (offset {offset})")
+            if limit:
+                has_more = len(batch) > limit
+                messages = batch[:limit]
+                break
+            messages.extend(batch)
+            logger.debug(f"Fetched batch of {len(batch)} messages")
             if len(batch) < batch_size:
                 break
-            offset += batch_size
-        return {"messages": all_messages}
+            scan_cursor = _encode_cursor(batch[-1]['created_at'], batch[-1]['message_id'])
+
+        if messages:
+            next_cursor = _encode_cursor(messages[-1]['created_at'], messages[-1]['message_id'])
+        else:
+            next_cursor = before if desc else after
+
+        if after:
+            overlap_result = await window_query(None, overlap=True).limit(MESSAGE_BATCH_SIZE).execute()
+            overlap_rows = overlap_result.data or []
+            messages = messages + overlap_rows if desc else overlap_rows + messages
+
+        body = json.dumps({
+            "messages": messages,
+            "pagination": {
+                "limit": limit,
+                "has_more": has_more,
+                "next_cursor": next_cursor
+            }
+        }, default=str)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching messages for thread {thread_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {str(e)}")
 
+    etag = f'"{hashlib.sha256(body.encode()).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
 @router.get("/agent-runs/{agent_run_id}")
 async def get_agent_run(
@@ -3413,6 +3577,7 @@ async def delete_message(
     try:
         # Don't allow users to delete the "status" messages
         await client.table('messages').delete().eq('message_id', message_id).eq('is_llm_message', True).eq('thread_id', thread_id).execute()
+        await thread_message_cache.invalidate(thread_id)
         return {"message": "Message deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting message {message_id} from thread {thread_id}: {str(e)}")
@@ -150,11 +150,11 @@ You have the ability to execute operations using both Python and CLI tools:
      * Example: 
        <function_calls>
        <invoke name="execute_command">
-       <parameter name="session_name">default</parameter>
        <parameter name="blocking">true</parameter>
        <parameter name="command">ls -l</parameter>
        </invoke>
        </function_calls>
+     * Blocking commands run in a fresh shell, not in a tmux session: `session_name` is ignored, and environment variables, activated virtualenvs or directory changes from earlier commands do not carry over
      * IMPORTANT: Do not use for long-running operations as they will timeout after 60 seconds
   
   2. Asynchronous Commands (non-blocking):
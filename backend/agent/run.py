@@ -34,6 +34,7 @@ from agent.gpt_prompt import get_gpt_system_prompt
 from agent.tools.mcp_tool_wrapper import MCPToolWrapper
 from agent.tools.task_list_tool import TaskListTool
 from agentpress.tool import SchemaType
+from agentpress.prompt_cache import prompt_cache, fingerprint
 from agent.tools.sb_sheets_tool import SandboxSheetsTool
 from agent.tools.sb_web_dev_tool import SandboxWebDevTool
 
@@ -236,32 +237,56 @@ class MCPManager:
 
 class PromptManager:
     @staticmethod
-    async def build_system_prompt(model_name: str, agent_config: Optional[dict], 
-                                  is_agent_builder: bool, thread_id: str, 
-                                  mcp_wrapper_instance: Optional[MCPToolWrapper]) -> dict:
-        
-        # Model-specific prompt selection
-        if "gemini-2.5-flash" in model_name.lower():
-            default_system_content = get_gemini_system_prompt()
-        elif any(gpt_model in model_name.lower() for gpt_model in ["o4-mini-high", "o4-mini", "gpt-5-mini", "gpt-oss-120b"]):
-            default_system_content = get_gpt_system_prompt()
-        else:
-            default_system_content = get_system_prompt()
-        
-        if "anthropic" not in model_name.lower():
-            sample_response_path = os.path.join(os.path.dirname(__file__), 'sample_responses/1.txt')
-            with open(sample_response_path, 'r') as file:
-                sample_response = file.read()
-            default_system_content = default_system_content + "\n\n <sample_assistant_response>" + sample_response + "</sample_assistant_response>"
-        
+    def _prompt_family(model_name: str) -> str:
+        model_lower = model_name.lower()
+        if "gemini-2.5-flash" in model_lower:
+            return "gemini"
+        if any(gpt_model in model_lower for gpt_model in ["o4-mini-high", "o4-mini", "gpt-5-mini", "gpt-oss-120b"]):
+            return "gpt"
+        return "default"
+
+    @staticmethod
+    def _list_mcp_tools(mcp_wrapper_instance: MCPToolWrapper) -> Optional[List[List[Any]]]:
+        """Name, description and parameter names of each MCP tool; None if they can't be listed."""
+        try:
+            tools = []
+            registered_schemas = mcp_wrapper_instance.get_schemas()
+            for method_name, schema_list in registered_schemas.items():
+                for schema in schema_list:
+                    if schema.schema_type == SchemaType.OPENAPI:
+                        func_info = schema.schema.get('function', {})
+                        description = func_info.get('description', 'No description available')
+                        props = func_info.get('parameters', {}).get('properties', {})
+                        tools.append([method_name, description, list(props.keys())])
+            return tools
+        except Exception as e:
+            logger.error(f"Error listing MCP tools: {e}")
+            return None
+
+    @staticmethod
+    def _build_static_prompt(prompt_family: str, with_sample_response: bool, is_agent_builder: bool,
+                             custom_prompt: Optional[str], mcp_tools: Optional[List[List[Any]]],
+                             with_mcp_info: bool) -> str:
         if is_agent_builder:
             system_content = get_agent_builder_prompt()
-        elif agent_config and agent_config.get('system_prompt'):
-            system_content = render_prompt_template(agent_config['system_prompt'].strip())
+        elif custom_prompt:
+            system_content = custom_prompt
         else:
-            system_content = default_system_content
-        
-        if agent_config and (agent_config.get('configured_mcps') or agent_config.get('custom_mcps')) and mcp_wrapper_instance and mcp_wrapper_instance._initialized:
+            # Model-specific prompt selection
+            if prompt_family == "gemini":
+                system_content = get_gemini_system_prompt()
+            elif prompt_family == "gpt":
+                system_content = get_gpt_system_prompt()
+            else:
+                system_content = get_system_prompt()
+
+            if with_sample_response:
+                sample_response_path = os.path.join(os.path.dirname(__file__), 'sample_responses/1.txt')
+                with open(sample_response_path, 'r') as file:
+                    sample_response = file.read()
+                system_content = system_content + "\n\n <sample_assistant_response>" + sample_response + "</sample_assistant_response>"
+
+        if with_mcp_info:
             mcp_info = "\n\n--- MCP Tools Available ---\n"
             mcp_info += "You have access to external MCP (Model Context Protocol) server tools.\n"
             mcp_info += "MCP tools can be called directly using their native function names in the standard function calling format:\n"
@@ -273,23 +298,13 @@ class PromptManager:
             mcp_info += '</function_calls>\n\n'
             
             mcp_info += "Available MCP tools:\n"
-            try:
-                registered_schemas = mcp_wrapper_instance.get_schemas()
-                for method_name, schema_list in registered_schemas.items():
-                    for schema in schema_list:
-                        if schema.schema_type == SchemaType.OPENAPI:
-                            func_info = schema.schema.get('function', {})
-                            description = func_info.get('description', 'No description available')
-                            mcp_info += f"- **{method_name}**: {description}\n"
-                            
-                            params = func_info.get('parameters', {})
-                            props = params.get('properties', {})
-                            if props:
-                                mcp_info += f"  Parameters: {', '.join(props.keys())}\n"
-                                
-            except Exception as e:
-                logger.error(f"Error listing MCP tools: {e}")
+            if mcp_tools is None:
                 mcp_info += "- Error loading MCP tool list\n"
+            else:
+                for method_name, description, param_names in mcp_tools:
+                    mcp_info += f"- **{method_name}**: {description}\n"
+                    if param_names:
+                        mcp_info += f"  Parameters: {', '.join(param_names)}\n"
             
             mcp_info += "\n🚨 CRITICAL MCP TOOL RESULT INSTRUCTIONS 🚨\n"
             mcp_info += "When you use ANY MCP (Model Context Protocol) tools:\n"
@@ -306,6 +321,46 @@ class PromptManager:
             
             system_content += mcp_info
 
+        return system_content
+
+    @staticmethod
+    async def build_system_prompt(model_name: str, agent_config: Optional[dict], 
+                                  is_agent_builder: bool, thread_id: str, 
+                                  mcp_wrapper_instance: Optional[MCPToolWrapper],
+                                  knowledge_query: Optional[str] = None) -> dict:
+        """Build the system message: the static prompt first, then the per-run date/time and knowledge base context.
+
+        The static part comes from `prompt_cache`, keyed by agent version, prompt
+        family, the (rendered) agent prompt and the MCP tool set, so runs with the
+        same inputs share a byte-identical prefix. For Anthropic models the two
+        parts are separate text blocks, which puts a cache breakpoint right after
+        the static part in `prepare_params`.
+        """
+        prompt_family = PromptManager._prompt_family(model_name)
+        model_lower = model_name.lower()
+        with_sample_response = "anthropic" not in model_lower
+
+        custom_prompt = None
+        if not is_agent_builder and agent_config and agent_config.get('system_prompt'):
+            custom_prompt = render_prompt_template(agent_config['system_prompt'].strip())
+
+        with_mcp_info = bool(agent_config and (agent_config.get('configured_mcps') or agent_config.get('custom_mcps')) and mcp_wrapper_instance and mcp_wrapper_instance._initialized)
+        mcp_tools = PromptManager._list_mcp_tools(mcp_wrapper_instance) if with_mcp_info else None
+
+        cache_key = fingerprint(
+            'system_prompt',
+            agent_config.get('current_version_id') if agent_config else None,
+            prompt_family, with_sample_response, is_agent_builder,
+            custom_prompt, with_mcp_info, mcp_tools,
+        )
+        static_content = prompt_cache.get_or_build(
+            cache_key,
+            lambda: PromptManager._build_static_prompt(
+                prompt_family, with_sample_response, is_agent_builder,
+                custom_prompt, mcp_tools, with_mcp_info
+            )
+        )
+
         now = datetime.datetime.now(datetime.timezone.utc)
         datetime_info = f"\n\n=== CURRENT DATE/TIME INFORMATION ===\n"
         datetime_info += f"Today's date: {now.strftime('%A, %B %d, %Y')}\n"
@@ -315,7 +370,7 @@ class PromptManager:
         datetime_info += f"Current day: {now.strftime('%A')}\n"
         datetime_info += "Use this information for any time-sensitive tasks, research, or when current date/time context is needed.\n"
         
-        system_content += datetime_info
+        system_content = datetime_info
 
         # Inject knowledge base context (both agent and thread-specific) if available
         if not is_agent_builder:
@@ -330,16 +385,36 @@ class PromptManager:
                     
                     agent_id = agent_config.get('agent_id') if agent_config else None
                     
-                    # Get combined knowledge base context (agent + thread) with token limit
-                    # Using 4000 tokens as default, but can be adjusted based on remaining context budget
-                    knowledge_context_result = await client.rpc('get_combined_knowledge_base_context', {
-                        'p_thread_id': thread_id,
-                        'p_agent_id': agent_id,
-                        'p_max_tokens': 4000
-                    }).execute()
+                    if await is_enabled("knowledge_base_retrieval"):
+                        # Only the agent knowledge base chunks most relevant to the latest user message
+                        # (half the budget), then thread knowledge with the remaining tokens
+                        from knowledge_base.retrieval import knowledge_base_retriever, estimate_tokens
+                        max_tokens = config.KNOWLEDGE_BASE_MAX_TOKENS
+                        context_parts = []
+                        if agent_id:
+                            agent_context = await knowledge_base_retriever.build_context(
+                                client, agent_id, knowledge_query, config.KNOWLEDGE_BASE_TOP_K, max_tokens // 2
+                            )
+                            if agent_context:
+                                context_parts.append(agent_context)
+                        thread_context_result = await client.rpc('get_knowledge_base_context', {
+                            'p_thread_id': thread_id,
+                            'p_max_tokens': max_tokens - sum(estimate_tokens(part) for part in context_parts)
+                        }).execute()
+                        if thread_context_result.data and thread_context_result.data.strip():
+                            context_parts.append(thread_context_result.data)
+                        knowledge_context = "\n\n".join(context_parts)
+                    else:
+                        # Get combined knowledge base context (agent + thread) with token limit
+                        # Using 4000 tokens as default, but can be adjusted based on remaining context budget
+                        knowledge_context_result = await client.rpc('get_combined_knowledge_base_context', {
+                            'p_thread_id': thread_id,
+                            'p_agent_id': agent_id,
+                            'p_max_tokens': 4000
+                        }).execute()
+                        knowledge_context = knowledge_context_result.data or ""
                     
-                    if knowledge_context_result.data and knowledge_context_result.data.strip():
-                        knowledge_context = knowledge_context_result.data
+                    if knowledge_context.strip():
                         system_content += f"\n\n{knowledge_context}"
                         
                         context_source = []
@@ -355,7 +430,13 @@ class PromptManager:
                 logger.error(f"Error injecting knowledge base context: {str(e)}")
                 # Continue without knowledge base context rather than failing
 
-        return {"role": "system", "content": system_content}
+        if "anthropic" in model_lower or "claude" in model_lower:
+            # Only the static block is a cache breakpoint; the per-run block after it changes every run
+            return {"role": "system", "content": [
+                {"type": "text", "text": static_content, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": system_content.lstrip()},
+            ]}
+        return {"role": "system", "content": static_content + system_content}
 
 
 class MessageManager:
@@ -439,6 +520,8 @@ class MessageManager:
 class AgentRunner:
     def __init__(self, config: AgentConfig):
         self.config = config
+        self.mcp_wrapper_instance: Optional[MCPToolWrapper] = None
+        self.thread_manager: Optional[ThreadManager] = None
     
     async def setup(self):
         if not self.config.trace:
@@ -519,24 +602,28 @@ class AgentRunner:
         await self.setup()
         await self.setup_tools()
         mcp_wrapper_instance = await self.setup_mcp_tools()
+        self.mcp_wrapper_instance = mcp_wrapper_instance
         
-        system_message = await PromptManager.build_system_prompt(
-            self.config.model_name, self.config.agent_config, 
-            self.config.is_agent_builder, self.config.thread_id, 
-            mcp_wrapper_instance
-        )
-
-        iteration_count = 0
-        continue_execution = True
-
+        latest_user_content = None
         latest_user_message = await self.client.table('messages').select('*').eq('thread_id', self.config.thread_id).eq('type', 'user').order('created_at', desc=True).limit(1).execute()
         if latest_user_message.data and len(latest_user_message.data) > 0:
             data = latest_user_message.data[0]['content']
             if isinstance(data, str):
                 data = json.loads(data)
+            latest_user_content = data.get('content')
             if self.config.trace:
                 self.config.trace.update(input=data['content'])
 
+        system_message = await PromptManager.build_system_prompt(
+            self.config.model_name, self.config.agent_config, 
+            self.config.is_agent_builder, self.config.thread_id, 
+            mcp_wrapper_instance,
+            knowledge_query=latest_user_content if isinstance(latest_user_content, str) else None
+        )
+
+        iteration_count = 0
+        continue_execution = True
+
         message_manager = MessageManager(self.client, self.config.thread_id, self.config.model_name, self.config.trace)
 
         while continue_execution and iteration_count < self.config.max_iterations:
@@ -736,5 +823,14 @@ async def run_agent(
     )
     
     runner = AgentRunner(config)
-    async for chunk in runner.run():
-        yield chunk
\ No newline at end of file
+    try:
+        async for chunk in runner.run():
+            yield chunk
+    finally:
+        if runner.thread_manager:
+            try:
+                await runner.thread_manager.message_writer.flush()
+            except Exception as e:
+                logger.error(f"Failed to store messages of thread {thread_id}: {str(e)}")
+        if runner.mcp_wrapper_instance:
+            await runner.mcp_wrapper_instance.cleanup()
\ No newline at end of file
@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from datetime import datetime, timezone
 from services.supabase import DBConnection
 from utils.logger import logger
+from utils.auth_utils import invalidate_ownership_cache
 
 
 @dataclass
@@ -271,6 +272,7 @@ class SunaAgentRepository:
                 # Continue with agent deletion even if trigger cleanup fails
             
             result = await client.table('agents').delete().eq('agent_id', agent_id).execute()
+            await invalidate_ownership_cache("agent", agent_id)
             return bool(result.data)
             
         except Exception as e:
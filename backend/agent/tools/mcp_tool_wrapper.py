@@ -328,6 +328,8 @@ class MCPToolWrapper(Tool):
         return await self.tool_executor.execute_tool(tool_name, arguments)
     
     async def cleanup(self):
+        if self.tool_executor:
+            self.tool_executor.release_sessions()
         if self._initialized:
             try:
                 await self.mcp_manager.disconnect_all()
@@ -2,12 +2,16 @@ from typing import Optional
 from agentpress.tool import ToolResult, openapi_schema, usage_example
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
-import httpx
+from agent.tools.utils.image_pipeline import fetch_image
 from io import BytesIO
+import asyncio
 import uuid
 from litellm import aimage_generation, aimage_edit
 import base64
 
+# Upper bound for images to edit; the images API accepts up to 25MB
+MAX_IMAGE_SIZE = 25 * 1024 * 1024
+
 
 class SandboxImageEditTool(SandboxToolsBase):
     """Tool for generating or editing images using OpenAI GPT Image 1 via OpenAI SDK (no mask support)."""
@@ -133,12 +137,10 @@ class SandboxImageEditTool(SandboxToolsBase):
     async def _download_image_from_url(self, url: str) -> bytes | ToolResult:
         """Download image from URL."""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                return response.content
-        except Exception:
-            return self.fail_response(f"Could not download image from URL: {url}")
+            image_bytes, _ = await fetch_image(url, max_bytes=MAX_IMAGE_SIZE, timeout=30.0)
+            return image_bytes
+        except Exception as e:
+            return self.fail_response(f"Could not download image from URL: {url} - {str(e)}")
 
     async def _read_image_from_sandbox(self, image_path: str) -> bytes | ToolResult:
         """Read image from sandbox filesystem."""
@@ -152,6 +154,10 @@ class SandboxImageEditTool(SandboxToolsBase):
                 return self.fail_response(
                     f"Path '{cleaned_path}' is a directory, not an image file."
                 )
+            if file_info.size > MAX_IMAGE_SIZE:
+                return self.fail_response(
+                    f"Image file '{cleaned_path}' is too large ({file_info.size / (1024 * 1024):.2f}MB). Maximum size is {MAX_IMAGE_SIZE / (1024 * 1024):.0f}MB."
+                )
 
             return await self.sandbox.fs.download_file(full_path)
 
@@ -165,7 +171,7 @@ class SandboxImageEditTool(SandboxToolsBase):
         try:
             original_b64_str = response.data[0].b64_json
             # Decode base64 image data
-            image_data = base64.b64decode(original_b64_str)
+            image_data = await asyncio.to_thread(base64.b64decode, original_b64_str)
 
             # Generate random filename
             random_filename = f"generated_image_{uuid.uuid4().hex[:8]}.png"
@@ -12,15 +12,15 @@ from pptx.util import Inches, Pt
 from pptx.dml.color import RGBColor
 from pptx.enum.text import PP_ALIGN, MSO_ANCHOR
 from pptx.enum.shapes import MSO_SHAPE
-import tempfile
-import os
 
 import hashlib
-from PIL import Image
 import re
 import asyncio
 import random
-import httpx
+from agent.tools.utils.image_pipeline import ImageTooLargeError, convert_to_jpeg, fetch_image
+
+# Slide images are fetched with this limit; larger downloads are skipped
+MAX_IMAGE_SIZE = 20 * 1024 * 1024
 
 
 class SandboxPresentationToolV2(SandboxToolsBase):
@@ -74,10 +74,10 @@ class SandboxPresentationToolV2(SandboxToolsBase):
             # Try to download the image
             headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
             try:
-                async with httpx.AsyncClient(follow_redirects=True, timeout=20.0) as client:
-                    resp = await client.get(download_url, headers=headers)
-                    resp.raise_for_status()
-                    image_data = resp.content
+                image_data, _ = await fetch_image(download_url, max_bytes=MAX_IMAGE_SIZE, timeout=20.0, headers=headers)
+            except ImageTooLargeError as e:
+                print(f"Skipping image {download_url}: {e}")
+                return None
             except Exception as e:
                 # Fallback to curl if httpx fails
                 try:
@@ -99,21 +99,7 @@ class SandboxPresentationToolV2(SandboxToolsBase):
             
             # Process and save the image
             try:
-                img = Image.open(io.BytesIO(image_data))
-                output = io.BytesIO()
-                
-                # Convert to RGB if necessary
-                if img.mode in ("RGBA", "LA", "P"):
-                    background = Image.new("RGB", img.size, (255, 255, 255))
-                    if img.mode == "P":
-                        img = img.convert("RGBA")
-                    background.paste(img, mask=img.split()[-1] if img.mode in ("RGBA", "LA") else None)
-                    img = background
-                else:
-                    img = img.convert("RGB")
-                
-                img.save(output, format="JPEG", quality=90)
-                image_data = output.getvalue()
+                image_data = await convert_to_jpeg(image_data, quality=90)
                 filename = f"img_{url_hash}.jpg"
             except Exception:
                 # If image processing fails, save as-is
@@ -1450,9 +1436,9 @@ class SandboxPresentationToolV2(SandboxToolsBase):
                 self._add_blank_slide(prs, colors)
         
         output = io.BytesIO()
-        prs.save(output)
-        output.seek(0)
-        return output.read()
+        # Zipping the package is CPU-bound; keep it off the event loop
+        await asyncio.to_thread(prs.save, output)
+        return output.getvalue()
     
     def _add_title_slide(self, prs, content: Dict, colors: Dict):
         slide_layout = prs.slide_layouts[0]
@@ -1631,27 +1617,21 @@ class SandboxPresentationToolV2(SandboxToolsBase):
             
             image_data = await self.sandbox.fs.download_file(full_path)
             
-            ext = image_path.split('.')[-1] if '.' in image_path else 'jpg'
-            with tempfile.NamedTemporaryFile(suffix=f'.{ext}', delete=False) as tmp_img:
-                tmp_img.write(image_data)
-                tmp_img.flush()
-                
-                try:
-                    if width and height:
-                        pic = slide.shapes.add_picture(tmp_img.name, left, top, width, height)
-                    elif width:
-                        pic = slide.shapes.add_picture(tmp_img.name, left, top, width=width)
-                    elif height:
-                        pic = slide.shapes.add_picture(tmp_img.name, left, top, height=height)
-                    else:
-                        pic = slide.shapes.add_picture(tmp_img.name, left, top)
-                    
-                    os.unlink(tmp_img.name)
-                    return pic
-                except Exception as e:
-                    os.unlink(tmp_img.name)
-                    print(f"Failed to add picture to slide: {e}")
-                    return None
+            # python-pptx reads pictures from file-like objects; no temp file needed
+            try:
+                image_stream = io.BytesIO(image_data)
+                if width and height:
+                    pic = slide.shapes.add_picture(image_stream, left, top, width, height)
+                elif width:
+                    pic = slide.shapes.add_picture(image_stream, left, top, width=width)
+                elif height:
+                    pic = slide.shapes.add_picture(image_stream, left, top, height=height)
+                else:
+                    pic = slide.shapes.add_picture(image_stream, left, top)
+                return pic
+            except Exception as e:
+                print(f"Failed to add picture to slide: {e}")
+                return None
                 
         except Exception as e:
             print(f"Failed to add image to slide: {e}")
@@ -3,13 +3,15 @@ from __future__ import annotations
 import csv
 import io
 import json
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from io import BytesIO
-from statistics import mean
 from typing import Any, Dict, List, Optional, Tuple
 
 import chardet
+import numpy as np
 from agentpress.tool import ToolResult, openapi_schema, usage_example
+from agent.tools.utils.columnar_sheet import AGGREGATIONS, FILTER_OPERATORS, ColumnarSheet
 from sandbox.tool_base import SandboxToolsBase
 from utils.logger import logger
 
@@ -23,15 +25,41 @@ except Exception:
     openpyxl = None
 
 
+# Parsed files kept per tool instance, i.e. for the duration of an agent run. Parsed
+# rows and especially openpyxl workbooks take many times the file size in memory, so
+# the cache is also bounded by the total source size, and only small files keep their
+# workbook (larger ones keep just the parsed sheets).
+SHEET_CACHE_MAX_FILES = 8
+SHEET_CACHE_MAX_BYTES = 32 * 1024 * 1024
+SHEET_CACHE_MAX_WORKBOOK_BYTES = 2 * 1024 * 1024
+
+
 @dataclass
 class SheetData:
     headers: List[str]
     rows: List[List[Any]]
 
 
+@dataclass
+class _CachedSheetFile:
+    """Parsed state of a sandbox file, valid while its (mod_time, size) matches `signature`."""
+    signature: Tuple[Any, Any]
+    sheets: Dict[Optional[str], SheetData] = field(default_factory=dict)
+    workbook: Any = None
+
+    @property
+    def size(self) -> Optional[int]:
+        size = self.signature[1]
+        return size if isinstance(size, int) else None
+
+
 class SandboxSheetsTool(SandboxToolsBase):
     def __init__(self, project_id: str, thread_manager):
         super().__init__(project_id, thread_manager)
+        # Saves the download and parse when a run works on the same file repeatedly
+        # (view -> analyze -> format -> visualize). Entries are checked against the
+        # file's mod_time and size before use, so edits by other tools invalidate them.
+        self._sheet_cache: "OrderedDict[str, _CachedSheetFile]" = OrderedDict()
 
     async def _file_exists(self, full_path: str) -> bool:
         try:
@@ -44,9 +72,63 @@ class SandboxSheetsTool(SandboxToolsBase):
         return await self.sandbox.fs.download_file(full_path)
 
     async def _upload_bytes(self, full_path: str, data: bytes, permissions: str = "644") -> None:
+        self._sheet_cache.pop(full_path, None)
         await self.sandbox.fs.upload_file(data, full_path)
         await self.sandbox.fs.set_file_permissions(full_path, permissions)
 
+    async def _file_signature(self, full_path: str) -> Optional[Tuple[Any, Any]]:
+        try:
+            info = await self.sandbox.fs.get_file_info(full_path)
+        except Exception:
+            return None
+        return (getattr(info, "mod_time", None), getattr(info, "size", None))
+
+    async def _cached_file(self, full_path: str) -> Optional[_CachedSheetFile]:
+        entry = self._sheet_cache.get(full_path)
+        if entry is None:
+            return None
+        if await self._file_signature(full_path) != entry.signature:
+            logger.debug(f"Sheet cache entry for {full_path} is stale")
+            self._sheet_cache.pop(full_path, None)
+            return None
+        self._sheet_cache.move_to_end(full_path)
+        return entry
+
+    def _cache_file(self, full_path: str, entry: _CachedSheetFile) -> None:
+        if entry.signature[0] is None and entry.signature[1] is None:
+            return
+        if entry.size is None or entry.size > SHEET_CACHE_MAX_BYTES:
+            self._sheet_cache.pop(full_path, None)
+            return
+        if entry.size > SHEET_CACHE_MAX_WORKBOOK_BYTES:
+            entry.workbook = None
+        self._sheet_cache[full_path] = entry
+        self._sheet_cache.move_to_end(full_path)
+        while len(self._sheet_cache) > SHEET_CACHE_MAX_FILES or sum(e.size for e in self._sheet_cache.values()) > SHEET_CACHE_MAX_BYTES:
+            self._sheet_cache.popitem(last=False)
+
+    async def _remember_written(self, full_path: str, sheet: Optional[SheetData] = None, workbook: Any = None) -> None:
+        """Cache the state just uploaded to `full_path`, so the next operation on it needs no download."""
+        signature = await self._file_signature(full_path)
+        if signature is None:
+            return
+        entry = _CachedSheetFile(signature=signature, workbook=workbook)
+        if sheet is not None:
+            entry.sheets[None] = sheet
+        self._cache_file(full_path, entry)
+
+    async def _take_workbook(self, full_path: str) -> Any:
+        """Parsed workbook of an XLSX file for in-place edits.
+
+        The cache entry is dropped, since the edits make it differ from the file;
+        callers put the workbook back with `_remember_written` once it is saved.
+        """
+        entry = await self._cached_file(full_path)
+        self._sheet_cache.pop(full_path, None)
+        if entry is not None and entry.workbook is not None:
+            return entry.workbook
+        return openpyxl.load_workbook(BytesIO(await self._download_bytes(full_path)))
+
     def _detect_encoding(self, data: bytes) -> str:
         try:
             result = chardet.detect(data)
@@ -78,6 +160,9 @@ class SandboxSheetsTool(SandboxToolsBase):
         if not openpyxl:
             raise RuntimeError("openpyxl not available; cannot read XLSX")
         wb = openpyxl.load_workbook(BytesIO(data), data_only=False)
+        return self._sheet_from_workbook(wb, sheet_name)
+
+    def _sheet_from_workbook(self, wb: Any, sheet_name: Optional[str]) -> SheetData:
         ws = wb[sheet_name] if sheet_name else wb.active
         rows = [list(row) for row in ws.iter_rows(values_only=True)]
         if not rows:
@@ -102,20 +187,41 @@ class SandboxSheetsTool(SandboxToolsBase):
         return out.getvalue()
 
     async def _load_sheet(self, file_path: str, sheet_name: Optional[str]) -> Tuple[str, SheetData]:
+        """Read a sheet, from the run's cache when the file hasn't changed. Callers must not modify the result."""
         file_path = self.clean_path(file_path)
         full_path = f"{self.workspace_path}/{file_path}"
+        is_csv = file_path.lower().endswith(".csv")
+        if not is_csv and not file_path.lower().endswith(".xlsx"):
+            raise ValueError("Unsupported file extension. Use .csv or .xlsx")
+        key = None if is_csv else sheet_name
+
+        entry = await self._cached_file(full_path)
+        if entry is not None:
+            if key in entry.sheets:
+                return full_path, entry.sheets[key]
+            if entry.workbook is not None:
+                sheet = entry.sheets[key] = self._sheet_from_workbook(entry.workbook, sheet_name)
+                return full_path, sheet
+
+        signature = await self._file_signature(full_path)
         data = await self._download_bytes(full_path)
-        if file_path.lower().endswith(".csv"):
-            return full_path, self._read_csv_bytes(data)
-        if file_path.lower().endswith(".xlsx"):
-            return full_path, self._read_xlsx_bytes(data, sheet_name)
-        raise ValueError("Unsupported file extension. Use .csv or .xlsx")
+        if is_csv:
+            sheet = self._read_csv_bytes(data)
+            self._cache_file(full_path, _CachedSheetFile(signature=signature or (None, None), sheets={key: sheet}))
+        else:
+            if not openpyxl:
+                raise RuntimeError("openpyxl not available; cannot read XLSX")
+            wb = openpyxl.load_workbook(BytesIO(data), data_only=False)
+            sheet = self._sheet_from_workbook(wb, sheet_name)
+            self._cache_file(full_path, _CachedSheetFile(signature=signature or (None, None), sheets={key: sheet}, workbook=wb))
+        return full_path, sheet
 
     async def _save_sheet(self, file_path: str, sheet: SheetData, sheet_name: Optional[str]) -> str:
         file_path = self.clean_path(file_path)
         full_path = f"{self.workspace_path}/{file_path}"
         if file_path.lower().endswith(".csv"):
             await self._upload_bytes(full_path, self._write_csv_bytes(sheet))
+            await self._remember_written(full_path, sheet=sheet)
         elif file_path.lower().endswith(".xlsx"):
             await self._upload_bytes(full_path, self._write_xlsx_bytes(sheet, sheet_name))
             try:
@@ -161,6 +267,25 @@ class SandboxSheetsTool(SandboxToolsBase):
     def _to_index_map(self, headers: List[str]) -> Dict[str, int]:
         return {h: i for i, h in enumerate(headers)}
 
+    @staticmethod
+    def _runs(indices: List[int]) -> List[Tuple[int, int]]:
+        """Sorted indices as (first, last) runs of consecutive values."""
+        runs: List[Tuple[int, int]] = []
+        for i in indices:
+            if runs and runs[-1][1] == i - 1:
+                runs[-1] = (runs[-1][0], i)
+            else:
+                runs.append((i, i))
+        return runs
+
+    def _matching_rows(self, headers: List[str], rows: List[List[Any]], where: Dict[str, Any]) -> List[int]:
+        """Indices of the data rows matching an update/delete_rows_where filter."""
+        column = where.get("column")
+        if not column or column not in headers:
+            raise ValueError(f"Filter column '{column}' not found")
+        mask = ColumnarSheet(headers, rows).where(column, where.get("operator", "=="), where.get("value"))
+        return np.flatnonzero(mask).tolist()
+
     @openapi_schema({
         "type": "function",
         "function": {
@@ -177,13 +302,24 @@ class SandboxSheetsTool(SandboxToolsBase):
                             "type": "object",
                             "properties": {
                                 "type": {"type": "string", "enum": [
-                                    "update_cell", "update_row", "insert_row", "delete_row", "insert_column", "delete_column"
+                                    "update_cell", "update_row", "insert_row", "delete_row", "insert_column", "delete_column",
+                                    "update_rows_where", "delete_rows_where"
                                 ]},
                                 "row_index": {"type": "integer"},
                                 "column": {"type": "string"},
                                 "column_index": {"type": "integer"},
                                 "values": {"type": "array", "items": {"type": "string"}},
-                                "value": {"type": "string"}
+                                "value": {"type": "string"},
+                                "where": {
+                                    "type": "object",
+                                    "description": "Row filter for update_rows_where (sets column to value) and delete_rows_where",
+                                    "properties": {
+                                        "column": {"type": "string"},
+                                        "operator": {"type": "string", "enum": list(FILTER_OPERATORS), "default": "=="},
+                                        "value": {"type": "string"}
+                                    },
+                                    "required": ["column"]
+                                }
                             },
                             "required": ["type"]
                         }
@@ -217,8 +353,7 @@ class SandboxSheetsTool(SandboxToolsBase):
                 if not openpyxl:
                     return self.fail_response("openpyxl not available to update .xlsx")
 
-                data = await self._download_bytes(full_path)
-                wb = openpyxl.load_workbook(BytesIO(data))
+                wb = await self._take_workbook(full_path)
                 ws = wb[sheet_name] if sheet_name and sheet_name in wb.sheetnames else wb.active
 
                 header_map: Dict[str, int] = {}
@@ -307,12 +442,33 @@ class SandboxSheetsTool(SandboxToolsBase):
                                 hv = ws.cell(row=1, column=ci).value
                                 if hv is not None:
                                     header_map[str(hv)] = ci
+                    elif t in ("update_rows_where", "delete_rows_where"):
+                        max_col = ws.max_column or 0
+                        ws_headers = ["" if hv is None else str(hv) for hv in (ws.cell(row=1, column=c).value for c in range(1, max_col + 1))]
+                        ws_rows = [list(r) for r in ws.iter_rows(min_row=2, max_col=max_col, values_only=True)]
+                        try:
+                            matches = self._matching_rows(ws_headers, ws_rows, op.get("where") or {})
+                        except ValueError as e:
+                            return self.fail_response(f"{t}: {e}")
+                        if t == "delete_rows_where":
+                            # Delete runs of adjacent rows bottom-up so earlier indices stay valid
+                            for start, end in reversed(self._runs(matches)):
+                                ws.delete_rows(start + 2, end - start + 1)
+                        else:
+                            c = resolve_col_index(op)
+                            if c is None:
+                                return self.fail_response("update_rows_where requires column/column_index to set")
+                            val = op.get("value")
+                            for i in matches:
+                                ws.cell(row=i + 2, column=c).value = val
                     else:
                         return self.fail_response(f"Unsupported operation type: {t}")
 
                 out = BytesIO()
                 wb.save(out)
-                await self._upload_bytes(full_path if not save_as else f"{self.workspace_path}/{self.clean_path(save_as)}", out.getvalue())
+                target_full = full_path if not save_as else f"{self.workspace_path}/{self.clean_path(save_as)}"
+                await self._upload_bytes(target_full, out.getvalue())
+                await self._remember_written(target_full, workbook=wb)
                 try:
                     csv_full = f"{(full_path if not save_as else f'{self.workspace_path}/{self.clean_path(save_as)}').rsplit('.', 1)[0]}.csv"
                     from csv import writer as csv_writer
@@ -327,7 +483,9 @@ class SandboxSheetsTool(SandboxToolsBase):
                 saved_path = (save_as or file_path)
                 return self.success_response({"updated": f"{self.workspace_path}/{self.clean_path(saved_path)}", "headers": [ws.cell(row=1, column=c).value for c in range(1, (ws.max_column or 0)+1)], "row_count": ws.max_row})
 
-            full_path, sheet = await self._load_sheet(file_path, sheet_name)
+            full_path, cached_sheet = await self._load_sheet(file_path, sheet_name)
+            # Edit a copy; the loaded sheet may be shared through the cache
+            sheet = SheetData(headers=cached_sheet.headers, rows=[list(r) for r in cached_sheet.rows])
 
             headers = sheet.headers[:] or []
             index_map = self._to_index_map(headers) if headers else {}
@@ -418,6 +576,23 @@ class SandboxSheetsTool(SandboxToolsBase):
                         if c_idx < len(row):
                             row.pop(c_idx)
                     index_map = self._to_index_map(headers)
+                elif t in ("update_rows_where", "delete_rows_where"):
+                    try:
+                        matches = self._matching_rows(headers, sheet.rows, op.get("where") or {})
+                    except ValueError as e:
+                        return self.fail_response(f"{t}: {e}")
+                    if t == "delete_rows_where":
+                        drop = set(matches)
+                        sheet.rows = [row for i, row in enumerate(sheet.rows) if i not in drop]
+                    else:
+                        c_idx = resolve_col(op)
+                        if c_idx is None:
+                            return self.fail_response("update_rows_where requires column/column_index to set")
+                        for i in matches:
+                            row = sheet.rows[i]
+                            if c_idx >= len(row):
+                                row.extend([None] * (c_idx - len(row) + 1))
+                            row[c_idx] = op.get("value")
                 else:
                     return self.fail_response(f"Unsupported operation type: {t}")
 
@@ -572,88 +747,31 @@ class SandboxSheetsTool(SandboxToolsBase):
             headers = sheet.headers
             idx_map = self._to_index_map(headers)
 
-            def to_float(v: Any) -> Optional[float]:
-                if v is None:
-                    return None
-                if isinstance(v, (int, float)):
-                    return float(v)
-                try:
-                    return float(str(v).strip())
-                except Exception:
-                    return None
-
             numeric_cols = [c for c in (target_columns or headers) if c in idx_map]
+            aggs = aggregations or list(AGGREGATIONS)
+            unknown = [agg for agg in aggs if agg not in AGGREGATIONS]
+            if unknown:
+                return self.fail_response(f"Unsupported aggregations: {', '.join(unknown)}")
+
+            table = ColumnarSheet(headers, sheet.rows)
             if group_by and group_by in idx_map:
-                g_idx = idx_map[group_by]
-                groups: Dict[Any, List[List[Any]]] = {}
-                for row in sheet.rows:
-                    key = row[g_idx] if len(row) > g_idx else None
-                    groups.setdefault(key, []).append(row)
+                keys, grouped = table.group_by(group_by, numeric_cols, aggs)
                 out_headers = [group_by]
-                aggs = aggregations or ["count", "sum", "avg", "min", "max"]
                 for col in numeric_cols:
                     for agg in aggs:
                         out_headers.append(f"{col}_{agg}")
                 summary_rows: List[List[Any]] = []
-                for key, rows in groups.items():
+                for g, key in enumerate(keys):
                     row_out = [key]
                     for col in numeric_cols:
-                        c_idx = idx_map[col]
-                        vals = [to_float(r[c_idx]) for r in rows if len(r) > c_idx]
-                        vals = [v for v in vals if v is not None]
-                        count_v = len(vals)
-                        sum_v = sum(vals) if vals else None
-                        avg_v = mean(vals) if vals else None
-                        min_v = min(vals) if vals else None
-                        max_v = max(vals) if vals else None
                         for agg in aggs:
-                            row_out.append({
-                                "count": count_v,
-                                "sum": sum_v,
-                                "avg": avg_v,
-                                "min": min_v,
-                                "max": max_v
-                            }[agg])
+                            row_out.append(grouped[col][agg][g])
                     summary_rows.append(row_out)
                 result_sheet = SheetData(headers=out_headers, rows=summary_rows)
             else:
                 out_headers = ["metric"] + numeric_cols
-                rows_out: List[List[Any]] = []
-                counts = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    counts.append(len(vals))
-                rows_out.append(["count", *counts])
-                sums = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    sums.append(sum(vals) if vals else None)
-                rows_out.append(["sum", *sums])
-                avgs = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    avgs.append(mean(vals) if vals else None)
-                rows_out.append(["avg", *avgs])
-                mins = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    mins.append(min(vals) if vals else None)
-                rows_out.append(["min", *mins])
-                maxs = []
-                for col in numeric_cols:
-                    c_idx = idx_map[col]
-                    vals = [to_float(r[c_idx]) for r in sheet.rows if len(r) > c_idx]
-                    vals = [v for v in vals if v is not None]
-                    maxs.append(max(vals) if vals else None)
-                rows_out.append(["max", *maxs])
+                stats = table.aggregate(numeric_cols)
+                rows_out = [[agg, *(stats[col][agg] for col in numeric_cols)] for agg in AGGREGATIONS]
                 result_sheet = SheetData(headers=out_headers, rows=rows_out)
 
             exported = None
@@ -727,12 +845,22 @@ class SandboxSheetsTool(SandboxToolsBase):
             if not openpyxl:
                 return self.fail_response("openpyxl not available to build charts")
 
+            table = ColumnarSheet(headers, sheet.rows)
+            x_idx = idx_map[x_column]
+            y_idx_list = [idx_map[y] for y in y_columns]
+            # Chart series need numbers; CSV cells are strings, so write the parsed values
+            y_parsed = [(yi, table.column_at(yi).numbers.tolist(), table.column_at(yi).valid.tolist()) for yi in y_idx_list]
+
             wb = Workbook()
             ws = wb.active
             ws.title = sheet_name or "Data"
             if headers:
                 ws.append(headers)
-            for r in sheet.rows:
+            for i, r in enumerate(sheet.rows):
+                r = list(r)
+                for yi, numbers, valid in y_parsed:
+                    if yi < len(r) and valid[i]:
+                        r[yi] = numbers[i]
                 ws.append(r)
 
             if chart_type == "bar":
@@ -768,23 +896,13 @@ class SandboxSheetsTool(SandboxToolsBase):
             out = BytesIO()
             wb.save(out)
             await self._upload_bytes(target_full, out.getvalue())
+            await self._remember_written(target_full, workbook=wb)
 
             dataset_headers = [x_column] + y_columns
-            dataset_rows: List[List[Any]] = []
-            x_idx = idx_map[x_column]
-            y_idx_list = [idx_map[y] for y in y_columns]
-            for row in sheet.rows:
-                if len(row) <= x_idx:
-                    continue
-                vals = [row[x_idx]]
-                ok = True
-                for yi in y_idx_list:
-                    if len(row) <= yi:
-                        ok = False
-                        break
-                    vals.append(row[yi])
-                if ok:
-                    dataset_rows.append(vals)
+            complete = table.rows_with_columns([x_idx, *y_idx_list])
+            dataset_rows: List[List[Any]] = [
+                list(values) for values in zip(*(table.column_at(i).values[complete].tolist() for i in [x_idx, *y_idx_list]))
+            ]
 
             csv_rel = None
             if export_csv_path:
@@ -848,10 +966,9 @@ class SandboxSheetsTool(SandboxToolsBase):
             full = f"{self.workspace_path}/{rel}"
             if not rel.lower().endswith(".xlsx"):
                 return self.fail_response("format_sheet only supports .xlsx")
-            data = await self._download_bytes(full)
             if not openpyxl:
                 return self.fail_response("openpyxl not available")
-            wb = openpyxl.load_workbook(BytesIO(data))
+            wb = await self._take_workbook(full)
             ws = wb[sheet_name] if sheet_name else wb.active
 
             max_col = ws.max_column
@@ -894,6 +1011,7 @@ class SandboxSheetsTool(SandboxToolsBase):
             out = BytesIO()
             wb.save(out)
             await self._upload_bytes(full, out.getvalue())
+            await self._remember_written(full, workbook=wb)
             return self.success_response({"formatted": full, "sheet": ws.title})
         except Exception as e:
             logger.exception("format_sheet failed")
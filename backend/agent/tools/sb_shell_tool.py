@@ -1,11 +1,17 @@
 import asyncio
 from typing import Optional, Dict, Any
 import time
-import asyncio
 from uuid import uuid4
 from agentpress.tool import ToolResult, openapi_schema, usage_example
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
+from utils.logger import logger
+
+# Exit-code polling interval for blocking commands, growing by BLOCKING_POLL_BACKOFF per poll
+BLOCKING_POLL_MIN = 0.2
+BLOCKING_POLL_MAX = 2.0
+BLOCKING_POLL_BACKOFF = 1.5
+BLOCKING_OUTPUT_MAX_CHARS = 100_000
 
 class SandboxShellTool(SandboxToolsBase):
     """Tool for executing tasks in a Daytona sandbox with browser-use capabilities. 
@@ -56,11 +62,11 @@ class SandboxShellTool(SandboxToolsBase):
                     },
                     "session_name": {
                         "type": "string",
-                        "description": "Optional name of the tmux session to use. Use named sessions for related commands that need to maintain state. Defaults to a random session name.",
+                        "description": "Optional name of the tmux session to use for non-blocking commands. Use named sessions for related commands that need to maintain state. Defaults to a random session name. Ignored for blocking commands.",
                     },
                     "blocking": {
                         "type": "boolean",
-                        "description": "Whether to wait for the command to complete. Defaults to false for non-blocking execution.",
+                        "description": "Whether to wait for the command to complete. Defaults to false for non-blocking execution. Blocking commands run in a fresh shell, not in a tmux session, so environment variables, activated virtualenvs and directory changes from earlier commands do not apply.",
                         "default": False
                     },
                     "timeout": {
@@ -117,10 +123,20 @@ class SandboxShellTool(SandboxToolsBase):
                 folder = folder.strip('/')
                 cwd = f"{self.workspace_path}/{folder}"
             
+            if blocking:
+                # Runs in a fresh shell of its own, not in a tmux session
+                result = await self._execute_blocking(f"cd {cwd} && {command}", timeout)
+                return self.success_response({
+                    "output": result["output"],
+                    "exit_code": result["exit_code"],
+                    "cwd": cwd,
+                    "completed": result["completed"]
+                })
+
             # Generate a session name if not provided
             if not session_name:
                 session_name = f"session_{str(uuid4())[:8]}"
-            
+
             # Check if tmux session already exists
             check_session = await self._execute_raw_command(f"tmux has-session -t {session_name} 2>/dev/null || echo 'not_exists'")
             session_exists = "not_exists" not in check_session.get("output", "")
@@ -133,71 +149,66 @@ class SandboxShellTool(SandboxToolsBase):
             full_command = f"cd {cwd} && {command}"
             wrapped_command = full_command.replace('"', '\\"')  # Escape double quotes
             
-            if blocking:
-                # For blocking execution, use a more reliable approach
-                # Add a unique marker to detect command completion
-                marker = f"COMMAND_DONE_{str(uuid4())[:8]}"
-                completion_command = f"{command} ; echo {marker}"
-                wrapped_completion_command = completion_command.replace('"', '\\"')
-                
-                # Send the command with completion marker
-                await self._execute_raw_command(f'tmux send-keys -t {session_name} "cd {cwd} && {wrapped_completion_command}" Enter')
-                
-                start_time = time.time()
-                final_output = ""
-                
-                while (time.time() - start_time) < timeout:
-                    # Wait a shorter interval for more responsive checking
-                    await asyncio.sleep(0.5)
-                    
-                    # Check if session still exists (command might have exited)
-                    check_result = await self._execute_raw_command(f"tmux has-session -t {session_name} 2>/dev/null || echo 'ended'")
-                    if "ended" in check_result.get("output", ""):
-                        break
-                        
-                    # Get current output and check for our completion marker
-                    output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-                    current_output = output_result.get("output", "")
-
-                    if self._is_command_completed(current_output, marker):
-                        final_output = current_output
-                        break
-                
-                # If we didn't get the marker, capture whatever output we have
-                if not final_output:
-                    output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-                    final_output = output_result.get("output", "")
-                
-                # Kill the session after capture
-                await self._execute_raw_command(f"tmux kill-session -t {session_name}")
-                
-                return self.success_response({
-                    "output": final_output,
-                    "session_name": session_name,
-                    "cwd": cwd,
-                    "completed": True
-                })
-            else:
-                # Send command to tmux session for non-blocking execution
-                await self._execute_raw_command(f'tmux send-keys -t {session_name} "{wrapped_command}" Enter')
-                
-                # For non-blocking, just return immediately
-                return self.success_response({
-                    "session_name": session_name,
-                    "cwd": cwd,
-                    "message": f"Command sent to tmux session '{session_name}'. Use check_command_output to view results.",
-                    "completed": False
-                })
+            # Send command to tmux session for non-blocking execution
+            await self._execute_raw_command(f'tmux send-keys -t {session_name} "{wrapped_command}" Enter')
+            
+            # For non-blocking, just return immediately
+            return self.success_response({
+                "session_name": session_name,
+                "cwd": cwd,
+                "message": f"Command sent to tmux session '{session_name}'. Use check_command_output to view results.",
+                "completed": False
+            })
                 
         except Exception as e:
             # Attempt to clean up session in case of error
-            if session_name:
+            if session_name and not blocking:
                 try:
                     await self._execute_raw_command(f"tmux kill-session -t {session_name}")
                 except:
                     pass
             return self.fail_response(f"Error executing command: {str(e)}")
 
+    async def _execute_blocking(self, command: str, timeout: int) -> Dict[str, Any]:
+        """Run a command to completion in its own Daytona session.
+
+        The command runs asynchronously and only its exit code is polled, with
+        a backoff growing from BLOCKING_POLL_MIN to BLOCKING_POLL_MAX seconds, so
+        the call returns as soon as the process exits. Logs are fetched once at
+        the end. On timeout the session is deleted, which stops the command.
+        """
+        from daytona_sdk import SessionExecuteRequest
+        session_id = f"blocking-{uuid4()}"
+        await self.sandbox.process.create_session(session_id)
+        try:
+            response = await self.sandbox.process.execute_session_command(
+                session_id=session_id,
+                req=SessionExecuteRequest(command=command, var_async=True, cwd=self.workspace_path)
+            )
+            command_id = response.cmd_id
+
+            deadline = time.monotonic() + timeout
+            delay = BLOCKING_POLL_MIN
+            exit_code = None
+            while True:
+                status = await self.sandbox.process.get_session_command(session_id, command_id)
+                exit_code = status.exit_code
+                remaining = deadline - time.monotonic()
+                if exit_code is not None or remaining <= 0:
+                    break
+                await asyncio.sleep(min(delay, remaining))
+                delay = min(delay * BLOCKING_POLL_BACKOFF, BLOCKING_POLL_MAX)
+
+            output = await self.sandbox.process.get_session_command_logs(session_id, command_id) or ""
+            if len(output) > BLOCKING_OUTPUT_MAX_CHARS:
+                output = f"[... output truncated to last {BLOCKING_OUTPUT_MAX_CHARS} characters ...]\n" + output[-BLOCKING_OUTPUT_MAX_CHARS:]
+            return {"output": output, "exit_code": exit_code, "completed": exit_code is not None}
+        finally:
+            try:
+                await self.sandbox.process.delete_session(session_id)
+            except Exception as e:
+                logger.warning(f"Failed to delete blocking command session {session_id}: {str(e)}")
+
     async def _execute_raw_command(self, command: str) -> Dict[str, Any]:
         """Execute a raw command directly in the sandbox."""
         # Ensure session exists for raw commands
@@ -394,82 +405,6 @@ class SandboxShellTool(SandboxToolsBase):
         except Exception as e:
             return self.fail_response(f"Error listing commands: {str(e)}")
 
-    def _is_command_completed(self, current_output: str, marker: str) -> bool:
-        """
-        Check if command execution is completed by comparing marker from end to start.
-        
-        Args:
-            current_output: Current output content
-            marker: Completion marker
-            
-        Returns:
-            bool: True if command completed, False otherwise
-        """
-        if not current_output or not marker:
-            return False
-
-        # Find the last complete marker match position to start comparison
-        # Avoid terminal prompt output at the end
-        marker_end_pos = -1
-        for i in range(len(current_output) - len(marker), -1, -1):
-            if current_output[i:i+len(marker)] == marker:
-                marker_end_pos = i + len(marker) - 1
-                break
-        
-        # Start comparison from found marker position or end of output
-        if marker_end_pos != -1:
-            output_idx = marker_end_pos
-            marker_idx = len(marker) - 1
-        else:
-            output_idx = len(current_output) - 1
-            marker_idx = len(marker) - 1
-        
-        # Compare characters from end to start
-        while marker_idx >= 0 and output_idx >= 0:
-            # Skip newlines in current_output
-            if current_output[output_idx] == '\n':
-                output_idx -= 1
-                continue
-                
-            # Compare characters
-            if current_output[output_idx] != marker[marker_idx]:
-                return False
-                
-            # Continue comparison
-            output_idx -= 1
-            marker_idx -= 1
-        
-        # If marker not fully matched
-        if marker_idx >= 0:
-            return False
-            
-        # Check if preceded by "echo " (command just started)
-        check_count = 0
-        echo_chars = "echo "
-        echo_idx = len(echo_chars) - 1
-        
-        while output_idx >= 0 and check_count < 5:
-            # Skip newlines
-            if current_output[output_idx] == '\n':
-                output_idx -= 1
-                continue
-                
-            check_count += 1
-            
-            # Check for "echo " pattern
-            if echo_idx >= 0 and current_output[output_idx] == echo_chars[echo_idx]:
-                echo_idx -= 1
-            else:
-                echo_idx = len(echo_chars) - 1
-                
-            output_idx -= 1
-            
-        # If "echo " found, command just started
-        if echo_idx < 0:
-            return False
-            
-        return True
-
     async def cleanup(self):
         """Clean up all sessions."""
         for session_name in list(self._sessions.keys()):
@@ -0,0 +1,228 @@
+"""
+Columnar view of a sheet for the analysis paths of SandboxSheetsTool.
+
+`SheetData` keeps rows as lists of Python objects, which suits row edits but
+made `analyze_sheet` convert every cell once per aggregate and group with
+per-key row lists. `ColumnarSheet` transposes the requested columns into NumPy
+object arrays once and parses each into float64 values plus a validity mask
+once, so aggregations, group-bys and row filters are single vectorized passes.
+
+Cells missing from short rows count as empty. A cell is numeric when `float()`
+accepts it: numbers and numeric strings, as before.
+"""
+
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+AGGREGATIONS = ("count", "sum", "avg", "min", "max")
+FILTER_OPERATORS = ("==", "!=", ">", ">=", "<", "<=", "contains", "empty", "not_empty")
+
+
+def _to_float(v: Any) -> float:
+    try:
+        # float() accepts ints, floats and numeric strings with surrounding whitespace
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _parse_numbers(values: np.ndarray) -> np.ndarray:
+    try:
+        # Columns of real numbers (XLSX) or clean numeric strings convert in C
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    # Remember values that failed, so repeated placeholders ("", "n/a") raise only once
+    not_numeric = set()
+
+    def parse(v: Any) -> float:
+        if v in not_numeric:
+            return np.nan
+        try:
+            return float(v)
+        except (TypeError, ValueError):
+            not_numeric.add(v)
+            return np.nan
+
+    return np.fromiter(map(parse, values), dtype=np.float64, count=len(values))
+
+
+def _python_value(v: Any) -> Any:
+    """NumPy scalars as JSON-serializable Python numbers."""
+    if isinstance(v, np.integer):
+        return int(v)
+    if isinstance(v, np.floating):
+        return float(v)
+    return v
+
+
+class Column:
+    """One column: raw cells, parsed numbers and the mask of cells that parsed."""
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+        self._numbers: Optional[np.ndarray] = None
+        self._valid: Optional[np.ndarray] = None
+        self._texts: Optional[np.ndarray] = None
+
+    def _parse(self):
+        self._numbers = _parse_numbers(self.values)
+        self._valid = ~np.isnan(self._numbers)
+
+    @property
+    def numbers(self) -> np.ndarray:
+        """float64 values, NaN where the cell is empty or not numeric."""
+        if self._numbers is None:
+            self._parse()
+        return self._numbers
+
+    @property
+    def valid(self) -> np.ndarray:
+        if self._valid is None:
+            self._parse()
+        return self._valid
+
+    @property
+    def texts(self) -> np.ndarray:
+        """Cells as stripped strings, '' for empty cells."""
+        if self._texts is None:
+            self._texts = np.array(["" if v is None else str(v).strip() for v in self.values], dtype=object)
+        return self._texts
+
+
+class ColumnarSheet:
+    """Lazily transposed, parsed-once columns of a header row plus data rows."""
+
+    def __init__(self, headers: List[str], rows: Sequence[Sequence[Any]]):
+        self.headers = headers
+        self.rows = rows
+        self.row_count = len(rows)
+        self._index = {h: i for i, h in enumerate(headers)}
+        self._columns: Dict[int, Column] = {}
+        self._lengths: Optional[np.ndarray] = None
+
+    def column(self, name: str) -> Column:
+        return self.column_at(self._index[name])
+
+    def column_at(self, idx: int) -> Column:
+        column = self._columns.get(idx)
+        if column is None:
+            values = np.empty(self.row_count, dtype=object)
+            if self.rows_with_columns([idx]).all():
+                values[:] = list(map(itemgetter(idx), self.rows))
+            else:
+                values[:] = [row[idx] if len(row) > idx else None for row in self.rows]
+            column = self._columns[idx] = Column(values)
+        return column
+
+    def rows_with_columns(self, indices: Sequence[int]) -> np.ndarray:
+        """Mask of rows long enough to have a cell in each of the given column positions."""
+        if self._lengths is None:
+            self._lengths = np.fromiter((len(row) for row in self.rows), dtype=np.intp, count=self.row_count)
+        return self._lengths > max(indices, default=-1)
+
+    def aggregate(self, columns: List[str], aggs: Sequence[str] = AGGREGATIONS) -> Dict[str, Dict[str, Any]]:
+        """`{column: {agg: value}}` over all rows; aggregates of a column without numbers are None (count 0)."""
+        result = {}
+        for name in columns:
+            column = self.column(name)
+            values = column.numbers[column.valid]
+            found = values.size > 0
+            stats = {
+                "count": int(values.size),
+                "sum": float(values.sum()) if found else None,
+                "avg": float(values.mean()) if found else None,
+                "min": float(values.min()) if found else None,
+                "max": float(values.max()) if found else None,
+            }
+            result[name] = {agg: stats[agg] for agg in aggs}
+        return result
+
+    def group_by(self, key: str, columns: List[str], aggs: Sequence[str] = AGGREGATIONS) -> Tuple[List[Any], Dict[str, Dict[str, List[Any]]]]:
+        """Group keys in order of first appearance and `{column: {agg: [value per group]}}`."""
+        codes, keys = self.factorize(key)
+        group_count = len(keys)
+        result = {}
+        for name in columns:
+            column = self.column(name)
+            valid = column.valid
+            group_codes = codes[valid]
+            values = column.numbers[valid]
+            counts = np.bincount(group_codes, minlength=group_count)
+            found = counts > 0
+            sums = np.bincount(group_codes, weights=values, minlength=group_count)
+            stats: Dict[str, np.ndarray] = {"count": counts, "sum": sums}
+            if "avg" in aggs:
+                stats["avg"] = np.divide(sums, counts, out=np.zeros(group_count), where=found)
+            if "min" in aggs:
+                stats["min"] = np.full(group_count, np.inf)
+                np.minimum.at(stats["min"], group_codes, values)
+            if "max" in aggs:
+                stats["max"] = np.full(group_count, -np.inf)
+                np.maximum.at(stats["max"], group_codes, values)
+            result[name] = {
+                agg: [
+                    int(stats[agg][g]) if agg == "count" else (float(stats[agg][g]) if found[g] else None)
+                    for g in range(group_count)
+                ]
+                for agg in aggs
+            }
+        return keys, result
+
+    def factorize(self, key: str) -> Tuple[np.ndarray, List[Any]]:
+        """Group code of every row and the distinct keys, in order of first appearance."""
+        index: Dict[Any, int] = {}
+        codes = np.fromiter(
+            (index.setdefault(v, len(index)) for v in self.column(key).values),
+            dtype=np.intp, count=self.row_count,
+        )
+        return codes, [_python_value(k) for k in index]
+
+    def where(self, column: str, op: str, value: Any = None) -> np.ndarray:
+        """Row mask of a `column op value` filter.
+
+        Comparisons are numeric when the filter value is a number, or a string that
+        parses as one (non-numeric cells never match), and string comparisons otherwise.
+        """
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {op}. Use one of {', '.join(FILTER_OPERATORS)}")
+        col = self.column(column)
+        if op == "empty":
+            return col.texts == ""
+        if op == "not_empty":
+            return col.texts != ""
+        if op == "contains":
+            needle = str(value).lower()
+            return np.fromiter((needle in t.lower() for t in col.texts), dtype=bool, count=self.row_count)
+
+        target = _to_float(value)
+        if not np.isnan(target):
+            numbers = col.numbers
+            with np.errstate(invalid="ignore"):
+                if op == "==":
+                    return numbers == target
+                if op == "!=":
+                    return ~(numbers == target)
+                if op == ">":
+                    return numbers > target
+                if op == ">=":
+                    return numbers >= target
+                if op == "<":
+                    return numbers < target
+                return numbers <= target
+
+        texts = col.texts
+        target_text = "" if value is None else str(value).strip()
+        if op == "==":
+            return texts == target_text
+        if op == "!=":
+            return texts != target_text
+        if op == ">":
+            return texts > target_text
+        if op == ">=":
+            return texts >= target_text
+        if op == "<":
+            return texts < target_text
+        return texts <= target_text
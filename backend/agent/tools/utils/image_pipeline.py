@@ -0,0 +1,257 @@
+"""
+Image fetching and processing for the sandbox tools, off the event loop.
+
+`see_image` fetched URLs with blocking `requests` calls and decoded, resized
+and re-encoded images with PIL inside the async handler, and the presentation
+tool converted every slide image the same way. Each image froze the worker's
+event loop, stalling every other agent run streaming on that process.
+
+- `fetch_image` downloads with httpx, streaming the body so a missing or
+  wrong Content-Length can't exceed the size limit.
+- `compress_image` and `convert_to_jpeg` run PIL in a spawn process pool,
+  as content extraction in `knowledge_base.file_processor` does. A crash or
+  memory blow-up on a hostile image takes down a pool worker, not the run.
+- Results are cached by a hash of the input bytes and the processing
+  parameters, so the same image seen again (repeated `see_image` calls, the
+  same picture on several slides) is not decoded again.
+"""
+
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import ssl
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+from utils.logger import logger
+
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+FETCH_TIMEOUT = 10.0
+FETCH_HEADERS = {"User-Agent": "Mozilla/5.0"}  # Some servers block default clients
+
+DEFAULT_MAX_WIDTH = 1920
+DEFAULT_MAX_HEIGHT = 1080
+DEFAULT_JPEG_QUALITY = 85
+DEFAULT_PNG_COMPRESS_LEVEL = 6
+
+IMAGE_WORKERS = min(4, os.cpu_count() or 1)
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_image_pool: Optional[ProcessPoolExecutor] = None
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+class ImageTooLargeError(ValueError):
+    pass
+
+
+def get_image_pool() -> ProcessPoolExecutor:
+    """Process pool for image decoding and encoding."""
+    global _image_pool
+    if _image_pool is None:
+        # spawn: forking a process that runs an event loop and client threads is unsafe
+        _image_pool = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _image_pool
+
+
+class ImageCache:
+    """Process-local LRU of processed image bytes, bounded by their total size."""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+
+image_cache = ImageCache()
+
+
+def _get_ssl_context() -> ssl.SSLContext:
+    # Loading the CA bundle takes tens of milliseconds, which a new client would spend on the loop every fetch
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+async def fetch_image(
+    url: str,
+    max_bytes: int = MAX_IMAGE_SIZE,
+    timeout: float = FETCH_TIMEOUT,
+    headers: Optional[Dict[str, str]] = None,
+) -> Tuple[bytes, Optional[str]]:
+    """Download `url` and return its bytes and media type (Content-Type without parameters).
+
+    Raises ImageTooLargeError when the body exceeds `max_bytes`, and httpx errors
+    for failed requests and error statuses.
+    """
+    async with httpx.AsyncClient(
+        follow_redirects=True, timeout=timeout, headers=headers or FETCH_HEADERS, verify=_get_ssl_context()
+    ) as client:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                raise ImageTooLargeError(
+                    f"Image is too large ({int(content_length) / (1024 * 1024):.2f}MB) for the maximum allowed size of {max_bytes / (1024 * 1024):.2f}MB"
+                )
+            chunks = []
+            received = 0
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                if received > max_bytes:
+                    raise ImageTooLargeError(
+                        f"Downloaded image is too large (over {max_bytes / (1024 * 1024):.2f}MB)"
+                    )
+                chunks.append(chunk)
+            content_type = response.headers.get('Content-Type')
+
+    media_type = content_type.split(';')[0].strip().lower() if content_type else None
+    return b"".join(chunks), media_type
+
+
+def _flatten_to_rgb(img: Image.Image) -> Image.Image:
+    """Composite transparent images onto white."""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    return img
+
+
+def compress_image_bytes(
+    image_bytes: bytes,
+    mime_type: str,
+    max_width: int,
+    max_height: int,
+    jpeg_quality: int,
+    png_compress_level: int,
+) -> Tuple[bytes, str]:
+    """Process pool entry point: downscale to fit max_width x max_height and re-encode.
+
+    GIF and PNG keep their format; everything else becomes JPEG.
+    """
+    img = _flatten_to_rgb(Image.open(io.BytesIO(image_bytes)))
+
+    width, height = img.size
+    if width > max_width or height > max_height:
+        ratio = min(max_width / width, max_height / height)
+        img = img.resize((int(width * ratio), int(height * ratio)), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    if mime_type == 'image/gif':
+        img.save(output, format='GIF', optimize=True)
+        return output.getvalue(), 'image/gif'
+    if mime_type == 'image/png':
+        img.save(output, format='PNG', optimize=True, compress_level=png_compress_level)
+        return output.getvalue(), 'image/png'
+    img.save(output, format='JPEG', quality=jpeg_quality, optimize=True)
+    return output.getvalue(), 'image/jpeg'
+
+
+def convert_to_jpeg_bytes(image_bytes: bytes, quality: int) -> bytes:
+    """Process pool entry point: re-encode an image as JPEG, transparency composited onto white."""
+    img = _flatten_to_rgb(Image.open(io.BytesIO(image_bytes))).convert('RGB')
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+
+async def _run_in_pool(fn: Callable, *args: Any) -> Any:
+    global _image_pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_image_pool(), fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed decoding an oversized image); start a fresh pool next time
+        _image_pool = None
+        raise
+
+
+async def _content_key(operation: str, data: bytes, *params: Any) -> str:
+    # hashlib releases the GIL on large inputs, so hashing megabytes runs in parallel with the loop
+    digest = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+    return f"{operation}:{digest}:{':'.join(str(p) for p in params)}"
+
+
+async def compress_image(
+    image_bytes: bytes,
+    mime_type: str,
+    max_width: int = DEFAULT_MAX_WIDTH,
+    max_height: int = DEFAULT_MAX_HEIGHT,
+    jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+    png_compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL,
+) -> Tuple[bytes, str]:
+    """Downscale and re-encode an image to cut its size; returns the input unchanged if it can't be decoded."""
+    params = (mime_type, max_width, max_height, jpeg_quality, png_compress_level)
+    key = await _content_key('compress', image_bytes, *params)
+    cached = image_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        result = await _run_in_pool(compress_image_bytes, image_bytes, *params)
+    except Exception as e:
+        logger.warning(f"Failed to compress image: {str(e)}. Using original.")
+        return image_bytes, mime_type
+    image_cache.put(key, result, len(result[0]))
+    return result
+
+
+async def convert_to_jpeg(image_bytes: bytes, quality: int = 90) -> bytes:
+    """Re-encode an image as JPEG. Raises if it can't be decoded."""
+    key = await _content_key('jpeg', image_bytes, quality)
+    cached = image_cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = await _run_in_pool(convert_to_jpeg_bytes, image_bytes, quality)
+    image_cache.put(key, result, len(result))
+    return result
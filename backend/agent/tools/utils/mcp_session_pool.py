@@ -0,0 +1,254 @@
+"""
+Process-wide pool of initialized MCP client sessions.
+
+Opening an MCP session costs a transport connection (TLS handshake, or a new
+process for stdio servers) plus the `initialize` handshake. Tool executors used
+to pay that on every single call. The pool keeps initialized sessions alive per
+worker, keyed by a hash of the server config, and shares them across tool calls
+and runs:
+
+- Each session is owned by a dedicated task that enters and exits the transport
+  and `ClientSession` contexts, so their cancel scopes never cross tasks.
+- Executors lease sessions and release them from `MCPToolWrapper.cleanup`;
+  sessions without leases are closed after `IDLE_TIMEOUT`, leased ones after
+  `MAX_IDLE` so a wrapper that is never cleaned up can't pin a session forever.
+- A session unused for `HEALTH_CHECK_INTERVAL` is pinged before it's handed out
+  and transparently reopened when the ping fails.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from utils.logger import logger
+
+CONNECT_TIMEOUT = 30
+PING_TIMEOUT = 5
+HEALTH_CHECK_INTERVAL = 60
+IDLE_TIMEOUT = 5 * 60
+MAX_IDLE = 30 * 60
+MAX_SESSIONS = 100
+SWEEP_INTERVAL = 60
+
+Transport = Callable[[], "AsyncIterator[Tuple[Any, Any]]"]
+
+
+def session_key(transport: str, **config: Any) -> str:
+    config_str = json.dumps({"transport": transport, **config}, sort_keys=True, default=str)
+    return hashlib.md5(config_str.encode()).hexdigest()
+
+
+@asynccontextmanager
+async def http_transport(url: str, headers: Optional[Dict[str, str]] = None):
+    kwargs = {"headers": headers} if headers else {}
+    async with streamablehttp_client(url, **kwargs) as (read, write, _):
+        yield read, write
+
+
+@asynccontextmanager
+async def sse_transport(url: str, headers: Optional[Dict[str, str]] = None):
+    try:
+        client = sse_client(url, headers=headers or {})
+    except TypeError as e:
+        if "unexpected keyword argument" not in str(e):
+            raise
+        client = sse_client(url)
+    async with client as (read, write):
+        yield read, write
+
+
+@asynccontextmanager
+async def stdio_transport(server_params: StdioServerParameters):
+    async with stdio_client(server_params) as (read, write):
+        yield read, write
+
+
+class PooledSession:
+    """An initialized `ClientSession` kept open by its owner task."""
+
+    def __init__(self, key: str, name: str, transport: Transport):
+        self.key = key
+        self.name = name
+        self.transport = transport
+        self.session: Optional[ClientSession] = None
+        self.error: Optional[BaseException] = None
+        self.owners: Set[int] = set()
+        self.last_used = time.monotonic()
+        self.last_checked = time.monotonic()
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def open(self):
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), CONNECT_TIMEOUT)
+        except BaseException:
+            await self.close()
+            raise
+        if self.session is None:
+            raise self.error or ConnectionError(f"MCP session to {self.name} closed during initialization")
+
+    async def _run(self):
+        try:
+            async with AsyncExitStack() as stack:
+                read, write = await stack.enter_async_context(self.transport())
+                session = await stack.enter_async_context(ClientSession(read, write))
+                await session.initialize()
+                self.session = session
+                self._ready.set()
+                await self._closing.wait()
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            self.error = e
+            if self.session is not None:
+                logger.warning(f"MCP session to {self.name} dropped: {e}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def close(self):
+        self._closing.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), PING_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._task.cancel()
+        except Exception:
+            pass
+
+
+class MCPSessionPool:
+    """Sessions keyed by server config with single-flight connects and idle eviction."""
+
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT, max_idle: float = MAX_IDLE, max_sessions: int = MAX_SESSIONS):
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, PooledSession] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def acquire(self, key: str, name: str, transport: Transport, owner: int) -> Tuple[ClientSession, bool]:
+        """Return a healthy session for the key and whether it was reused rather than freshly opened."""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._sessions.get(key)
+            if entry is not None and entry.alive and time.monotonic() - entry.last_checked >= HEALTH_CHECK_INTERVAL:
+                try:
+                    await asyncio.wait_for(entry.session.send_ping(), PING_TIMEOUT)
+                    entry.last_checked = time.monotonic()
+                except Exception as e:
+                    logger.info(f"MCP session to {name} failed health check, reconnecting: {e}")
+                    await self._discard(entry)
+                    entry = None
+
+            reused = entry is not None and entry.alive
+            if not reused:
+                if entry is not None:
+                    await self._discard(entry)
+                entry = PooledSession(key, name, transport)
+                await entry.open()
+                self._sessions[key] = entry
+                logger.debug(f"Opened pooled MCP session to {name}")
+                await self._enforce_limit()
+
+            entry.owners.add(owner)
+            entry.last_used = time.monotonic()
+            self._ensure_sweeper()
+            return entry.session, reused
+
+    async def invalidate(self, key: str, session: Optional[ClientSession] = None):
+        """Close the session of a key, unless it was already replaced by a newer one than `session`."""
+        entry = self._sessions.get(key)
+        if entry is not None and (session is None or entry.session is session or not entry.alive):
+            await self._discard(entry)
+
+    def release(self, owner: int):
+        """Drop the leases of an owner; its sessions stay open until they idle out."""
+        now = time.monotonic()
+        for entry in self._sessions.values():
+            if owner in entry.owners:
+                entry.owners.discard(owner)
+                entry.last_used = now
+
+    async def close_all(self):
+        for entry in list(self._sessions.values()):
+            await self._discard(entry)
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    async def call(
+        self,
+        key: str,
+        name: str,
+        transport: Transport,
+        owner: int,
+        operation: Callable[[ClientSession], Awaitable[Any]],
+    ) -> Any:
+        """Run an operation on a pooled session, reopening it once if a reused session turns out to be dead."""
+        session, reused = await self.acquire(key, name, transport, owner)
+        try:
+            return await operation(session)
+        except Exception as e:
+            # Only a reused session can have gone stale in the pool; a fresh one
+            # failing, or a live one returning an error, is a real error
+            if not reused or not await self._is_stale(key, session):
+                raise
+            logger.info(f"Pooled MCP session to {name} went stale ({e}), reconnecting")
+            await self.invalidate(key, session)
+            session, _ = await self.acquire(key, name, transport, owner)
+            return await operation(session)
+
+    async def _is_stale(self, key: str, session: ClientSession) -> bool:
+        entry = self._sessions.get(key)
+        if entry is None or entry.session is not session or not entry.alive:
+            return True
+        try:
+            await asyncio.wait_for(session.send_ping(), PING_TIMEOUT)
+            return False
+        except Exception:
+            return True
+
+    async def _discard(self, entry: PooledSession):
+        if self._sessions.get(entry.key) is entry:
+            del self._sessions[entry.key]
+        await entry.close()
+
+    async def _enforce_limit(self):
+        while len(self._sessions) > self.max_sessions:
+            idle = [e for e in self._sessions.values() if not e.owners] or list(self._sessions.values())
+            await self._discard(min(idle, key=lambda e: e.last_used))
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self):
+        while self._sessions:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            now = time.monotonic()
+            for entry in list(self._sessions.values()):
+                idle = now - entry.last_used
+                if not entry.alive or idle > self.max_idle or (not entry.owners and idle > self.idle_timeout):
+                    logger.debug(f"Closing idle MCP session to {entry.name}")
+                    await self._discard(entry)
+            for key in [k for k in self._locks if k not in self._sessions and not self._locks[k].locked()]:
+                del self._locks[key]
+
+
+mcp_session_pool = MCPSessionPool()
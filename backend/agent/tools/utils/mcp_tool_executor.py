@@ -1,13 +1,22 @@
 import json
 import asyncio
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Tuple
+from urllib.parse import urlparse
 from agentpress.tool import ToolResult
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.sse import sse_client
-from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
+from mcp import StdioServerParameters
 from mcp_module import mcp_service
 from utils.logger import logger
+from agent.tools.utils.mcp_session_pool import (
+    mcp_session_pool, session_key, http_transport, sse_transport, stdio_transport,
+)
+
+TOOL_CALL_TIMEOUT = 30
+COMPOSIO_URL_TTL = 300
+
+# profile_id -> (mcp_url, resolved_at); the runtime URL of a Composio profile
+# only changes when the profile is reconnected
+_composio_urls: Dict[str, Tuple[str, float]] = {}
 
 
 class MCPToolExecutor:
@@ -16,6 +25,17 @@ class MCPToolExecutor:
         self.custom_tools = custom_tools
         self.tool_wrapper = tool_wrapper
     
+    def release_sessions(self):
+        mcp_session_pool.release(id(self))
+    
+    async def _call_pooled_tool(self, key: str, name: str, transport, original_tool_name: str, arguments: Dict[str, Any]) -> ToolResult:
+        async with asyncio.timeout(TOOL_CALL_TIMEOUT):
+            result = await mcp_session_pool.call(
+                key, name, transport, id(self),
+                lambda session: session.call_tool(original_tool_name, arguments)
+            )
+        return self._create_success_result(self._extract_content(result))
+    
     async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> ToolResult:
         logger.info(f"Executing MCP tool {tool_name} with arguments {arguments}")
 
@@ -50,12 +70,7 @@ class MCPToolExecutor:
                 return self._create_error_result("Missing profile_id for Composio tool")
             
             try:
-                from composio_integration.composio_profile_service import ComposioProfileService
-                from services.supabase import DBConnection
-                
-                db = DBConnection()
-                profile_service = ComposioProfileService(db)
-                mcp_url = await profile_service.get_mcp_url_for_runtime(profile_id)
+                mcp_url = await self._resolve_composio_url(profile_id)
                 modified_tool_info = tool_info.copy()
                 modified_tool_info['custom_config'] = {
                     **custom_config,
@@ -113,13 +128,11 @@ class MCPToolExecutor:
                 headers["x-pd-oauth-app-id"] = oauth_app_id
             
             url = "https://remote.mcp.pipedream.net"
-            
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(url, headers=headers) as (read_stream, write_stream, _):
-                    async with ClientSession(read_stream, write_stream) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
+            key = session_key('http', url=url, headers=headers)
+            return await self._call_pooled_tool(
+                key, f"pipedream:{app_slug}", lambda: http_transport(url, headers),
+                original_tool_name, arguments
+            )
                         
         except Exception as e:
             logger.error(f"Error executing Pipedream MCP tool: {str(e)}")
@@ -131,24 +144,11 @@ class MCPToolExecutor:
         
         url = custom_config['url']
         headers = custom_config.get('headers', {})
-        
-        async with asyncio.timeout(30):
-            try:
-                async with sse_client(url, headers=headers) as (read, write):
-                    async with ClientSession(read, write) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
-                        
-            except TypeError as e:
-                if "unexpected keyword argument" in str(e):
-                    async with sse_client(url) as (read, write):
-                        async with ClientSession(read, write) as session:
-                            await session.initialize()
-                            result = await session.call_tool(original_tool_name, arguments)
-                            return self._create_success_result(self._extract_content(result))
-                else:
-                    raise
+        key = session_key('sse', url=url, headers=headers)
+        return await self._call_pooled_tool(
+            key, urlparse(url).netloc, lambda: sse_transport(url, headers),
+            original_tool_name, arguments
+        )
     
     async def _execute_http_tool(self, tool_name: str, arguments: Dict[str, Any], tool_info: Dict[str, Any]) -> ToolResult:
         custom_config = tool_info['custom_config']
@@ -157,12 +157,11 @@ class MCPToolExecutor:
         url = custom_config['url']
         
         try:
-            async with asyncio.timeout(30):
-                async with streamablehttp_client(url) as (read, write, _):
-                    async with ClientSession(read, write) as session:
-                        await session.initialize()
-                        result = await session.call_tool(original_tool_name, arguments)
-                        return self._create_success_result(self._extract_content(result))
+            key = session_key('http', url=url)
+            return await self._call_pooled_tool(
+                key, urlparse(url).netloc, lambda: http_transport(url),
+                original_tool_name, arguments
+            )
                         
         except Exception as e:
             logger.error(f"Error executing HTTP MCP tool: {str(e)}")
@@ -178,12 +177,25 @@ class MCPToolExecutor:
             env=custom_config.get("env", {})
         )
         
-        async with asyncio.timeout(30):
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    result = await session.call_tool(original_tool_name, arguments)
-                    return self._create_success_result(self._extract_content(result))
+        key = session_key('stdio', command=server_params.command, args=server_params.args, env=server_params.env)
+        return await self._call_pooled_tool(
+            key, server_params.command, lambda: stdio_transport(server_params),
+            original_tool_name, arguments
+        )
+    
+    async def _resolve_composio_url(self, profile_id: str) -> str:
+        cached = _composio_urls.get(profile_id)
+        if cached and time.monotonic() - cached[1] < COMPOSIO_URL_TTL:
+            return cached[0]
+        
+        from composio_integration.composio_profile_service import ComposioProfileService
+        from services.supabase import DBConnection
+        
+        db = DBConnection()
+        profile_service = ComposioProfileService(db)
+        mcp_url = await profile_service.get_mcp_url_for_runtime(profile_id)
+        _composio_urls[profile_id] = (mcp_url, time.monotonic())
+        return mcp_url
     
     async def _resolve_external_user_id(self, custom_config: Dict[str, Any]) -> str:
         profile_id = custom_config.get('profile_id')
@@ -1,17 +1,16 @@
-import json
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone, timedelta
 from utils.cache import Cache
 from utils.logger import logger
 from utils.config import config
 from services import redis
+from services.response_stream import get_all_responses, append_stream_control, delete_responses
 from run_agent_background import update_agent_run_status
 
 
 async def _cleanup_redis_response_list(agent_run_id: str):
     try:
-        response_list_key = f"agent_run:{agent_run_id}:responses"
-        await redis.delete(response_list_key)
+        await delete_responses(agent_run_id)
         logger.debug(f"Cleaned up Redis response list for agent run {agent_run_id}")
     except Exception as e:
         logger.warning(f"Failed to clean up Redis response list for {agent_run_id}: {str(e)}")
@@ -33,11 +32,9 @@ async def stop_agent_run(db, agent_run_id: str, error_message: Optional[str] = N
     client = await db.client
     final_status = "failed" if error_message else "stopped"
 
-    response_list_key = f"agent_run:{agent_run_id}:responses"
     all_responses = []
     try:
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        all_responses = await get_all_responses(agent_run_id)
         logger.info(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
     except Exception as e:
         logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
@@ -51,6 +48,7 @@ async def stop_agent_run(db, agent_run_id: str, error_message: Optional[str] = N
 
     global_control_channel = f"agent_run:{agent_run_id}:control"
     try:
+        await append_stream_control(agent_run_id, "STOP")
         await redis.publish(global_control_channel, "STOP")
         logger.debug(f"Published STOP signal to global channel {global_control_channel}")
     except Exception as e:
@@ -151,53 +149,13 @@ async def check_agent_count_limit(client, account_id: str) -> Dict[str, Any]:
                 'tier_name': 'local'
             }
         
-        try:
-            result = await Cache.get(f"agent_count_limit:{account_id}")
-            if result:
-                logger.debug(f"Cache hit for agent count limit: {account_id}")
-                return result
-        except Exception as cache_error:
-            logger.warning(f"Cache read failed for agent count limit {account_id}: {str(cache_error)}")
-
-        agents_result = await client.table('agents').select('agent_id, metadata').eq('account_id', account_id).execute()
-        
-        non_suna_agents = []
-        for agent in agents_result.data or []:
-            metadata = agent.get('metadata', {}) or {}
-            is_suna_default = metadata.get('is_suna_default', False)
-            if not is_suna_default:
-                non_suna_agents.append(agent)
-                
-        current_count = len(non_suna_agents)
-        logger.debug(f"Account {account_id} has {current_count} custom agents (excluding Suna defaults)")
-        
-        try:
-            from services.billing import get_subscription_tier
-            tier_name = await get_subscription_tier(client, account_id)
-            logger.debug(f"Account {account_id} subscription tier: {tier_name}")
-        except Exception as billing_error:
-            logger.warning(f"Could not get subscription tier for {account_id}: {str(billing_error)}, defaulting to free")
-            tier_name = 'free'
-        
-        agent_limit = config.AGENT_LIMITS.get(tier_name, config.AGENT_LIMITS['free'])
-        
-        can_create = current_count < agent_limit
-        
-        result = {
-            'can_create': can_create,
-            'current_count': current_count,
-            'limit': agent_limit,
-            'tier_name': tier_name
-        }
-        
-        try:
-            await Cache.set(f"agent_count_limit:{account_id}", result, ttl=300)
-        except Exception as cache_error:
-            logger.warning(f"Cache write failed for agent count limit {account_id}: {str(cache_error)}")
-        
-        logger.info(f"Account {account_id} has {current_count}/{agent_limit} agents (tier: {tier_name}) - can_create: {can_create}")
-        
-        return result
+        # The limit depends on the subscription tier, so it goes with the account's billing cache
+        return await Cache.get_or_load(
+            f"agent_count_limit:{account_id}",
+            lambda: _load_agent_count_limit(client, account_id),
+            300,
+            tags=[f"billing:{account_id}"]
+        )
         
     except Exception as e:
         logger.error(f"Error checking agent count limit for account {account_id}: {str(e)}", exc_info=True)
@@ -207,3 +165,40 @@ async def check_agent_count_limit(client, account_id: str) -> Dict[str, Any]:
             'limit': config.AGENT_LIMITS['free'],
             'tier_name': 'free'
         }
+
+
+async def _load_agent_count_limit(client, account_id: str) -> Dict[str, Any]:
+    agents_result = await client.table('agents').select('agent_id, metadata').eq('account_id', account_id).execute()
+    
+    non_suna_agents = []
+    for agent in agents_result.data or []:
+        metadata = agent.get('metadata', {}) or {}
+        is_suna_default = metadata.get('is_suna_default', False)
+        if not is_suna_default:
+            non_suna_agents.append(agent)
+            
+    current_count = len(non_suna_agents)
+    logger.debug(f"Account {account_id} has {current_count} custom agents (excluding Suna defaults)")
+    
+    try:
+        from services.billing import get_subscription_tier
+        tier_name = await get_subscription_tier(client, account_id)
+        logger.debug(f"Account {account_id} subscription tier: {tier_name}")
+    except Exception as billing_error:
+        logger.warning(f"Could not get subscription tier for {account_id}: {str(billing_error)}, defaulting to free")
+        tier_name = 'free'
+    
+    agent_limit = config.AGENT_LIMITS.get(tier_name, config.AGENT_LIMITS['free'])
+    
+    can_create = current_count < agent_limit
+    
+    result = {
+        'can_create': can_create,
+        'current_count': current_count,
+        'limit': agent_limit,
+        'tier_name': tier_name
+    }
+    
+    logger.info(f"Account {account_id} has {current_count}/{agent_limit} agents (tier: {tier_name}) - can_create: {can_create}")
+    
+    return result
@@ -86,17 +86,15 @@ class VersionService:
             
         client = await self._get_client()
         
-        owner_result = await client.table('agents').select('account_id').eq(
-            'agent_id', agent_id
-        ).eq('account_id', user_id).execute()
-        
-        is_owner = bool(owner_result.data)
-        
-        public_result = await client.table('agents').select('is_public').eq(
+        result = await client.table('agents').select('account_id, is_public').eq(
             'agent_id', agent_id
         ).execute()
         
-        is_public = bool(public_result.data and public_result.data[0].get('is_public', False))
+        if not result.data:
+            return False, False
+        
+        is_owner = result.data[0].get('account_id') == user_id
+        is_public = bool(result.data[0].get('is_public', False))
         
         return is_owner, is_public
     
@@ -6,13 +6,87 @@ reaching the context window limitations of LLM models.
 """
 
 import json
-from typing import List, Dict, Any, Optional, Union
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Union
 
 from litellm.utils import token_counter
 from services.supabase import DBConnection
 from utils.logger import logger
 
 DEFAULT_TOKEN_THRESHOLD = 120000
+DEFAULT_TOKEN_CACHE_SIZE = 50000
+
+
+class MessageTokenCache:
+    """Per-message token count cache shared across runs in a worker process.
+
+    Entries are keyed by model, message_id and a fingerprint of the message
+    content. Compressed and uncompressed versions of the same message are
+    therefore cached side by side, and any content change is recounted.
+
+    `token_counter` adds a fixed overhead once per call (reply priming), which
+    every per-message count includes. `combine` subtracts the repeats, so a sum
+    of cached counts equals a single `token_counter` call over the whole list
+    and compression triggers at the same point as before.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str, int], int]" = OrderedDict()
+        self._call_overheads: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(msg: Dict[str, Any]) -> int:
+        """Hash of the parts of a message that determine its token count."""
+        content = msg.get('content')
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True, default=str)
+        tool_calls = msg.get('tool_calls')
+        if tool_calls:
+            tool_calls = json.dumps(tool_calls, sort_keys=True, default=str)
+        return hash((msg.get('role'), content, tool_calls))
+
+    def count_message(self, msg: Dict[str, Any], llm_model: str) -> int:
+        """Return the token count of a single message, tokenizing each content version once."""
+        key = (llm_model, str(msg.get('message_id') or ''), self.fingerprint(msg))
+
+        count = self._entries.get(key)
+        if count is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return count
+
+        self.misses += 1
+        count = token_counter(model=llm_model, messages=[msg])
+        self._entries[key] = count
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return count
+
+    def call_overhead(self, llm_model: str) -> int:
+        """Tokens `token_counter` adds once per call rather than once per message."""
+        overhead = self._call_overheads.get(llm_model)
+        if overhead is None:
+            probe = {'role': 'user', 'content': 'x'}
+            overhead = 2 * token_counter(model=llm_model, messages=[probe]) - token_counter(model=llm_model, messages=[probe, probe])
+            self._call_overheads[llm_model] = overhead
+        return overhead
+
+    def combine(self, counts: List[int], llm_model: str) -> int:
+        """Token count of consecutive message lists, given the count of each list on its own."""
+        counts = [count for count in counts if count]
+        if not counts:
+            return 0
+        return sum(counts) - (len(counts) - 1) * self.call_overhead(llm_model)
+
+    def count_messages(self, messages: List[Dict[str, Any]], llm_model: str) -> int:
+        """Return the token count of a message list from the cached per-message counts."""
+        return self.combine([self.count_message(msg, llm_model) for msg in messages if isinstance(msg, dict)], llm_model)
+
+
+message_token_cache = MessageTokenCache()
 
 class ContextManager:
     """Manages thread context including token counting and summarization."""
@@ -25,6 +99,11 @@ class ContextManager:
         """
         self.db = DBConnection()
         self.token_threshold = token_threshold
+        self.token_cache = message_token_cache
+
+    def count_tokens(self, messages: List[Dict[str, Any]], llm_model: str) -> int:
+        """Count tokens for a message list using the shared per-message cache."""
+        return self.token_cache.count_messages(messages, llm_model)
 
     def is_tool_result_message(self, msg: Dict[str, Any]) -> bool:
         """Check if a message is a tool result message."""
@@ -109,7 +188,7 @@ class ContextManager:
   
     def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the tool result messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
 
         if uncompressed_total_token_count > max_tokens_value:
@@ -119,7 +198,7 @@ class ContextManager:
                     continue  # Skip non-dict messages
                 if self.is_tool_result_message(msg):  # Only compress ToolResult messages
                     _i += 1  # Count the number of ToolResult messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.token_cache.count_message(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent ToolResult message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -133,7 +212,7 @@ class ContextManager:
 
     def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the user messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
 
         if uncompressed_total_token_count > max_tokens_value:
@@ -143,7 +222,7 @@ class ContextManager:
                     continue  # Skip non-dict messages
                 if msg.get('role') == 'user':  # Only compress User messages
                     _i += 1  # Count the number of User messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.token_cache.count_message(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent User message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -157,7 +236,7 @@ class ContextManager:
 
     def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
         """Compress the assistant messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = self.count_tokens(messages, llm_model)
         max_tokens_value = max_tokens or (100 * 1000)
         
         if uncompressed_total_token_count > max_tokens_value:
@@ -167,7 +246,7 @@ class ContextManager:
                     continue  # Skip non-dict messages
                 if msg.get('role') == 'assistant':  # Only compress Assistant messages
                     _i += 1  # Count the number of Assistant messages
-                    msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
+                    msg_token_count = self.token_cache.count_message(msg, llm_model)  # Count the number of tokens in the message
                     if msg_token_count > token_threshold:  # If the message is too long
                         if _i > 1:  # If this is not the most recent Assistant message
                             message_id = msg.get('message_id')  # Get the message_id
@@ -232,13 +311,13 @@ class ContextManager:
         result = messages
         result = self.remove_meta_messages(result)
 
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=result)
+        uncompressed_total_token_count = self.count_tokens(result, llm_model)
 
         result = self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold)
         result = self.compress_user_messages(result, llm_model, max_tokens, token_threshold)
         result = self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold)
 
-        compressed_token_count = token_counter(model=llm_model, messages=result)
+        compressed_token_count = self.count_tokens(result, llm_model)
 
         logger.info(f"compress_messages: {uncompressed_total_token_count} -> {compressed_token_count}")  # Log the token compression for debugging later
 
@@ -277,7 +356,7 @@ class ContextManager:
         result = self.remove_meta_messages(result)
 
         # Early exit if no compression needed
-        initial_token_count = token_counter(model=llm_model, messages=result)
+        initial_token_count = self.count_tokens(result, llm_model)
         max_allowed_tokens = max_tokens or (100 * 1000)
         
         if initial_token_count <= max_allowed_tokens:
@@ -314,11 +393,11 @@ class ContextManager:
 
             # Recalculate token count
             messages_to_count = ([system_message] + conversation_messages) if system_message else conversation_messages
-            current_token_count = token_counter(model=llm_model, messages=messages_to_count)
+            current_token_count = self.count_tokens(messages_to_count, llm_model)
 
         # Prepare final result
         final_messages = ([system_message] + conversation_messages) if system_message else conversation_messages
-        final_token_count = token_counter(model=llm_model, messages=final_messages)
+        final_token_count = self.count_tokens(final_messages, llm_model)
         
         logger.info(f"compress_messages_by_omitting_messages: {initial_token_count} -> {final_token_count} tokens ({len(messages)} -> {len(final_messages)} messages)")
             
@@ -0,0 +1,266 @@
+"""
+Per-thread hot cache of LLM messages for AgentPress.
+
+`ThreadManager.get_llm_messages` is called on every auto-continue iteration of
+a run. Instead of re-downloading and re-parsing the whole thread each time, the
+cache remembers the parsed messages of a thread together with the newest
+`created_at` seen, so only rows written after that point have to be fetched.
+
+Invalidation works across processes through a per-thread epoch counter kept in
+Redis: deleting a message bumps the epoch and every process holding a cached
+copy of the thread discards it on the next read. When
+`THREAD_MESSAGE_CACHE_REDIS` is enabled the raw rows are also mirrored into a
+Redis list so a fresh worker process can hydrate a thread without paging
+through the database.
+"""
+
+import asyncio
+import bisect
+import copy
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from services import postgres, redis
+from utils.config import config
+from utils.logger import logger
+
+EPOCH_KEY_PREFIX = "thread_messages_epoch:"
+ROWS_KEY_PREFIX = "thread_messages:"
+REDIS_ROWS_TTL = 3600 * 6
+EPOCH_TTL = 3600 * 24 * 7
+# In-process entries are dropped after this long so an expired epoch key can never resurrect a stale copy
+ENTRY_TTL_SECONDS = 3600
+# A row can commit after rows with a later created_at: MessageWriter assigns
+# created_at when a message is queued and inserts it after batching and retries,
+# other processes' clocks are skewed, and inserts run concurrently. Each refresh
+# re-reads this window before the newest cached row, skipping rows already cached
+# by message_id, so late rows are picked up without re-downloading cached ones.
+CREATED_AT_OVERLAP_SECONDS = 300
+# Rows of the overlap window fetched per request by id (PostgREST path)
+FETCH_BY_ID_BATCH_SIZE = 100
+
+
+@dataclass
+class ThreadMessageEntry:
+    """Cached LLM messages of a single thread, ordered by created_at."""
+    epoch: Optional[str] = None
+    loaded_at: float = field(default_factory=time.monotonic)
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: List[str] = field(default_factory=list)
+    message_ids: Set[str] = field(default_factory=set)
+
+    @property
+    def last_created_at(self) -> Optional[str]:
+        return self.created_at[-1] if self.created_at else None
+
+    def ids_since(self, created_at: str) -> List[str]:
+        """IDs of the cached messages created at or after `created_at`."""
+        start = bisect.bisect_left(self.created_at, created_at)
+        return [msg['message_id'] for msg in self.messages[start:]]
+
+    def add_row(self, row: Dict[str, Any]) -> bool:
+        """Parse and insert a raw `messages` row. Returns False if it was already cached."""
+        message_id = row.get('message_id')
+        if not message_id or message_id in self.message_ids:
+            return False
+
+        parsed = parse_message_row(row)
+        if parsed is None:
+            return False
+
+        created_at = row.get('created_at') or ''
+        if not self.created_at or created_at >= self.created_at[-1]:
+            index = len(self.created_at)
+        else:
+            index = bisect.bisect_right(self.created_at, created_at)
+        self.created_at.insert(index, created_at)
+        self.messages.insert(index, parsed)
+        self.message_ids.add(message_id)
+        return True
+
+
+def parse_message_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Turn a raw `messages` row into the LLM message dict used by ThreadManager."""
+    content = row.get('content')
+    if isinstance(content, str):
+        try:
+            parsed = json.loads(content)
+        except json.JSONDecodeError:
+            logger.error(f"Failed to parse message: {content}")
+            return None
+    else:
+        parsed = dict(content) if isinstance(content, dict) else content
+    if not isinstance(parsed, dict):
+        logger.error(f"Unexpected message content type for message {row.get('message_id')}: {type(parsed)}")
+        return None
+    parsed['message_id'] = row['message_id']
+    return parsed
+
+
+def _overlap_start(created_at: str) -> str:
+    """Return an ISO timestamp CREATED_AT_OVERLAP_SECONDS before `created_at`."""
+    try:
+        ts = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    except ValueError:
+        return created_at
+    return (ts - timedelta(seconds=CREATED_AT_OVERLAP_SECONDS)).isoformat()
+
+
+class ThreadMessageCache:
+    """Process-wide LRU of per-thread LLM messages with incremental refresh."""
+
+    def __init__(self, max_threads: int = 256):
+        self.max_threads = max_threads
+        self._entries: "OrderedDict[str, ThreadMessageEntry]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def redis_rows_enabled(self) -> bool:
+        return bool(config.THREAD_MESSAGE_CACHE_REDIS)
+
+    def _lock(self, thread_id: str) -> asyncio.Lock:
+        lock = self._locks.get(thread_id)
+        if lock is None:
+            lock = self._locks[thread_id] = asyncio.Lock()
+        return lock
+
+    def _store(self, thread_id: str, entry: ThreadMessageEntry):
+        self._entries[thread_id] = entry
+        self._entries.move_to_end(thread_id)
+        while len(self._entries) > self.max_threads:
+            evicted_id, _ = self._entries.popitem(last=False)
+            self._locks.pop(evicted_id, None)
+
+    async def _get_epoch(self, thread_id: str) -> Optional[str]:
+        try:
+            return await redis.get(f"{EPOCH_KEY_PREFIX}{thread_id}", default="0")
+        except Exception as e:
+            logger.warning(f"Failed to read message cache epoch for thread {thread_id}: {e}")
+            return None
+
+    async def _load_redis_rows(self, thread_id: str) -> List[Dict[str, Any]]:
+        try:
+            raw_rows = await redis.lrange(f"{ROWS_KEY_PREFIX}{thread_id}", 0, -1)
+            return [json.loads(raw) for raw in raw_rows]
+        except Exception as e:
+            logger.warning(f"Failed to load cached message rows for thread {thread_id}: {e}")
+            return []
+
+    async def _append_redis_rows(self, thread_id: str, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        key = f"{ROWS_KEY_PREFIX}{thread_id}"
+        try:
+            await redis.rpush(key, *[json.dumps(row, default=str) for row in rows])
+            await redis.expire(key, REDIS_ROWS_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to mirror message rows for thread {thread_id} to Redis: {e}")
+
+    async def _fetch_rows(self, client, thread_id: str, since: Optional[str], known_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetch `is_llm_message` rows of a thread, optionally only those at or after `since` and not in `known_ids`."""
+        pool = await postgres.get_pool()
+        if pool is not None:
+            try:
+                return await postgres.fetch_llm_messages(pool, thread_id, since, known_ids)
+            except Exception as e:
+                logger.warning(f"Postgres message fetch failed for thread {thread_id}, using PostgREST: {e}")
+
+        if since:
+            return await self._fetch_rows_since(client, thread_id, since, set(known_ids))
+
+        rows: List[Dict[str, Any]] = []
+        batch_size = 1000
+        offset = 0
+        while True:
+            query = client.table('messages').select('message_id, content, created_at').eq('thread_id', thread_id).eq('is_llm_message', True)
+            if since:
+                query = query.gte('created_at', since)
+            result = await query.order('created_at').range(offset, offset + batch_size - 1).execute()
+            if not result.data:
+                break
+            rows.extend(result.data)
+            if len(result.data) < batch_size:
+                break
+            offset += batch_size
+        return rows
+
+    async def _fetch_rows_since(self, client, thread_id: str, since: str, known_ids: Set[str]) -> List[Dict[str, Any]]:
+        """Fetch the rows at or after `since` that aren't cached: ids first, then content of the missing ones only."""
+        id_rows = []
+        offset = 0
+        while True:
+            result = await client.table('messages').select('message_id').eq('thread_id', thread_id).eq('is_llm_message', True) \
+                .gte('created_at', since).order('created_at').range(offset, offset + 999).execute()
+            id_rows.extend(result.data or [])
+            if len(result.data or []) < 1000:
+                break
+            offset += 1000
+
+        missing = [row['message_id'] for row in id_rows if row['message_id'] not in known_ids]
+        rows: List[Dict[str, Any]] = []
+        for i in range(0, len(missing), FETCH_BY_ID_BATCH_SIZE):
+            result = await client.table('messages').select('message_id, content, created_at') \
+                .in_('message_id', missing[i:i + FETCH_BY_ID_BATCH_SIZE]).execute()
+            rows.extend(result.data or [])
+        rows.sort(key=lambda row: row['created_at'])
+        return rows
+
+    async def get_messages(self, client, thread_id: str) -> List[Dict[str, Any]]:
+        """Return the parsed LLM messages of a thread, fetching only rows newer than the cached ones.
+
+        The returned list and its message dicts are copies, so callers may mutate them freely.
+        """
+        async with self._lock(thread_id):
+            epoch = await self._get_epoch(thread_id)
+            entry = self._entries.get(thread_id)
+            if entry is not None and (
+                epoch is None
+                or entry.epoch != epoch
+                or time.monotonic() - entry.loaded_at > ENTRY_TTL_SECONDS
+            ):
+                entry = None
+
+            if entry is None:
+                entry = ThreadMessageEntry(epoch=epoch)
+                if epoch is not None and self.redis_rows_enabled:
+                    for row in await self._load_redis_rows(thread_id):
+                        entry.add_row(row)
+
+            since = _overlap_start(entry.last_created_at) if entry.last_created_at else None
+            rows = await self._fetch_rows(client, thread_id, since, entry.ids_since(since) if since else [])
+            new_rows = [row for row in rows if entry.add_row(row)]
+            if new_rows:
+                logger.debug(f"Message cache for thread {thread_id}: {len(new_rows)} new rows, {len(entry.messages)} total")
+                if epoch is not None and self.redis_rows_enabled:
+                    await self._append_redis_rows(thread_id, new_rows)
+
+            # Without a readable epoch we cannot detect remote invalidation, so don't keep the entry
+            if epoch is not None:
+                self._store(thread_id, entry)
+            return copy.deepcopy(entry.messages)
+
+    async def append(self, thread_id: str, row: Dict[str, Any]):
+        """Record a freshly inserted `is_llm_message` row for a thread that is already cached."""
+        entry = self._entries.get(thread_id)
+        if entry is None:
+            return
+        if entry.add_row(row) and self.redis_rows_enabled:
+            await self._append_redis_rows(thread_id, [row])
+
+    async def invalidate(self, thread_id: str):
+        """Drop the cached messages of a thread in this and every other process."""
+        self._entries.pop(thread_id, None)
+        try:
+            redis_client = await redis.get_client()
+            await redis_client.incr(f"{EPOCH_KEY_PREFIX}{thread_id}")
+            await redis_client.expire(f"{EPOCH_KEY_PREFIX}{thread_id}", EPOCH_TTL)
+            await redis.delete(f"{ROWS_KEY_PREFIX}{thread_id}")
+        except Exception as e:
+            logger.warning(f"Failed to invalidate message cache for thread {thread_id}: {e}")
+
+
+thread_message_cache = ThreadMessageCache()
@@ -0,0 +1,112 @@
+"""
+Write-behind message persistence for a run.
+
+`ResponseProcessor` saves a message for every step of a run (thread_run_start,
+assistant_response_start, tool_started, tool_completed, tool results, finish,
+assistant_response_end, thread_run_end). Awaiting each insert put several
+sequential round trips between a tool finishing and the next LLM call.
+
+`MessageWriter.add` assigns the message_id and timestamps client-side and
+returns the complete row right away, so it can be yielded immediately. Rows
+are written in order in the background, batched into multi-row inserts.
+`flush()` is the durability barrier: `ThreadManager` calls it before the next
+LLM call reads the thread, and the processor calls it at the end of a run.
+"""
+
+import asyncio
+import copy
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from utils.logger import logger
+
+# Rows added within this window go out in the same insert
+FLUSH_DELAY = 0.02
+MAX_BATCH_SIZE = 100
+INSERT_RETRIES = 3
+
+
+def _format_timestamp(ts: datetime) -> str:
+    """ISO timestamp the way Postgres renders it (no trailing zeros in the fraction)."""
+    value = ts.isoformat(timespec='microseconds')
+    head, _, offset = value.partition('+')
+    head = head.rstrip('0').rstrip('.')
+    return f"{head}+{offset}"
+
+
+class MessageWriter:
+    """Ordered, batched background inserts of a run's messages."""
+
+    def __init__(self, insert_rows: Callable[[List[Dict[str, Any]]], Awaitable[Any]]):
+        """
+        Args:
+            insert_rows: Inserts a list of complete `messages` rows in one statement, in order.
+        """
+        self.insert_rows = insert_rows
+        self._pending: List[Dict[str, Any]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._error: Optional[Exception] = None
+        self._last_created_at: Optional[datetime] = None
+
+    def add(
+        self,
+        thread_id: str,
+        type: str,
+        content: Union[Dict[str, Any], List[Any], str],
+        is_llm_message: bool = False,
+        metadata: Optional[Dict[str, Any]] = None,
+        agent_id: Optional[str] = None,
+        agent_version_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Queue a message and return its row as it will be stored; the caller may modify the returned row."""
+        # Strictly increasing, so rows of one batch keep their order in created_at
+        now = datetime.now(timezone.utc)
+        if self._last_created_at is not None and now <= self._last_created_at:
+            now = self._last_created_at + timedelta(microseconds=1)
+        self._last_created_at = now
+        timestamp = _format_timestamp(now)
+
+        row = {
+            'message_id': str(uuid.uuid4()),
+            'thread_id': thread_id,
+            'type': type,
+            'content': content,
+            'is_llm_message': is_llm_message,
+            'metadata': metadata or {},
+            'agent_id': agent_id,
+            'agent_version_id': agent_version_id,
+            'created_at': timestamp,
+            'updated_at': timestamp,
+        }
+        self._pending.append(copy.deepcopy(row))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_pending())
+        return row
+
+    async def flush(self):
+        """Wait until every queued message is stored. Raises if a write failed since the last flush."""
+        while self._pending or (self._flusher is not None and not self._flusher.done()):
+            if self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.create_task(self._flush_pending(delay=False))
+            await asyncio.shield(self._flusher)
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    async def _flush_pending(self, delay: bool = True):
+        if delay:
+            await asyncio.sleep(FLUSH_DELAY)
+        while self._pending:
+            batch = self._pending[:MAX_BATCH_SIZE]
+            for attempt in range(INSERT_RETRIES):
+                try:
+                    await self.insert_rows(batch)
+                    break
+                except Exception as e:
+                    if attempt + 1 == INSERT_RETRIES:
+                        logger.error(f"Failed to write {len(batch)} messages of thread {batch[0]['thread_id']}: {e}", exc_info=True)
+                        self._error = self._error or e
+                    else:
+                        await asyncio.sleep(0.5 * (2 ** attempt))
+            del self._pending[:len(batch)]
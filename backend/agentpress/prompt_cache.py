@@ -0,0 +1,65 @@
+"""
+Content-addressed cache of assembled prompt text.
+
+The static part of a run's system prompt (base prompt, agent prompt, MCP tool
+list) and the XML tool-calling section (the tool schemas dumped with indent=2)
+only change when their inputs change, but were rebuilt on every run and every
+auto-continue. Entries are keyed by a hash of everything that goes into the
+text, so a hit returns exactly the text a rebuild would produce, and equal
+inputs give byte-identical prompt prefixes across runs, which is what
+provider-side prompt caching needs to hit.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+def fingerprint(*parts: Any) -> str:
+    """Hash of the given parts; anything but a string is serialized as compact JSON with sorted keys."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, str):
+            part = json.dumps(part, sort_keys=True, separators=(',', ':'), default=str)
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class PromptCache:
+    """Process-local LRU of assembled prompt text keyed by `fingerprint` of its inputs."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: str, build: Callable[[], str]) -> str:
+        """Return the text cached under `key`, building and storing it on a miss."""
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+
+        text = build()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+prompt_cache = PromptCache()
@@ -18,7 +18,8 @@ from dataclasses import dataclass
 from utils.logger import logger
 from agentpress.tool import ToolResult
 from agentpress.tool_registry import ToolRegistry
-from agentpress.xml_tool_parser import XMLToolParser
+from agentpress.xml_tool_parser import XMLToolParser, StreamingXMLToolScanner
+from agentpress.message_writer import MessageWriter
 from langfuse.client import StatefulTraceClient
 from services.langfuse import langfuse
 from utils.json_helpers import (
@@ -86,7 +87,7 @@ class ProcessorConfig:
 class ResponseProcessor:
     """Processes LLM responses, extracting and executing tool calls."""
     
-    def __init__(self, tool_registry: ToolRegistry, add_message_callback: Callable, trace: Optional[StatefulTraceClient] = None, is_agent_builder: bool = False, target_agent_id: Optional[str] = None, agent_config: Optional[dict] = None):
+    def __init__(self, tool_registry: ToolRegistry, add_message_callback: Callable, trace: Optional[StatefulTraceClient] = None, is_agent_builder: bool = False, target_agent_id: Optional[str] = None, agent_config: Optional[dict] = None, message_writer: Optional[MessageWriter] = None):
         """Initialize the ResponseProcessor.
         
         Args:
@@ -94,9 +95,12 @@ class ResponseProcessor:
             add_message_callback: Callback function to add messages to the thread.
                 MUST return the full saved message object (dict) or None.
             agent_config: Optional agent configuration with version information
+            message_writer: Optional write-behind writer; when given, messages are queued
+                on it instead of awaiting add_message_callback for each of them.
         """
         self.tool_registry = tool_registry
         self.add_message = add_message_callback
+        self.message_writer = message_writer
         self.trace = trace or langfuse.trace(name="anonymous:response_processor")
         # Initialize the XML parser
         self.xml_parser = XMLToolParser()
@@ -113,6 +117,37 @@ class ResponseProcessor:
             return format_for_yield(message_obj)
         return None
 
+    async def _save_message(
+        self,
+        thread_id: str,
+        type: str,
+        content: Union[Dict[str, Any], List[Any], str],
+        is_llm_message: bool = False,
+        metadata: Optional[Dict[str, Any]] = None,
+        agent_id: Optional[str] = None,
+        agent_version_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Save a message through the write-behind writer if there is one, else insert it right away."""
+        if self.message_writer is not None:
+            return self.message_writer.add(
+                thread_id=thread_id, type=type, content=content, is_llm_message=is_llm_message,
+                metadata=metadata, agent_id=agent_id, agent_version_id=agent_version_id
+            )
+        return await self.add_message(
+            thread_id=thread_id, type=type, content=content, is_llm_message=is_llm_message,
+            metadata=metadata, agent_id=agent_id, agent_version_id=agent_version_id
+        )
+
+    async def _flush_messages(self):
+        """Durability barrier at the end of a run: wait until every queued message is stored."""
+        if self.message_writer is None:
+            return
+        try:
+            await self.message_writer.flush()
+        except Exception as e:
+            logger.error(f"Failed to store messages of the run: {str(e)}")
+            self.trace.event(name="failed_to_store_run_messages", level="ERROR", status_message=(f"Failed to store messages of the run: {str(e)}"))
+
     async def _add_message_with_agent_info(
         self,
         thread_id: str,
@@ -129,7 +164,7 @@ class ResponseProcessor:
             agent_id = self.agent_config.get('agent_id')
             agent_version_id = self.agent_config.get('current_version_id')
             
-        return await self.add_message(
+        return await self._save_message(
             thread_id=thread_id,
             type=type,
             content=content,
@@ -169,7 +204,7 @@ class ResponseProcessor:
         continuous_state = continuous_state or {}
         accumulated_content = continuous_state.get('accumulated_content', "")
         tool_calls_buffer = {}
-        current_xml_content = accumulated_content   # equal to accumulated_content if auto-continuing, else blank
+        xml_scanner = StreamingXMLToolScanner(accumulated_content)   # primed with accumulated_content if auto-continuing
         xml_chunks_buffer = []
         pending_tool_executions = []
         yielded_tool_indices = set() # Stores indices of tools whose *status* has been yielded
@@ -208,14 +243,14 @@ class ResponseProcessor:
             # --- Save and Yield Start Events (only if not auto-continuing) ---
             if auto_continue_count == 0:
                 start_content = {"status_type": "thread_run_start", "thread_run_id": thread_run_id}
-                start_msg_obj = await self.add_message(
+                start_msg_obj = await self._save_message(
                     thread_id=thread_id, type="status", content=start_content, 
                     is_llm_message=False, metadata={"thread_run_id": thread_run_id}
                 )
                 if start_msg_obj: yield format_for_yield(start_msg_obj)
 
                 assist_start_content = {"status_type": "assistant_response_start"}
-                assist_start_msg_obj = await self.add_message(
+                assist_start_msg_obj = await self._save_message(
                     thread_id=thread_id, type="status", content=assist_start_content, 
                     is_llm_message=False, metadata={"thread_run_id": thread_run_id}
                 )
@@ -266,7 +301,6 @@ class ResponseProcessor:
                         chunk_content = delta.content
                         # print(chunk_content, end='', flush=True)
                         accumulated_content += chunk_content
-                        current_xml_content += chunk_content
 
                         if not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
                             # Yield ONLY content chunk (don't save)
@@ -286,9 +320,9 @@ class ResponseProcessor:
 
                         # --- Process XML Tool Calls (if enabled and limit not reached) ---
                         if config.xml_tool_calling and not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
-                            xml_chunks = self._extract_xml_chunks(current_xml_content)
+                            # The scanner only looks at the new delta and returns each <invoke> block as soon as it closes
+                            xml_chunks = xml_scanner.feed(chunk_content)
                             for xml_chunk in xml_chunks:
-                                current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
                                 xml_chunks_buffer.append(xml_chunk)
                                 result = self._parse_xml_tool_call(xml_chunk)
                                 if result:
@@ -496,7 +530,7 @@ class ResponseProcessor:
             # Save and yield finish status if limit was reached
             if finish_reason == "xml_tool_limit_reached":
                 finish_content = {"status_type": "finish", "finish_reason": "xml_tool_limit_reached"}
-                finish_msg_obj = await self.add_message(
+                finish_msg_obj = await self._save_message(
                     thread_id=thread_id, type="status", content=finish_content, 
                     is_llm_message=False, metadata={"thread_run_id": thread_run_id}
                 )
@@ -513,9 +547,13 @@ class ResponseProcessor:
                 # ... (Truncate accumulated_content logic) ...
                 if config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls and xml_chunks_buffer:
                     last_xml_chunk = xml_chunks_buffer[-1]
-                    last_chunk_end_pos = accumulated_content.find(last_xml_chunk) + len(last_xml_chunk)
-                    if last_chunk_end_pos > 0:
+                    last_chunk_pos = accumulated_content.find(last_xml_chunk)
+                    if last_chunk_pos >= 0:
+                        last_chunk_end_pos = last_chunk_pos + len(last_xml_chunk)
                         accumulated_content = accumulated_content[:last_chunk_end_pos]
+                        # Chunks are single <invoke> blocks, so close the enclosing <function_calls> block if we cut inside it
+                        if accumulated_content.rfind('<function_calls>') > accumulated_content.rfind('</function_calls>'):
+                            accumulated_content += "\n</function_calls>"
 
                 # ... (Extract complete_native_tool_calls logic) ...
                 # Update complete_native_tool_calls from buffer (initialized earlier)
@@ -553,7 +591,7 @@ class ResponseProcessor:
                     self.trace.event(name="failed_to_save_final_assistant_message_for_thread", level="ERROR", status_message=(f"Failed to save final assistant message for thread {thread_id}"))
                     # Save and yield an error status
                     err_content = {"role": "system", "status_type": "error", "message": "Failed to save final assistant message"}
-                    err_msg_obj = await self.add_message(
+                    err_msg_obj = await self._save_message(
                         thread_id=thread_id, type="status", content=err_content, 
                         is_llm_message=False, metadata={"thread_run_id": thread_run_id}
                     )
@@ -574,9 +612,7 @@ class ResponseProcessor:
                  # Gather XML tool calls from buffer (up to limit)
                 parsed_xml_data = []
                 if config.xml_tool_calling:
-                    # Reparse remaining content just in case (should be empty if processed correctly)
-                    xml_chunks = self._extract_xml_chunks(current_xml_content)
-                    xml_chunks_buffer.extend(xml_chunks)
+                    # Every complete <invoke> block was already collected by the scanner during streaming
                     # Process only chunks not already handled in the stream loop
                     remaining_limit = config.max_xml_tool_calls - xml_tool_call_count if config.max_xml_tool_calls > 0 else len(xml_chunks_buffer)
                     xml_chunks_to_process = xml_chunks_buffer[:remaining_limit] # Ensure limit is respected
@@ -687,7 +723,7 @@ class ResponseProcessor:
             # --- Final Finish Status ---
             if finish_reason and finish_reason != "xml_tool_limit_reached":
                 finish_content = {"status_type": "finish", "finish_reason": finish_reason}
-                finish_msg_obj = await self.add_message(
+                finish_msg_obj = await self._save_message(
                     thread_id=thread_id, type="status", content=finish_content, 
                     is_llm_message=False, metadata={"thread_run_id": thread_run_id}
                 )
@@ -703,7 +739,7 @@ class ResponseProcessor:
                 
                 # Save and yield termination status
                 finish_content = {"status_type": "finish", "finish_reason": "agent_terminated"}
-                finish_msg_obj = await self.add_message(
+                finish_msg_obj = await self._save_message(
                     thread_id=thread_id, type="status", content=finish_content, 
                     is_llm_message=False, metadata={"thread_run_id": thread_run_id}
                 )
@@ -746,7 +782,7 @@ class ResponseProcessor:
                         if streaming_metadata.get("response_ms"):
                             assistant_end_content["response_ms"] = streaming_metadata["response_ms"]
                         
-                        await self.add_message(
+                        await self._save_message(
                             thread_id=thread_id,
                             type="assistant_response_end",
                             content=assistant_end_content,
@@ -800,7 +836,7 @@ class ResponseProcessor:
                         if streaming_metadata.get("response_ms"):
                             assistant_end_content["response_ms"] = streaming_metadata["response_ms"]
                         
-                        await self.add_message(
+                        await self._save_message(
                             thread_id=thread_id,
                             type="assistant_response_end",
                             content=assistant_end_content,
@@ -819,7 +855,7 @@ class ResponseProcessor:
             
             err_content = {"role": "system", "status_type": "error", "message": str(e)}
             if (not "AnthropicException - Overloaded" in str(e)):
-                err_msg_obj = await self.add_message(
+                err_msg_obj = await self._save_message(
                     thread_id=thread_id, type="status", content=err_content, 
                     is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
                 )
@@ -843,7 +879,7 @@ class ResponseProcessor:
                 # Save and Yield the final thread_run_end status (only if not auto-continuing and finish_reason is not 'length')
                 try:
                     end_content = {"status_type": "thread_run_end"}
-                    end_msg_obj = await self.add_message(
+                    end_msg_obj = await self._save_message(
                         thread_id=thread_id, type="status", content=end_content, 
                         is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
                     )
@@ -851,6 +887,7 @@ class ResponseProcessor:
                 except Exception as final_e:
                     logger.error(f"Error in finally block: {str(final_e)}", exc_info=True)
                     self.trace.event(name="error_in_finally_block", level="ERROR", status_message=(f"Error in finally block: {str(final_e)}"))
+                await self._flush_messages()
 
     async def process_non_streaming_response(
         self,
@@ -884,7 +921,7 @@ class ResponseProcessor:
         try:
             # Save and Yield thread_run_start status message
             start_content = {"status_type": "thread_run_start", "thread_run_id": thread_run_id}
-            start_msg_obj = await self.add_message(
+            start_msg_obj = await self._save_message(
                 thread_id=thread_id, type="status", content=start_content,
                 is_llm_message=False, metadata={"thread_run_id": thread_run_id}
             )
@@ -945,7 +982,7 @@ class ResponseProcessor:
                  logger.error(f"Failed to save non-streaming assistant message for thread {thread_id}")
                  self.trace.event(name="failed_to_save_non_streaming_assistant_message_for_thread", level="ERROR", status_message=(f"Failed to save non-streaming assistant message for thread {thread_id}"))
                  err_content = {"role": "system", "status_type": "error", "message": "Failed to save assistant message"}
-                 err_msg_obj = await self.add_message(
+                 err_msg_obj = await self._save_message(
                      thread_id=thread_id, type="status", content=err_content, 
                      is_llm_message=False, metadata={"thread_run_id": thread_run_id}
                  )
@@ -1000,7 +1037,7 @@ class ResponseProcessor:
             # --- Save and Yield Final Status ---
             if finish_reason:
                 finish_content = {"status_type": "finish", "finish_reason": finish_reason}
-                finish_msg_obj = await self.add_message(
+                finish_msg_obj = await self._save_message(
                     thread_id=thread_id, type="status", content=finish_content, 
                     is_llm_message=False, metadata={"thread_run_id": thread_run_id}
                 )
@@ -1010,7 +1047,7 @@ class ResponseProcessor:
             if assistant_message_object: # Only save if assistant message was saved
                 try:
                     # Save the full LiteLLM response object directly in content
-                    await self.add_message(
+                    await self._save_message(
                         thread_id=thread_id,
                         type="assistant_response_end",
                         content=llm_response,
@@ -1027,7 +1064,7 @@ class ResponseProcessor:
              self.trace.event(name="error_processing_non_streaming_response", level="ERROR", status_message=(f"Error processing non-streaming response: {str(e)}"))
              # Save and yield error status
              err_content = {"role": "system", "status_type": "error", "message": str(e)}
-             err_msg_obj = await self.add_message(
+             err_msg_obj = await self._save_message(
                  thread_id=thread_id, type="status", content=err_content, 
                  is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
              )
@@ -1041,11 +1078,12 @@ class ResponseProcessor:
         finally:
              # Save and Yield the final thread_run_end status
             end_content = {"status_type": "thread_run_end"}
-            end_msg_obj = await self.add_message(
+            end_msg_obj = await self._save_message(
                 thread_id=thread_id, type="status", content=end_content, 
                 is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
             )
             if end_msg_obj: yield format_for_yield(end_msg_obj)
+            await self._flush_messages()
 
 
     def _extract_xml_chunks(self, content: str) -> List[str]:
@@ -1153,8 +1191,10 @@ class ResponseProcessor:
             - parsing_details: Dict with 'attributes', 'elements', 'text_content', 'root_content'
         """
         try:
-            # Check if this is the new format (contains <function_calls>)
-            if '<function_calls>' in xml_chunk and '<invoke' in xml_chunk:
+            # Check if this is the new format (a <function_calls> block, or a single <invoke> from the streaming scanner)
+            if '<invoke' in xml_chunk:
+                if '<function_calls>' not in xml_chunk:
+                    xml_chunk = f"<function_calls>\n{xml_chunk}\n</function_calls>"
                 # Use the new XML parser
                 parsed_calls = self.xml_parser.parse_content(xml_chunk)
                 
@@ -1468,7 +1508,7 @@ class ResponseProcessor:
                 
                 # Add as a tool message to the conversation history
                 # This makes the result visible to the LLM in the next turn
-                message_obj = await self.add_message(
+                message_obj = await self._save_message(
                     thread_id=thread_id,
                     type="tool",  # Special type for tool responses
                     content=tool_message,
@@ -1526,7 +1566,7 @@ class ResponseProcessor:
                     "role": "user",
                     "content": str(result)
                 }
-                message_obj = await self.add_message(
+                message_obj = await self._save_message(
                     thread_id=thread_id, 
                     type="tool", 
                     content=fallback_message,
@@ -1626,7 +1666,7 @@ class ResponseProcessor:
             "tool_call_id": context.tool_call.get("id") # Include tool_call ID if native
         }
         metadata = {"thread_run_id": thread_run_id}
-        saved_message_obj = await self.add_message(
+        saved_message_obj = await self._save_message(
             thread_id=thread_id, type="status", content=content, is_llm_message=False, metadata=metadata
         )
         return saved_message_obj # Return the full object (or None if saving failed)
@@ -1659,7 +1699,7 @@ class ResponseProcessor:
             self.trace.event(name="marking_tool_status_for_termination", level="DEFAULT", status_message=(f"Marking tool status for '{context.function_name}' with termination signal."))
         # <<< END ADDED >>>
 
-        saved_message_obj = await self.add_message(
+        saved_message_obj = await self._save_message(
             thread_id=thread_id, type="status", content=content, is_llm_message=False, metadata=metadata
         )
         return saved_message_obj
@@ -1677,7 +1717,7 @@ class ResponseProcessor:
         }
         metadata = {"thread_run_id": thread_run_id}
         # Save the status message with is_llm_message=False
-        saved_message_obj = await self.add_message(
+        saved_message_obj = await self._save_message(
             thread_id=thread_id, type="status", content=content, is_llm_message=False, metadata=metadata
         )
         return saved_message_obj
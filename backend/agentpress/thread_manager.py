@@ -11,21 +11,25 @@ This module provides comprehensive conversation management, including:
 """
 
 import json
-from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal, cast
+from typing import List, Dict, Any, Optional, Tuple, Type, Union, AsyncGenerator, Literal, cast
 from services.llm import make_llm_api_call
 from agentpress.tool import Tool
 from agentpress.tool_registry import ToolRegistry
 from agentpress.context_manager import ContextManager
+from agentpress.message_cache import thread_message_cache
+from agentpress.message_writer import MessageWriter
+from agentpress.prompt_cache import prompt_cache, fingerprint
 from agentpress.response_processor import (
     ResponseProcessor,
     ProcessorConfig
 )
 from services.supabase import DBConnection
+from services import postgres
+from services.usage_ledger import schedule_record_usage
 from utils.logger import logger
 from langfuse.client import StatefulGenerationClient, StatefulTraceClient
 from services.langfuse import langfuse
 import datetime
-from litellm.utils import token_counter
 
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
@@ -55,15 +59,20 @@ class ThreadManager:
         self.agent_config = agent_config
         if not self.trace:
             self.trace = langfuse.trace(name="anonymous:thread_manager")
+        self.message_writer = MessageWriter(self.add_messages)
         self.response_processor = ResponseProcessor(
             tool_registry=self.tool_registry,
             add_message_callback=self.add_message,
+            message_writer=self.message_writer,
             trace=self.trace,
             is_agent_builder=self.is_agent_builder,
             target_agent_id=self.target_agent_id,
             agent_config=self.agent_config
         )
         self.context_manager = ContextManager()
+        # Running token tallies per (thread_id, model): {message_id: (content_fingerprint, token_count)} and their sum
+        self._thread_token_counts: Dict[tuple, Dict[str, Tuple[int, int]]] = {}
+        self._thread_token_totals: Dict[tuple, int] = {}
 
     def add_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
         """Add a tool to the ThreadManager."""
@@ -165,23 +174,49 @@ class ThreadManager:
 
         try:
             # Insert the message and get the inserted row data including the id
-            result = await client.table('messages').insert(data_to_insert).execute()
+            pool = await postgres.get_pool()
+            if pool is not None:
+                row = await postgres.insert_message(pool, data_to_insert)
+                inserted = [row] if row else []
+            else:
+                inserted = (await client.table('messages').insert(data_to_insert).execute()).data
             logger.info(f"Successfully added message to thread {thread_id}")
 
-            if result.data and len(result.data) > 0 and isinstance(result.data[0], dict) and 'message_id' in result.data[0]:
-                return result.data[0]
+            if inserted and len(inserted) > 0 and isinstance(inserted[0], dict) and 'message_id' in inserted[0]:
+                if is_llm_message:
+                    await thread_message_cache.append(thread_id, inserted[0])
+                schedule_record_usage(inserted)
+                return inserted[0]
             else:
-                logger.error(f"Insert operation failed or did not return expected data structure for thread {thread_id}. Result data: {result.data}")
+                logger.error(f"Insert operation failed or did not return expected data structure for thread {thread_id}. Result data: {inserted}")
                 return None
         except Exception as e:
             logger.error(f"Failed to add message to thread {thread_id}: {str(e)}", exc_info=True)
             raise
 
+    async def add_messages(self, rows: List[Dict[str, Any]]):
+        """Insert complete message rows, as built by `MessageWriter`, in a single statement.
+
+        Rows carry their own message_id, so retrying a batch never duplicates messages.
+        """
+        pool = await postgres.get_pool()
+        if pool is not None:
+            await postgres.insert_message_rows(pool, rows)
+        else:
+            client = await self.db.client
+            await client.table('messages').upsert(rows, ignore_duplicates=True).execute()
+        logger.debug(f"Wrote {len(rows)} messages to thread {rows[0]['thread_id']}")
+
+        for row in rows:
+            if row['is_llm_message']:
+                await thread_message_cache.append(row['thread_id'], row)
+        schedule_record_usage(rows)
+
     async def get_llm_messages(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all messages for a thread.
 
-        This method uses the SQL function which handles context truncation
-        by considering summary messages.
+        Messages are served from the per-thread hot cache, which fetches only
+        rows newer than the last cached `created_at`.
 
         Args:
             thread_id: The ID of the thread to get messages for.
@@ -193,56 +228,105 @@ class ThreadManager:
         client = await self.db.client
 
         try:
-            # result = await client.rpc('get_llm_formatted_messages', {'p_thread_id': thread_id}).execute()
-            
-            # Fetch messages in batches of 1000 to avoid overloading the database
-            all_messages = []
-            batch_size = 1000
-            offset = 0
-            
-            while True:
-                result = await client.table('messages').select('message_id, content').eq('thread_id', thread_id).eq('is_llm_message', True).order('created_at').range(offset, offset + batch_size - 1).execute()
-                
-                if not result.data or len(result.data) == 0:
-                    break
-                    
-                all_messages.extend(result.data)
-                
-                # If we got fewer than batch_size records, we've reached the end
-                if len(result.data) < batch_size:
-                    break
-                    
-                offset += batch_size
-            
-            # Use all_messages instead of result.data in the rest of the method
-            result_data = all_messages
-
-            # Parse the returned data which might be stringified JSON
-            if not result_data:
-                return []
-
-            # Return properly parsed JSON objects
-            messages = []
-            for item in result_data:
-                if isinstance(item['content'], str):
-                    try:
-                        parsed_item = json.loads(item['content'])
-                        parsed_item['message_id'] = item['message_id']
-                        messages.append(parsed_item)
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse message: {item['content']}")
-                else:
-                    content = item['content']
-                    content['message_id'] = item['message_id']
-                    messages.append(content)
-
-            return messages
+            # Only rows newer than the ones already cached for this thread are fetched and parsed
+            return await thread_message_cache.get_messages(client, thread_id)
 
         except Exception as e:
             logger.error(f"Failed to get messages for thread {thread_id}: {str(e)}", exc_info=True)
             return []
 
 
+    def get_thread_token_count(self, thread_id: str, messages: List[Dict[str, Any]], llm_model: str) -> int:
+        """Return the token count of a thread's LLM messages, counting only messages not seen before.
+
+        The total is kept as a running sum per thread: new message_ids are counted
+        and added, message_ids whose content changed (edited or compressed messages)
+        are recounted, and message_ids that disappeared (deleted messages) are
+        subtracted. Messages without a message_id are counted through the shared
+        token cache. Like `MessageTokenCache.count_messages`, the result equals a
+        single `token_counter` call over the messages.
+        """
+        token_cache = self.context_manager.token_cache
+        tally_key = (thread_id, llm_model)
+        counts = self._thread_token_counts.setdefault(tally_key, {})
+        total = self._thread_token_totals.get(tally_key, 0)
+        uncounted = 0
+        uncounted_messages = 0
+        seen_ids = set()
+
+        for msg in messages:
+            if not isinstance(msg, dict):
+                continue
+            message_id = msg.get('message_id')
+            if not message_id:
+                uncounted += token_cache.count_message(msg, llm_model)
+                uncounted_messages += 1
+                continue
+            seen_ids.add(message_id)
+            fingerprint = token_cache.fingerprint(msg)
+            counted = counts.get(message_id)
+            if counted is None or counted[0] != fingerprint:
+                count = token_cache.count_message(msg, llm_model)
+                total += count - (counted[1] if counted else 0)
+                counts[message_id] = (fingerprint, count)
+
+        if len(seen_ids) != len(counts):
+            for message_id in [mid for mid in counts if mid not in seen_ids]:
+                total -= counts.pop(message_id)[1]
+
+        self._thread_token_totals[tally_key] = total
+        message_count = len(counts) + uncounted_messages
+        if not message_count:
+            return 0
+        return total + uncounted - (message_count - 1) * token_cache.call_overhead(llm_model)
+
+    def _build_xml_examples(self) -> Optional[str]:
+        """The XML tool-calling instructions with the JSON schemas of the registered tools, cached per tool set."""
+        openapi_schemas = self.tool_registry.get_openapi_schemas()
+        if not openapi_schemas:
+            return None
+        usage_examples = self.tool_registry.get_usage_examples()
+
+        def build() -> str:
+            # Convert schemas to JSON string
+            schemas_json = json.dumps(openapi_schemas, indent=2)
+
+            # Build usage examples section if any exist
+            usage_examples_section = ""
+            if usage_examples:
+                usage_examples_section = "\n\nUsage Examples:\n"
+                for func_name, example in usage_examples.items():
+                    usage_examples_section += f"\n{func_name}:\n{example}\n"
+
+            return f"""
+In this environment you have access to a set of tools you can use to answer the user's question.
+
+You can invoke functions by writing a <function_calls> block like the following as part of your reply to the user:
+
+<function_calls>
+<invoke name="function_name">
+<parameter name="param_name">param_value</parameter>
+...
+</invoke>
+</function_calls>
+
+String and scalar parameters should be specified as-is, while lists and objects should use JSON format.
+
+Here are the functions available in JSON Schema format:
+
+```json
+{schemas_json}
+```
+
+When using the tools:
+- Use the exact function names from the JSON schema above
+- Include all required parameters as specified in the schema
+- Format complex data (objects, arrays) as JSON strings within the parameter tags
+- Boolean values should be "true" or "false" (lowercase)
+{usage_examples_section}"""
+
+        return prompt_cache.get_or_build(fingerprint('xml_examples', openapi_schemas, usage_examples), build)
+
     async def run_thread(
         self,
         thread_id: str,
@@ -303,58 +387,17 @@ class ThreadManager:
 
         # Create a working copy of the system prompt to potentially modify
         working_system_prompt = system_prompt.copy()
+        if isinstance(working_system_prompt.get('content'), list):
+            # Content blocks get XML examples and cache_control added; keep the caller's prompt intact across runs
+            working_system_prompt['content'] = [
+                item.copy() if isinstance(item, dict) else item for item in working_system_prompt['content']
+            ]
 
         # Add XML tool calling instructions to system prompt if requested
         if include_xml_examples and config.xml_tool_calling:
-            openapi_schemas = self.tool_registry.get_openapi_schemas()
-            usage_examples = self.tool_registry.get_usage_examples()
-            
-            if openapi_schemas:
-                # Convert schemas to JSON string
-                schemas_json = json.dumps(openapi_schemas, indent=2)
-                
-                # Build usage examples section if any exist
-                usage_examples_section = ""
-                if usage_examples:
-                    usage_examples_section = "\n\nUsage Examples:\n"
-                    for func_name, example in usage_examples.items():
-                        usage_examples_section += f"\n{func_name}:\n{example}\n"
-                
-                examples_content = f"""
-In this environment you have access to a set of tools you can use to answer the user's question.
-
-You can invoke functions by writing a <function_calls> block like the following as part of your reply to the user:
-
-<function_calls>
-<invoke name="function_name">
-<parameter name="param_name">param_value</parameter>
-...
-</invoke>
-</function_calls>
-
-String and scalar parameters should be specified as-is, while lists and objects should use JSON format.
-
-Here are the functions available in JSON Schema format:
-
-```json
-{schemas_json}
-```
-
-When using the tools:
-- Use the exact function names from the JSON schema above
-- Include all required parameters as specified in the schema
-- Format complex data (objects, arrays) as JSON strings within the parameter tags
-- Boolean values should be "true" or "false" (lowercase)
-{usage_examples_section}"""
-
-                # # Save examples content to a file
-                # try:
-                #     with open('xml_examples.txt', 'w') as f:
-                #         f.write(examples_content)
-                #     logger.debug("Saved XML examples to xml_examples.txt")
-                # except Exception as e:
-                #     logger.error(f"Failed to save XML examples to file: {e}")
+            examples_content = self._build_xml_examples()
 
+            if examples_content:
                 system_content = working_system_prompt.get('content')
 
                 if isinstance(system_content, str):
@@ -362,7 +405,7 @@ When using the tools:
                     logger.debug("Appended XML examples to string system prompt content.")
                 elif isinstance(system_content, list):
                     appended = False
-                    for item in working_system_prompt['content']: # Modify the copy
+                    for item in working_system_prompt['content']:
                         if isinstance(item, dict) and item.get('type') == 'text' and 'text' in item:
                             item['text'] += examples_content
                             logger.debug("Appended XML examples to the first text block in list system prompt content.")
@@ -390,14 +433,19 @@ When using the tools:
                 nonlocal config
                 # Note: config is now guaranteed to exist due to check above
 
-                # 1. Get messages from thread for LLM call
+                # 1. Get messages from thread for LLM call, once everything of the previous step is stored
+                await self.message_writer.flush()
                 messages = await self.get_llm_messages(thread_id)
 
                 # 2. Check token count before proceeding
                 token_count = 0
                 try:
                     # Use the potentially modified working_system_prompt for token counting
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
+                    token_cache = self.context_manager.token_cache
+                    token_count = token_cache.combine([
+                        token_cache.count_message(working_system_prompt, llm_model),
+                        self.get_thread_token_count(thread_id, messages, llm_model),
+                    ], llm_model)
                     token_threshold = self.context_manager.token_threshold
                     logger.info(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
 
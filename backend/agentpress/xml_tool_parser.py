@@ -221,6 +221,98 @@ class XMLToolParser:
         return True, None
 
 
+class StreamingXMLToolScanner:
+    """
+    Incremental scanner that finds complete <invoke> blocks in streamed content.
+    
+    Content deltas are fed as they arrive. The scanner only looks at text it has
+    not scanned before (plus a short carry-over so tags split across deltas are
+    still found) and keeps the text of an open <invoke> as a list of pieces, so
+    total work is linear in the length of the response. Each <invoke> block
+    inside a <function_calls> block is returned as soon as its closing tag
+    arrives.
+    """
+    
+    FUNCTION_CALLS_OPEN = '<function_calls>'
+    FUNCTION_CALLS_CLOSE = '</function_calls>'
+    INVOKE_OPEN = '<invoke'
+    INVOKE_CLOSE = '</invoke>'
+    
+    # Longest tag we search for; shorter suffixes of a delta may be the start of a split tag
+    _MAX_TAG_LENGTH = max(len(FUNCTION_CALLS_OPEN), len(FUNCTION_CALLS_CLOSE), len(INVOKE_OPEN), len(INVOKE_CLOSE))
+    
+    def __init__(self, initial_content: str = ""):
+        """
+        Initialize the scanner.
+        
+        Args:
+            initial_content: Content already streamed before this scanner was created
+                             (e.g. when auto-continuing a truncated response)
+        """
+        self._carry = ""
+        self._in_block = False
+        self._invoke_parts: Optional[List[str]] = None
+        self._pending: List[str] = []
+        if initial_content:
+            self._pending = self.feed(initial_content)
+    
+    def feed(self, delta: str) -> List[str]:
+        """
+        Consume a content delta.
+        
+        Args:
+            delta: The newly streamed text
+            
+        Returns:
+            Raw XML of every <invoke>...</invoke> block completed by this delta, in order
+        """
+        completed, self._pending = self._pending, []
+        if not delta:
+            return completed
+        
+        window = self._carry + delta
+        new_text_start = len(self._carry)
+        # Where the text of an open invoke continues within this window
+        invoke_segment_start = new_text_start
+        pos = 0
+        
+        while True:
+            if self._invoke_parts is not None:
+                end = window.find(self.INVOKE_CLOSE, pos)
+                if end == -1:
+                    self._invoke_parts.append(window[invoke_segment_start:])
+                    break
+                end += len(self.INVOKE_CLOSE)
+                self._invoke_parts.append(window[invoke_segment_start:end])
+                completed.append(''.join(self._invoke_parts))
+                self._invoke_parts = None
+                pos = end
+            elif self._in_block:
+                invoke_start = window.find(self.INVOKE_OPEN, pos)
+                block_end = window.find(self.FUNCTION_CALLS_CLOSE, pos)
+                if block_end != -1 and (invoke_start == -1 or block_end < invoke_start):
+                    self._in_block = False
+                    pos = block_end + len(self.FUNCTION_CALLS_CLOSE)
+                    continue
+                if invoke_start == -1:
+                    break
+                self._invoke_parts = []
+                invoke_segment_start = invoke_start
+                pos = invoke_start + len(self.INVOKE_OPEN)
+            else:
+                block_start = window.find(self.FUNCTION_CALLS_OPEN, pos)
+                if block_start == -1:
+                    break
+                self._in_block = True
+                pos = block_start + len(self.FUNCTION_CALLS_OPEN)
+        
+        # Keep a short unscanned suffix so a tag split across deltas is still matched.
+        # Text inside an open invoke has already been captured in _invoke_parts, and the
+        # next window only appends what comes after the carry.
+        self._carry = window[max(pos, len(window) - self._MAX_TAG_LENGTH + 1):]
+        return completed
+
+
 # Convenience function for quick parsing
 def parse_xml_tool_calls(content: str) -> List[XMLToolCall]:
     """
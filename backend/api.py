@@ -9,10 +9,12 @@ import sentry
 from contextlib import asynccontextmanager
 from agentpress.thread_manager import ThreadManager
 from services.supabase import DBConnection
+from services import postgres
 from datetime import datetime, timezone
 from utils.config import config, EnvMode
 import asyncio
 from utils.logger import logger, structlog
+from utils.auth_utils import start_request_auth_scope
 import time
 from collections import OrderedDict
 
@@ -79,6 +81,7 @@ async def lifespan(app: FastAPI):
         # Clean up agent resources
         logger.info("Cleaning up agent resources")
         await agent_api.cleanup()
+        await triggers_api.cleanup()
         
         # Clean up Redis connection
         try:
@@ -91,6 +94,7 @@ async def lifespan(app: FastAPI):
         # Clean up database connection
         logger.info("Disconnecting from database")
         await db.disconnect()
+        await postgres.close_pool()
     except Exception as e:
         logger.error(f"Error during application startup: {e}")
         raise
@@ -100,6 +104,7 @@ app = FastAPI(lifespan=lifespan)
 @app.middleware("http")
 async def log_requests_middleware(request: Request, call_next):
     structlog.contextvars.clear_contextvars()
+    start_request_auth_scope()
 
     request_id = str(uuid.uuid4())
     start_time = time.time()
@@ -23,8 +23,8 @@ from .composio_service import (
 from .toolkit_service import ToolkitService, ToolsListResponse
 from .composio_profile_service import ComposioProfileService, ComposioProfile
 from .composio_trigger_service import ComposioTriggerService
-from triggers.trigger_service import get_trigger_service, TriggerEvent, TriggerType
-from triggers.execution_service import get_execution_service
+from triggers.trigger_service import get_trigger_service, TriggerType
+from triggers.intake import enqueue_trigger_event, webhook_idempotency_key, EVENT_KEY_TTL
 from .client import ComposioClient
 from triggers.api import sync_triggers_to_version_config
 
@@ -1010,42 +1010,32 @@ async def composio_webhook(request: Request):
             )
             return JSONResponse(content={"success": True, "matched_triggers": 0})
 
-        trigger_service = get_trigger_service(db)
-        execution_service = get_execution_service(db)
+        if provider_event_id:
+            idempotency_key, ttl = f"composio:{provider_event_id}", EVENT_KEY_TTL
+        else:
+            idempotency_key, ttl = webhook_idempotency_key(payload, {})
 
-        executed = 0
+        queued = 0
         for row in matched:
             trigger_id = row.get("trigger_id")
             if not trigger_id:
                 continue
-            result = await trigger_service.process_trigger_event(trigger_id, payload)
-            if result.success and (result.should_execute_agent or result.should_execute_workflow):
-                trigger = await trigger_service.get_trigger(trigger_id)
-                if not trigger:
-                    continue
-                ctx = {
-                    "payload": payload,
-                    "trigger_slug": trigger_slug,
-                    "webhook_id": wid,
-                }
-                event = TriggerEvent(
-                    trigger_id=trigger_id,
-                    agent_id=trigger.agent_id,
-                    trigger_type=TriggerType.EVENT,
-                    raw_data=payload,
-                    context=ctx,
-                )
-                await execution_service.execute_trigger_result(
-                    agent_id=trigger.agent_id,
-                    trigger_result=result,
-                    trigger_event=event,
-                )
-                executed += 1
+            ctx = {
+                "payload": payload,
+                "trigger_slug": trigger_slug,
+                "webhook_id": wid,
+            }
+            _, was_queued = await enqueue_trigger_event(
+                trigger_id, payload, idempotency_key, ttl,
+                trigger_type=TriggerType.EVENT.value,
+                context=ctx,
+            )
+            queued += was_queued
 
-        return JSONResponse(content={
+        return JSONResponse(status_code=202, content={
             "success": True,
             "matched_triggers": len(matched),
-            "executed": executed,
+            "queued": queued,
         })
 
     except HTTPException:
@@ -1,6 +1,8 @@
+import asyncio
 import json
 import logging
 import os
+import time
 from datetime import datetime
 from typing import Dict, List, Optional
 import sys
@@ -10,11 +12,122 @@ from services import redis
 
 logger = logging.getLogger(__name__)
 
+# Flag checks are served from an in-process snapshot of all flags. set_flag and
+# delete_flag publish on FLAG_CHANNEL so every process updates its snapshot right
+# away; the periodic refresh only heals messages missed while disconnected.
+FLAG_CHANNEL = "feature_flags:changes"
+SNAPSHOT_REFRESH_INTERVAL = 30
+LOAD_RETRY_INTERVAL = 5
+# How often a successful load logs the snapshot counters of this process
+STATS_LOG_INTERVAL = 10 * 60
+
+
 class FeatureFlagManager:
     def __init__(self):
         """Initialize with existing Redis service"""
         self.flag_prefix = "feature_flag:"
         self.flag_list_key = "feature_flags:list"
+        self._snapshot: Optional[Dict[str, Dict[str, str]]] = None
+        self._loaded_at = 0.0
+        self._load_failed_at = 0.0
+        # The single in-flight load, shared by the first callers and by background refreshes
+        self._load_task: Optional[asyncio.Task] = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self.stats = {'hits': 0, 'loads': 0}
+        self._stats_logged_at = time.monotonic()
+    
+    async def _load_snapshot(self) -> Optional[Dict[str, Dict[str, str]]]:
+        """Read all flags in one round trip for the key set and one pipelined round trip for their hashes"""
+        try:
+            redis_client = await redis.get_client()
+            keys = sorted(await redis_client.smembers(self.flag_list_key))
+            pipe = redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(f"{self.flag_prefix}{key}")
+            values = await pipe.execute() if keys else []
+            self._snapshot = {key: data for key, data in zip(keys, values) if data}
+            self._loaded_at = time.monotonic()
+            self.stats['loads'] += 1
+            self._ensure_listener()
+            self._log_stats()
+            return self._snapshot
+        except Exception as e:
+            self._load_failed_at = time.monotonic()
+            logger.error(f"Failed to load feature flags: {e}")
+            return self._snapshot
+    
+    def _start_load(self) -> asyncio.Task:
+        if self._load_task is None or self._load_task.done():
+            self._load_task = asyncio.create_task(self._load_snapshot())
+        return self._load_task
+    
+    async def _get_snapshot(self) -> Optional[Dict[str, Dict[str, str]]]:
+        if self._snapshot is None:
+            if time.monotonic() - self._load_failed_at < LOAD_RETRY_INTERVAL:
+                return None
+            # Concurrent first checks wait for one load; shield it from callers that are cancelled
+            return await asyncio.shield(self._start_load())
+        
+        now = time.monotonic()
+        if now - self._loaded_at > SNAPSHOT_REFRESH_INTERVAL and now - self._load_failed_at >= LOAD_RETRY_INTERVAL:
+            # Keep serving the current snapshot while it is refreshed
+            self._start_load()
+        return self._snapshot
+    
+    def _apply_change(self, key: str, flag_data: Optional[Dict[str, str]]):
+        if self._snapshot is None:
+            return
+        if flag_data:
+            self._snapshot[key] = flag_data
+        else:
+            self._snapshot.pop(key, None)
+    
+    def _ensure_listener(self):
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen())
+    
+    async def _listen(self):
+        pubsub = None
+        try:
+            pubsub = await redis.create_pubsub()
+            await pubsub.subscribe(FLAG_CHANNEL)
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message.get('type') == 'message':
+                    change = json.loads(message['data'])
+                    self._apply_change(change['key'], change.get('data'))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Changes published from now on are missed: force a reload, which restarts the listener
+            logger.warning(f"Feature flag listener stopped: {e}")
+            self._loaded_at = 0.0
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.unsubscribe(FLAG_CHANNEL)
+                    await pubsub.close()
+                except Exception:
+                    pass
+    
+    async def _publish_change(self, key: str, flag_data: Optional[Dict[str, str]]):
+        self._apply_change(key, flag_data)
+        try:
+            await redis.publish(FLAG_CHANNEL, json.dumps({'key': key, 'data': flag_data}))
+        except Exception as e:
+            logger.warning(f"Failed to publish feature flag change for {key}: {e}")
+    
+    def cache_stats(self) -> Dict[str, int]:
+        """Snapshot hit counters; every hit is an HGET that did not go to Redis"""
+        return {**self.stats, 'flags': len(self._snapshot or {})}
+    
+    def _log_stats(self):
+        now = time.monotonic()
+        if now - self._stats_logged_at < STATS_LOG_INTERVAL:
+            return
+        self._stats_logged_at = now
+        stats = self.cache_stats()
+        logger.info(f"Feature flag snapshot: {stats['hits']} checks served without a Redis call, {stats['loads']} loads, {stats['flags']} flags")
     
     async def set_flag(self, key: str, enabled: bool, description: str = "") -> bool:
         """Set a feature flag to enabled or disabled"""
@@ -30,6 +143,7 @@ class FeatureFlagManager:
             redis_client = await redis.get_client()
             await redis_client.hset(flag_key, mapping=flag_data)
             await redis_client.sadd(self.flag_list_key, key)
+            await self._publish_change(key, flag_data)
             
             logger.info(f"Set feature flag {key} to {enabled}")
             return True
@@ -40,10 +154,11 @@ class FeatureFlagManager:
     async def is_enabled(self, key: str) -> bool:
         """Check if a feature flag is enabled"""
         try:
-            flag_key = f"{self.flag_prefix}{key}"
-            redis_client = await redis.get_client()
-            enabled = await redis_client.hget(flag_key, 'enabled')
-            return enabled == 'true' if enabled else False
+            snapshot = await self._get_snapshot()
+            if snapshot is None:
+                return False
+            self.stats['hits'] += 1
+            return snapshot.get(key, {}).get('enabled') == 'true'
         except Exception as e:
             logger.error(f"Failed to check feature flag {key}: {e}")
             # Return False by default if Redis is unavailable
@@ -68,6 +183,7 @@ class FeatureFlagManager:
             deleted = await redis_client.delete(flag_key)
             if deleted:
                 await redis_client.srem(self.flag_list_key, key)
+                await self._publish_change(key, None)
                 logger.info(f"Deleted feature flag: {key}")
                 return True
             return False
@@ -148,6 +264,10 @@ async def get_flag_details(key: str) -> Optional[Dict[str, str]]:
     return await get_flag_manager().get_flag(key)
 
 
+def get_cache_stats() -> Dict[str, int]:
+    return get_flag_manager().cache_stats()
+
+
 # Feature Flags
 
 # Custom agents feature flag
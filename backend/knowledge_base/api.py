@@ -5,6 +5,7 @@ from pydantic import BaseModel, Field, HttpUrl
 from utils.auth_utils import get_current_user_id_from_jwt, verify_agent_access
 from services.supabase import DBConnection
 from knowledge_base.file_processor import FileProcessor
+from knowledge_base.retrieval import store_entry_chunks
 from utils.logger import logger
 from flags.flags import is_enabled
 
@@ -159,6 +160,10 @@ async def create_agent_knowledge_base_entry(
             raise HTTPException(status_code=500, detail="Failed to create agent knowledge base entry")
         
         created_entry = result.data[0]
+        try:
+            await store_entry_chunks(client, created_entry['entry_id'], agent_id, created_entry['content'])
+        except Exception as e:
+            logger.warning(f"Failed to store chunks for knowledge base entry {created_entry['entry_id']}: {str(e)}")
         
         return KnowledgeBaseEntryResponse(
             entry_id=created_entry['entry_id'],
@@ -288,6 +293,12 @@ async def update_knowledge_base_entry(
         
         updated_entry = result.data[0]
         
+        if 'content' in update_data:
+            try:
+                await store_entry_chunks(client, entry_id, agent_id, updated_entry['content'])
+            except Exception as e:
+                logger.warning(f"Failed to store chunks for knowledge base entry {entry_id}: {str(e)}")
+        
         logger.info(f"Updated agent knowledge base entry {entry_id} for agent {agent_id}")
         
         return KnowledgeBaseEntryResponse(
@@ -470,7 +481,7 @@ async def process_file_background(
         }).execute()
         
         result = await processor.process_file_upload(
-            agent_id, account_id, file_content, filename, mime_type
+            agent_id, account_id, file_content, filename, mime_type, job_id=job_id
         )
         
         if result['success']:
@@ -478,8 +489,8 @@ async def process_file_background(
                 'p_job_id': job_id,
                 'p_status': 'completed',
                 'p_result_info': result,
-                'p_entries_created': 1,
-                'p_total_files': 1
+                'p_entries_created': result.get('entries_created', 1),
+                'p_total_files': result.get('total_files', 1)
             }).execute()
         else:
             await client.rpc('update_agent_kb_job_status', {
@@ -6,9 +6,11 @@ import shutil
 import asyncio
 import subprocess
 import re
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
 from pathlib import Path
 import mimetypes
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import chardet
 
 import PyPDF2
@@ -16,6 +18,31 @@ import docx
 
 from utils.logger import logger
 from services.supabase import DBConnection
+from knowledge_base.retrieval import store_entry_chunks, chunk_rows, insert_chunk_rows
+
+# Files extracted concurrently per ingestion, bounding how many decompressed files are held in memory
+EXTRACTION_CONCURRENCY = max(2, (os.cpu_count() or 1) * 2)
+INSERT_BATCH_SIZE = 50
+
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Process pool for CPU-bound content extraction (PDF/DOCX parsing, encoding detection)."""
+    global _extraction_pool
+    if _extraction_pool is None:
+        # spawn: forking a process that runs an event loop and client threads is unsafe
+        _extraction_pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _extraction_pool
+
+
+def extract_file_content(file_content: bytes, filename: str, mime_type: str) -> str:
+    """Process pool entry point for FileProcessor content extraction."""
+    return FileProcessor.extract_content(file_content, filename, mime_type)
+
 
 class FileProcessor:
     SUPPORTED_TEXT_EXTENSIONS = {
@@ -39,7 +66,8 @@ class FileProcessor:
         account_id: str, 
         file_content: bytes, 
         filename: str, 
-        mime_type: str
+        mime_type: str,
+        job_id: Optional[str] = None
     ) -> Dict[str, Any]:
         try:
             file_size = len(file_content)
@@ -49,7 +77,7 @@ class FileProcessor:
             file_extension = Path(filename).suffix.lower()
 
             if file_extension == '.zip':
-                return await self._process_zip_file(agent_id, account_id, file_content, filename)
+                return await self._process_zip_file(agent_id, account_id, file_content, filename, job_id)
             
             content = await self._extract_file_content(file_content, filename, mime_type)
             
@@ -82,12 +110,16 @@ class FileProcessor:
             if not result.data:
                 raise Exception("Failed to create knowledge base entry")
             
+            await self._store_chunks(client, result.data[0])
+            
             return {
                 'success': True,
                 'entry_id': result.data[0]['entry_id'],
                 'filename': filename,
                 'content_length': len(content),
-                'extraction_method': entry_data['source_metadata']['extraction_method']
+                'extraction_method': entry_data['source_metadata']['extraction_method'],
+                'entries_created': 1,
+                'total_files': 1
             }
             
         except Exception as e:
@@ -103,7 +135,8 @@ class FileProcessor:
         agent_id: str, 
         account_id: str, 
         zip_content: bytes, 
-        zip_filename: str
+        zip_filename: str,
+        job_id: Optional[str] = None
     ) -> Dict[str, Any]:
         try:
             client = await self.db.client
@@ -129,72 +162,53 @@ class FileProcessor:
             
             zip_result = await client.table('agent_knowledge_base_entries').insert(zip_entry_data).execute()
             zip_entry_id = zip_result.data[0]['entry_id']
-            
-            extracted_files = []
-            failed_files = []
+            await self._store_chunks(client, zip_result.data[0])
             
             with zipfile.ZipFile(io.BytesIO(zip_content), 'r') as zip_ref:
-                file_list = zip_ref.namelist()
+                members = [info for info in zip_ref.infolist() if not info.is_dir() and os.path.basename(info.filename)]
                 
-                if len(file_list) > self.MAX_ZIP_ENTRIES:
-                    raise ValueError(f"ZIP contains too many files: {len(file_list)} (max: {self.MAX_ZIP_ENTRIES})")
+                if len(members) > self.MAX_ZIP_ENTRIES:
+                    raise ValueError(f"ZIP contains too many files: {len(members)} (max: {self.MAX_ZIP_ENTRIES})")
                 
-                for file_path in file_list:
-                    if file_path.endswith('/'):
-                        continue
-                    
-                    try:
-                        file_content = zip_ref.read(file_path)
-                        filename = os.path.basename(file_path)
-                        
-                        if not filename:
-                            continue
-                        
+                def sources():
+                    for info in members:
+                        filename = os.path.basename(info.filename)
                         mime_type, _ = mimetypes.guess_type(filename)
-                        if not mime_type:
-                            mime_type = 'application/octet-stream'
-                        
-                        content = await self._extract_file_content(file_content, filename, mime_type)
-                        
-                        if content and content.strip():
-                            extracted_entry_data = {
-                                'agent_id': agent_id,
-                                'account_id': account_id,
-                                'name': f"📄 {filename}",
-                                'description': f"Extracted from {zip_filename}: {file_path}",
-                                'content': content[:self.MAX_CONTENT_LENGTH],
-                                'source_type': 'zip_extracted',
-                                'source_metadata': {
-                                    'filename': filename,
-                                    'original_path': file_path,
-                                    'zip_filename': zip_filename,
-                                    'mime_type': mime_type,
-                                    'file_size': len(file_content),
-                                    'extraction_method': self._get_extraction_method(Path(filename).suffix.lower(), mime_type)
-                                },
-                                'file_size': len(file_content),
-                                'file_mime_type': mime_type,
-                                'extracted_from_zip_id': zip_entry_id,
-                                'usage_context': 'always',
-                                'is_active': True
-                            }
-                            
-                            extracted_result = await client.table('agent_knowledge_base_entries').insert(extracted_entry_data).execute()
-                            
-                            extracted_files.append({
-                                'filename': filename,
-                                'path': file_path,
-                                'entry_id': extracted_result.data[0]['entry_id'],
-                                'content_length': len(content)
-                            })
-                        
-                    except Exception as e:
-                        logger.error(f"Error extracting {file_path} from ZIP: {str(e)}")
-                        failed_files.append({
-                            'filename': os.path.basename(file_path),
-                            'path': file_path,
-                            'error': str(e)
-                        })
+                        yield {
+                            'filename': filename,
+                            'path': info.filename,
+                            'mime_type': mime_type or 'application/octet-stream',
+                            # Members are decompressed one at a time, only when a pipeline slot is free
+                            'read': lambda info=info: zip_ref.read(info)
+                        }
+                
+                def build_entry(source: Dict[str, Any], content: str) -> Dict[str, Any]:
+                    filename, mime_type = source['filename'], source['mime_type']
+                    return {
+                        'agent_id': agent_id,
+                        'account_id': account_id,
+                        'name': f"📄 {filename}",
+                        'description': f"Extracted from {zip_filename}: {source['path']}",
+                        'content': content[:self.MAX_CONTENT_LENGTH],
+                        'source_type': 'zip_extracted',
+                        'source_metadata': {
+                            'filename': filename,
+                            'original_path': source['path'],
+                            'zip_filename': zip_filename,
+                            'mime_type': mime_type,
+                            'file_size': source['size'],
+                            'extraction_method': self._get_extraction_method(Path(filename).suffix.lower(), mime_type)
+                        },
+                        'file_size': source['size'],
+                        'file_mime_type': mime_type,
+                        'extracted_from_zip_id': zip_entry_id,
+                        'usage_context': 'always',
+                        'is_active': True
+                    }
+                
+                extracted_files, failed_files = await self._ingest_files(
+                    client, sources(), build_entry, job_id, total_files=len(members)
+                )
             
             return {
                 'success': True,
@@ -203,7 +217,9 @@ class FileProcessor:
                 'extracted_files': extracted_files,
                 'failed_files': failed_files,
                 'total_extracted': len(extracted_files),
-                'total_failed': len(failed_files)
+                'total_failed': len(failed_files),
+                'entries_created': len(extracted_files) + 1,
+                'total_files': len(members)
             }
             
         except Exception as e:
@@ -221,7 +237,8 @@ class FileProcessor:
         git_url: str,
         branch: str = 'main',
         include_patterns: List[str] = None,
-        exclude_patterns: List[str] = None
+        exclude_patterns: List[str] = None,
+        job_id: Optional[str] = None
     ) -> Dict[str, Any]:
         if include_patterns is None:
             include_patterns = ['*.txt', '*.pdf', '*.docx']
@@ -266,75 +283,65 @@ class FileProcessor:
             
             repo_result = await client.table('agent_knowledge_base_entries').insert(repo_entry_data).execute()
             repo_entry_id = repo_result.data[0]['entry_id']
+            await self._store_chunks(client, repo_result.data[0])
             
-            processed_files = []
-            failed_files = []
-            
-            for root, dirs, files in os.walk(temp_dir):
-                if '.git' in dirs:
-                    dirs.remove('.git')
-                
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, temp_dir)
-                    
-                    if not self._should_include_file(relative_path, include_patterns, exclude_patterns):
-                        continue
+            def sources():
+                for root, dirs, files in os.walk(temp_dir):
+                    if '.git' in dirs:
+                        dirs.remove('.git')
                     
-                    try:
-                        with open(file_path, 'rb') as f:
-                            file_content = f.read()
+                    for file in files:
+                        file_path = os.path.join(root, file)
+                        relative_path = os.path.relpath(file_path, temp_dir)
                         
-                        if len(file_content) > self.MAX_FILE_SIZE:
+                        if not self._should_include_file(relative_path, include_patterns, exclude_patterns):
                             continue
                         
-                        mime_type, _ = mimetypes.guess_type(file)
-                        if not mime_type:
-                            mime_type = 'application/octet-stream'
-                        
-                        content = await self._extract_file_content(file_content, file, mime_type)
+                        try:
+                            if os.path.getsize(file_path) > self.MAX_FILE_SIZE:
+                                continue
+                        except OSError:
+                            continue
                         
-                        if content and content.strip():
-                            file_entry_data = {
-                                'agent_id': agent_id,
-                                'account_id': account_id,
-                                'name': f"📄 {file}",
-                                'description': f"From {repo_name}: {relative_path}",
-                                'content': content[:self.MAX_CONTENT_LENGTH],
-                                'source_type': 'git_repo',
-                                'source_metadata': {
-                                    'filename': file,
-                                    'relative_path': relative_path,
-                                    'git_url': git_url,
-                                    'branch': branch,
-                                    'repo_name': repo_name,
-                                    'mime_type': mime_type,
-                                    'file_size': len(file_content),
-                                    'extraction_method': self._get_extraction_method(Path(file).suffix.lower(), mime_type)
-                                },
-                                'file_size': len(file_content),
-                                'file_mime_type': mime_type,
-                                'extracted_from_zip_id': repo_entry_id,
-                                'usage_context': 'always',
-                                'is_active': True
-                            }
-                            
-                            file_result = await client.table('agent_knowledge_base_entries').insert(file_entry_data).execute()
-                            
-                            processed_files.append({
-                                'filename': file,
-                                'relative_path': relative_path,
-                                'entry_id': file_result.data[0]['entry_id'],
-                                'content_length': len(content)
-                            })
-                    
-                    except Exception as e:
-                        logger.error(f"Error processing {relative_path} from git repo: {str(e)}")
-                        failed_files.append({
+                        mime_type, _ = mimetypes.guess_type(file)
+                        yield {
                             'filename': file,
-                            'relative_path': relative_path,
-                            'error': str(e)
-                        })
+                            'path': relative_path,
+                            'mime_type': mime_type or 'application/octet-stream',
+                            'read': lambda file_path=file_path: Path(file_path).read_bytes()
+                        }
+            
+            def build_entry(source: Dict[str, Any], content: str) -> Dict[str, Any]:
+                file, mime_type = source['filename'], source['mime_type']
+                return {
+                    'agent_id': agent_id,
+                    'account_id': account_id,
+                    'name': f"📄 {file}",
+                    'description': f"From {repo_name}: {source['path']}",
+                    'content': content[:self.MAX_CONTENT_LENGTH],
+                    'source_type': 'git_repo',
+                    'source_metadata': {
+                        'filename': file,
+                        'relative_path': source['path'],
+                        'git_url': git_url,
+                        'branch': branch,
+                        'repo_name': repo_name,
+                        'mime_type': mime_type,
+                        'file_size': source['size'],
+                        'extraction_method': self._get_extraction_method(Path(file).suffix.lower(), mime_type)
+                    },
+                    'file_size': source['size'],
+                    'file_mime_type': mime_type,
+                    'extracted_from_zip_id': repo_entry_id,
+                    'usage_context': 'always',
+                    'is_active': True
+                }
+            
+            processed_files, failed_files = await self._ingest_files(client, sources(), build_entry, job_id)
+            for processed in processed_files:
+                processed['relative_path'] = processed.pop('path')
+            for failed in failed_files:
+                failed['relative_path'] = failed.pop('path')
             
             return {
                 'success': True,
@@ -345,7 +352,9 @@ class FileProcessor:
                 'processed_files': processed_files,
                 'failed_files': failed_files,
                 'total_processed': len(processed_files),
-                'total_failed': len(failed_files)
+                'total_failed': len(failed_files),
+                'entries_created': len(processed_files) + 1,
+                'total_files': len(processed_files) + len(failed_files)
             }
             
         except Exception as e:
@@ -360,18 +369,170 @@ class FileProcessor:
             if temp_dir and os.path.exists(temp_dir):
                 shutil.rmtree(temp_dir, ignore_errors=True)
     
+    async def _store_chunks(self, client, entry: Dict[str, Any]):
+        """Chunk a freshly inserted entry for retrieval; entries without chunks are chunked on first retrieval."""
+        try:
+            await store_entry_chunks(client, entry['entry_id'], entry['agent_id'], entry['content'])
+        except Exception as e:
+            logger.warning(f"Failed to store chunks for knowledge base entry {entry.get('entry_id')}: {str(e)}")
+    
+    async def _ingest_files(
+        self,
+        client,
+        sources: Iterator[Dict[str, Any]],
+        build_entry: Callable[[Dict[str, Any], str], Dict[str, Any]],
+        job_id: Optional[str] = None,
+        total_files: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Extract and store many files as a pipeline.
+        
+        Sources are read lazily, at most EXTRACTION_CONCURRENCY at a time, and
+        their content is extracted in the process pool. Extracted entries are
+        written with multi-row inserts of INSERT_BATCH_SIZE, and job progress is
+        reported after every batch. Each source provides 'filename', 'path',
+        'mime_type' and a 'read' callable returning the file bytes.
+        """
+        loop = asyncio.get_running_loop()
+        pool = get_extraction_pool()
+        slots = asyncio.Semaphore(EXTRACTION_CONCURRENCY)
+        results: asyncio.Queue = asyncio.Queue()
+        processed_files: List[Dict[str, Any]] = []
+        failed_files: List[Dict[str, Any]] = []
+        batch: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        
+        async def extract(source: Dict[str, Any]):
+            try:
+                file_content = await asyncio.to_thread(source['read'])
+                source['size'] = len(file_content)
+                content = await loop.run_in_executor(
+                    pool, extract_file_content, file_content, source['filename'], source['mime_type']
+                )
+                await results.put((source, content, None))
+            except Exception as e:
+                await results.put((source, None, e))
+            finally:
+                slots.release()
+        
+        async def produce():
+            tasks = set()
+            count = 0
+            try:
+                for source in sources:
+                    await slots.acquire()
+                    task = asyncio.create_task(extract(source))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    count += 1
+            finally:
+                await results.put(count)
+        
+        def record_failure(source: Dict[str, Any], error: Exception):
+            failed_files.append({
+                'filename': source['filename'],
+                'path': source['path'],
+                'error': str(error)
+            })
+        
+        async def flush():
+            if not batch:
+                return
+            pending = batch[:]
+            batch.clear()
+            try:
+                result = await client.table('agent_knowledge_base_entries').insert([entry for _, entry in pending]).execute()
+                inserted = list(zip([source for source, _ in pending], result.data))
+            except Exception as e:
+                # Isolate the failing rows instead of failing the whole batch
+                logger.warning(f"Batch insert of {len(pending)} knowledge base entries failed, inserting individually: {str(e)}")
+                inserted = []
+                for source, entry in pending:
+                    try:
+                        result = await client.table('agent_knowledge_base_entries').insert(entry).execute()
+                        inserted.append((source, result.data[0]))
+                    except Exception as row_error:
+                        logger.error(f"Error storing {source['path']}: {str(row_error)}")
+                        record_failure(source, row_error)
+            
+            rows = []
+            for source, entry in inserted:
+                processed_files.append({
+                    'filename': source['filename'],
+                    'path': source['path'],
+                    'entry_id': entry['entry_id'],
+                    'content_length': len(entry['content'])
+                })
+                rows.extend(chunk_rows(entry['entry_id'], entry['agent_id'], entry['content']))
+            try:
+                await insert_chunk_rows(client, rows)
+            except Exception as e:
+                logger.warning(f"Failed to store chunks for {len(inserted)} knowledge base entries: {str(e)}")
+            
+            await self._report_progress(client, job_id, processed_files, failed_files, total_files)
+        
+        producer = asyncio.create_task(produce())
+        expected = None
+        received = 0
+        while expected is None or received < expected:
+            item = await results.get()
+            if isinstance(item, int):
+                expected = item
+                continue
+            received += 1
+            source, content, error = item
+            if error is not None:
+                logger.error(f"Error extracting {source['path']}: {str(error)}")
+                record_failure(source, error)
+            elif content and content.strip():
+                batch.append((source, build_entry(source, content)))
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    await flush()
+        await producer
+        await flush()
+        
+        return processed_files, failed_files
+    
+    async def _report_progress(
+        self,
+        client,
+        job_id: Optional[str],
+        processed_files: List[Dict[str, Any]],
+        failed_files: List[Dict[str, Any]],
+        total_files: Optional[int]
+    ):
+        if not job_id:
+            return
+        try:
+            await client.rpc('update_agent_kb_job_status', {
+                'p_job_id': job_id,
+                'p_status': 'processing',
+                'p_result_info': {
+                    'processed_files': len(processed_files),
+                    'failed_files': len(failed_files),
+                    'total_files': total_files
+                },
+                'p_entries_created': len(processed_files),
+                'p_total_files': total_files
+            }).execute()
+        except Exception as e:
+            logger.warning(f"Failed to report progress for knowledge base job {job_id}: {str(e)}")
+    
     async def _extract_file_content(self, file_content: bytes, filename: str, mime_type: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_extraction_pool(), extract_file_content, file_content, filename, mime_type)
+    
+    @classmethod
+    def extract_content(cls, file_content: bytes, filename: str, mime_type: str) -> str:
         file_extension = Path(filename).suffix.lower()
         
         try:
-            if file_extension in self.SUPPORTED_TEXT_EXTENSIONS or mime_type.startswith('text/'):
-                return self._extract_text_content(file_content)
+            if file_extension in cls.SUPPORTED_TEXT_EXTENSIONS or mime_type.startswith('text/'):
+                return cls._extract_text_content(file_content)
             
             elif file_extension == '.pdf':
-                return self._extract_pdf_content(file_content)
+                return cls._extract_pdf_content(file_content)
             
             elif file_extension == '.docx':
-                return self._extract_docx_content(file_content)
+                return cls._extract_docx_content(file_content)
             
             else:
                 raise ValueError(f"Unsupported file format: {file_extension}. Only .txt, .pdf, and .docx files are supported.")
@@ -380,7 +541,8 @@ class FileProcessor:
             logger.error(f"Error extracting content from {filename}: {str(e)}")
             return f"Error extracting content: {str(e)}"
     
-    def _extract_text_content(self, file_content: bytes) -> str:
+    @classmethod
+    def _extract_text_content(cls, file_content: bytes) -> str:
         detected = chardet.detect(file_content)
         encoding = detected.get('encoding', 'utf-8')
         
@@ -389,9 +551,10 @@ class FileProcessor:
         except UnicodeDecodeError:
             raw_text = file_content.decode('utf-8', errors='replace')
         
-        return self._sanitize_content(raw_text)
+        return cls._sanitize_content(raw_text)
     
-    def _extract_pdf_content(self, file_content: bytes) -> str:
+    @classmethod
+    def _extract_pdf_content(cls, file_content: bytes) -> str:
         pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
         text_content = []
         
@@ -399,9 +562,10 @@ class FileProcessor:
             text_content.append(page.extract_text())
         
         raw_text = '\n\n'.join(text_content)
-        return self._sanitize_content(raw_text)
+        return cls._sanitize_content(raw_text)
     
-    def _extract_docx_content(self, file_content: bytes) -> str:
+    @classmethod
+    def _extract_docx_content(cls, file_content: bytes) -> str:
         doc = docx.Document(io.BytesIO(file_content))
         text_content = []
         
@@ -409,10 +573,11 @@ class FileProcessor:
             text_content.append(paragraph.text)
         
         raw_text = '\n'.join(text_content)
-        return self._sanitize_content(raw_text)
+        return cls._sanitize_content(raw_text)
     
     
-    def _sanitize_content(self, content: str) -> str:
+    @staticmethod
+    def _sanitize_content(content: str) -> str:
         if not content:
             return content
 
@@ -0,0 +1,311 @@
+"""
+Chunked BM25 retrieval for agent knowledge bases.
+
+Entries are split into chunks at ingest (`store_entry_chunks`) and stored in
+`agent_knowledge_base_chunks`. For each agent a BM25 inverted index over its
+active chunks is built in-process and reused until the agent's entries change.
+Instead of pasting whole entries into every system prompt, only the chunks
+most relevant to the latest user message are injected, within a token budget.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import math
+import re
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import logger
+
+# Tokens are estimated as characters / 4, like the knowledge base token triggers
+CHARS_PER_TOKEN = 4
+CHUNK_MAX_CHARS = 1200
+CHUNK_OVERLAP_CHARS = 150
+INSERT_BATCH_SIZE = 500
+FETCH_BATCH_SIZE = 1000
+MAX_CACHED_INDEXES = 128
+RETRIEVABLE_USAGE_CONTEXTS = ['always', 'contextual']
+
+CONTEXT_HEADER = "# AGENT KNOWLEDGE BASE\n\nThe following is your specialized knowledge base. Use this information as context when responding:"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in into is it its of on or that the their "
+    "there these this to was were what when where which who why will with you your".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords and single characters."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_MAX_CHARS, overlap_chars: int = CHUNK_OVERLAP_CHARS) -> List[str]:
+    """Split text into chunks of at most `max_chars`, packing whole paragraphs where possible.
+
+    Paragraphs longer than a chunk are split at whitespace, with consecutive
+    pieces overlapping by `overlap_chars` so facts on a boundary stay retrievable.
+    """
+    chunks: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + 2 + len(paragraph) <= max_chars:
+            current = f"{current}\n\n{paragraph}"
+            continue
+        if current:
+            chunks.append(current)
+            current = ""
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(" ", 0, max_chars)
+            if cut < max_chars // 2:
+                cut = max_chars
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[max(cut - overlap_chars, 1):].strip()
+        current = paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@dataclass
+class KnowledgeChunk:
+    entry_id: str
+    entry_name: str
+    chunk_index: int
+    content: str
+    tokens: int
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks, stored as an inverted index."""
+
+    def __init__(self, chunks: List[KnowledgeChunk], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+        for doc_id, chunk in enumerate(chunks):
+            terms = tokenize(f"{chunk.entry_name}\n{chunk.content}")
+            self.doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term].append((doc_id, tf))
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, top_k: int) -> List[Tuple[float, KnowledgeChunk]]:
+        """Return up to `top_k` chunks matching the query, best first."""
+        if not self.chunks or top_k <= 0:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_doc_length or 1)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(score, self.chunks[doc_id]) for doc_id, score in best]
+
+
+def select_chunks(index: BM25Index, query: Optional[str], top_k: int, max_tokens: int) -> List[KnowledgeChunk]:
+    """Pick the chunks to inject: the best BM25 matches within the token budget.
+
+    Without a query or any match, the first chunk of each entry is used instead,
+    most recent entries first.
+    """
+    candidates = [chunk for _, chunk in index.search(query, top_k)] if query else []
+    if not candidates:
+        candidates = [chunk for chunk in index.chunks if chunk.chunk_index == 0][:top_k]
+
+    selected: List[KnowledgeChunk] = []
+    used_tokens = 0
+    for chunk in candidates:
+        if used_tokens + chunk.tokens > max_tokens:
+            continue
+        selected.append(chunk)
+        used_tokens += chunk.tokens
+    return selected
+
+
+def format_context(chunks: List[KnowledgeChunk]) -> Optional[str]:
+    """Render selected chunks grouped by entry, in document order within each entry."""
+    if not chunks:
+        return None
+    by_entry: "OrderedDict[str, List[KnowledgeChunk]]" = OrderedDict()
+    for chunk in chunks:
+        by_entry.setdefault(chunk.entry_id, []).append(chunk)
+    sections = []
+    for entry_chunks in by_entry.values():
+        entry_chunks.sort(key=lambda c: c.chunk_index)
+        body = "\n\n[...]\n\n".join(c.content for c in entry_chunks)
+        sections.append(f"## {entry_chunks[0].entry_name}\n{body}")
+    return CONTEXT_HEADER + "\n\n" + "\n\n".join(sections)
+
+
+def chunk_rows(entry_id: str, agent_id: str, content: str) -> List[Dict[str, Any]]:
+    """Build the `agent_knowledge_base_chunks` rows of an entry."""
+    return [
+        {
+            'entry_id': entry_id,
+            'agent_id': agent_id,
+            'chunk_index': i,
+            'content': chunk,
+            'content_tokens': estimate_tokens(chunk),
+        }
+        for i, chunk in enumerate(chunk_text(content or ""))
+    ]
+
+
+async def insert_chunk_rows(client, rows: List[Dict[str, Any]]):
+    """Insert chunk rows with multi-row inserts of up to INSERT_BATCH_SIZE rows."""
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        await client.table('agent_knowledge_base_chunks').insert(rows[i:i + INSERT_BATCH_SIZE]).execute()
+
+
+async def store_entry_chunks(client, entry_id: str, agent_id: str, content: str) -> int:
+    """Replace the stored chunks of a knowledge base entry. Returns the number of chunks."""
+    rows = chunk_rows(entry_id, agent_id, content)
+    await client.table('agent_knowledge_base_chunks').delete().eq('entry_id', entry_id).execute()
+    await insert_chunk_rows(client, rows)
+    return len(rows)
+
+
+class KnowledgeBaseRetriever:
+    """Process-wide cache of per-agent BM25 indexes, rebuilt when the agent's entries change."""
+
+    def __init__(self, max_indexes: int = MAX_CACHED_INDEXES):
+        self.max_indexes = max_indexes
+        self._indexes: "OrderedDict[str, Tuple[str, BM25Index]]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _lock(self, agent_id: str) -> asyncio.Lock:
+        lock = self._locks.get(agent_id)
+        if lock is None:
+            lock = self._locks[agent_id] = asyncio.Lock()
+        return lock
+
+    async def _get_entries(self, client, agent_id: str) -> List[Dict[str, Any]]:
+        result = await client.table('agent_knowledge_base_entries') \
+            .select('entry_id, name, updated_at') \
+            .eq('agent_id', agent_id) \
+            .eq('is_active', True) \
+            .in_('usage_context', RETRIEVABLE_USAGE_CONTEXTS) \
+            .order('created_at', desc=True) \
+            .execute()
+        return result.data or []
+
+    async def _get_chunks(self, client, agent_id: str) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            result = await client.table('agent_knowledge_base_chunks') \
+                .select('entry_id, chunk_index, content, content_tokens') \
+                .eq('agent_id', agent_id) \
+                .order('chunk_id') \
+                .range(offset, offset + FETCH_BATCH_SIZE - 1) \
+                .execute()
+            if not result.data:
+                break
+            rows.extend(result.data)
+            if len(result.data) < FETCH_BATCH_SIZE:
+                break
+            offset += FETCH_BATCH_SIZE
+        return rows
+
+    async def _chunk_missing_entries(self, client, agent_id: str, entry_ids: List[str]) -> List[Dict[str, Any]]:
+        """Chunk entries ingested before chunking existed, persisting the chunks best-effort."""
+        result = await client.table('agent_knowledge_base_entries') \
+            .select('entry_id, content') \
+            .in_('entry_id', entry_ids) \
+            .execute()
+        rows = []
+        for entry in result.data or []:
+            rows.extend(chunk_rows(entry['entry_id'], agent_id, entry['content']))
+            try:
+                await store_entry_chunks(client, entry['entry_id'], agent_id, entry['content'])
+            except Exception as e:
+                logger.warning(f"Failed to store chunks for knowledge base entry {entry['entry_id']}: {e}")
+        return rows
+
+    async def get_index(self, client, agent_id: str) -> Optional[BM25Index]:
+        """Return the agent's index, rebuilding it only if its active entries changed."""
+        entries = await self._get_entries(client, agent_id)
+        if not entries:
+            return None
+        version = hashlib.sha1(
+            "|".join(f"{e['entry_id']}:{e.get('updated_at')}" for e in entries).encode()
+        ).hexdigest()
+
+        async with self._lock(agent_id):
+            cached = self._indexes.get(agent_id)
+            if cached and cached[0] == version:
+                self._indexes.move_to_end(agent_id)
+                return cached[1]
+
+            names = {e['entry_id']: e['name'] for e in entries}
+            order = {e['entry_id']: i for i, e in enumerate(entries)}
+            rows = [row for row in await self._get_chunks(client, agent_id) if row['entry_id'] in names]
+            missing = list(set(names) - {row['entry_id'] for row in rows})
+            if missing:
+                rows.extend(await self._chunk_missing_entries(client, agent_id, missing))
+
+            rows.sort(key=lambda row: (order[row['entry_id']], row['chunk_index']))
+            chunks = [
+                KnowledgeChunk(
+                    entry_id=row['entry_id'],
+                    entry_name=names[row['entry_id']],
+                    chunk_index=row['chunk_index'],
+                    content=row['content'],
+                    tokens=row.get('content_tokens') or estimate_tokens(row['content']),
+                )
+                for row in rows
+            ]
+            # Building a large index takes long enough to stall the event loop
+            index = await asyncio.to_thread(BM25Index, chunks)
+            self._indexes[agent_id] = (version, index)
+            self._indexes.move_to_end(agent_id)
+            while len(self._indexes) > self.max_indexes:
+                evicted_id, _ = self._indexes.popitem(last=False)
+                self._locks.pop(evicted_id, None)
+            logger.debug(f"Built knowledge base index for agent {agent_id}: {len(entries)} entries, {len(chunks)} chunks")
+            return index
+
+    async def build_context(self, client, agent_id: str, query: Optional[str], top_k: int, max_tokens: int) -> Optional[str]:
+        """Return the knowledge base context for a query, or None if nothing is selected."""
+        index = await self.get_index(client, agent_id)
+        if index is None:
+            return None
+        selected = select_chunks(index, query, top_k, max_tokens)
+        if not selected:
+            return None
+
+        try:
+            tokens_by_entry: Dict[str, int] = defaultdict(int)
+            for chunk in selected:
+                tokens_by_entry[chunk.entry_id] += chunk.tokens
+            await client.table('agent_knowledge_base_usage_log').insert([
+                {'entry_id': entry_id, 'agent_id': agent_id, 'usage_type': 'context_injection', 'tokens_used': tokens}
+                for entry_id, tokens in tokens_by_entry.items()
+            ]).execute()
+        except Exception as e:
+            logger.warning(f"Failed to log knowledge base usage for agent {agent_id}: {e}")
+
+        return format_context(selected)
+
+
+knowledge_base_retriever = KnowledgeBaseRetriever()
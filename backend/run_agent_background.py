@@ -14,10 +14,15 @@ import dramatiq
 import uuid
 from agentpress.thread_manager import ThreadManager
 from services.supabase import DBConnection
+from services import postgres
 from services import redis
 from dramatiq.brokers.redis import RedisBroker
 import os
 from services.langfuse import langfuse
+from services.response_stream import (
+    use_response_streams, append_stream_control, get_all_responses,
+    expire_responses, ResponsePublisher,
+)
 from utils.retry import retry
 
 import sentry_sdk
@@ -52,6 +57,54 @@ async def check_health(key: str):
     structlog.contextvars.clear_contextvars()
     await redis.set(key, "healthy", ex=redis.REDIS_KEY_TTL)
 
+@dramatiq.actor
+async def reconcile_usage_ledger(account_id: str, period_start: Optional[str] = None):
+    """Recompute an account's monthly usage ledger entry from its messages."""
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(account_id=account_id)
+    await initialize()
+    from services.usage_ledger import reconcile_account
+    period = datetime.fromisoformat(period_start).date() if period_start else None
+    client = await db.client
+    await reconcile_account(client, account_id, period)
+
+@dramatiq.actor
+async def replenish_sandbox_pool():
+    """Top the warm sandbox pool back up to its configured size."""
+    structlog.contextvars.clear_contextvars()
+    await initialize()
+    from sandbox.warm_pool import replenish
+    await replenish()
+
+@dramatiq.actor
+async def process_trigger_webhook(
+    trigger_id: str,
+    event_id: str,
+    event_key: str,
+    event_ttl: int,
+    raw_data: Dict[str, Any],
+    trigger_type: Optional[str] = None,
+    context: Optional[Dict[str, Any]] = None,
+    attempt: int = 0,
+):
+    """Process a trigger event queued by the webhook intake, re-enqueueing it while it can't be admitted."""
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(trigger_id=trigger_id, trigger_event_id=event_id)
+    await initialize()
+    from triggers.intake import process_trigger_event
+    delay = await process_trigger_event(
+        db, trigger_id, event_id, event_key, event_ttl, raw_data,
+        trigger_type=trigger_type, context=context, attempt=attempt,
+    )
+    if delay is not None:
+        process_trigger_webhook.send_with_options(
+            kwargs=dict(
+                trigger_id=trigger_id, event_id=event_id, event_key=event_key, event_ttl=event_ttl,
+                raw_data=raw_data, trigger_type=trigger_type, context=context, attempt=attempt + 1,
+            ),
+            delay=delay,
+        )
+
 @dramatiq.actor
 async def run_agent_background(
     agent_run_id: str,
@@ -142,12 +195,29 @@ async def run_agent_background(
     stop_signal_received = False
 
     # Define Redis keys and channels
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    response_channel = f"agent_run:{agent_run_id}:new_response"
     instance_control_channel = f"agent_run:{agent_run_id}:control:{instance_id}"
     global_control_channel = f"agent_run:{agent_run_id}:control"
     instance_active_key = f"active_run:{instance_id}:{agent_run_id}"
 
+    # Runs keep the transport chosen at start: a Redis Stream (one XADD per response) or list + pub/sub
+    use_streams = False
+    try:
+        use_streams = await use_response_streams()
+    except Exception as e:
+        logger.warning(f"Failed to check response stream flag, using list transport: {e}")
+
+    # Ordered, batched writer: coalesces responses into pipelined writes with bounded in-flight depth
+    publisher = ResponsePublisher(agent_run_id, use_streams)
+
+    async def publish_response(response_json: str):
+        await publisher.publish(response_json)
+        await publisher.flush()
+
+    async def publish_control(signal: str):
+        if use_streams:
+            await append_stream_control(agent_run_id, signal)
+        await redis.publish(global_control_channel, signal)
+
     async def check_for_stop_signal():
         nonlocal stop_signal_received
         if not pubsub: return
@@ -204,7 +274,7 @@ async def run_agent_background(
         final_status = "running"
         error_message = None
 
-        pending_redis_operations = []
+        publisher.start()
 
         async for response in agent_gen:
             if stop_signal_received:
@@ -213,10 +283,9 @@ async def run_agent_background(
                 trace.span(name="agent_run_stopped").end(status_message="agent_run_stopped", level="WARNING")
                 break
 
-            # Store response in Redis list and publish notification
+            # Queue response for the publisher; blocks only if too many responses are pending
             response_json = json.dumps(response)
-            pending_redis_operations.append(asyncio.create_task(redis.rpush(response_list_key, response_json)))
-            pending_redis_operations.append(asyncio.create_task(redis.publish(response_channel, "new")))
+            await publisher.publish(response_json)
             total_responses += 1
 
             # Check for agent-signaled completion or error
@@ -236,12 +305,11 @@ async def run_agent_background(
              logger.info(f"Agent run {agent_run_id} completed normally (duration: {duration:.2f}s, responses: {total_responses})")
              completion_message = {"type": "status", "status": "completed", "message": "Agent run completed successfully"}
              trace.span(name="agent_run_completed").end(status_message="agent_run_completed")
-             await redis.rpush(response_list_key, json.dumps(completion_message))
-             await redis.publish(response_channel, "new") # Notify about the completion message
+             await publish_response(json.dumps(completion_message)) # Store and notify about the completion message
 
         # Fetch final responses from Redis for DB update
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        await publisher.flush()
+        all_responses = await get_all_responses(agent_run_id)
 
         # Update DB status
         await update_agent_run_status(client, agent_run_id, final_status, error=error_message)
@@ -249,7 +317,7 @@ async def run_agent_background(
         # Publish final control signal (END_STREAM or ERROR)
         control_signal = "END_STREAM" if final_status == "completed" else "ERROR" if final_status == "failed" else "STOP"
         try:
-            await redis.publish(global_control_channel, control_signal)
+            await publish_control(control_signal)
             # No need to publish to instance channel as the run is ending on this instance
             logger.debug(f"Published final control signal '{control_signal}' to {global_control_channel}")
         except Exception as e:
@@ -266,16 +334,14 @@ async def run_agent_background(
         # Push error message to Redis list
         error_response = {"type": "status", "status": "error", "message": error_message}
         try:
-            await redis.rpush(response_list_key, json.dumps(error_response))
-            await redis.publish(response_channel, "new")
+            await publish_response(json.dumps(error_response))
         except Exception as redis_err:
              logger.error(f"Failed to push error response to Redis for {agent_run_id}: {redis_err}")
 
         # Fetch final responses (including the error)
         all_responses = []
         try:
-             all_responses_json = await redis.lrange(response_list_key, 0, -1)
-             all_responses = [json.loads(r) for r in all_responses_json]
+             all_responses = await get_all_responses(agent_run_id)
         except Exception as fetch_err:
              logger.error(f"Failed to fetch responses from Redis after error for {agent_run_id}: {fetch_err}")
              all_responses = [error_response] # Use the error message we tried to push
@@ -285,7 +351,7 @@ async def run_agent_background(
 
         # Publish ERROR signal
         try:
-            await redis.publish(global_control_channel, "ERROR")
+            await publish_control("ERROR")
             logger.debug(f"Published ERROR signal to {global_control_channel}")
         except Exception as e:
             logger.warning(f"Failed to publish ERROR signal: {str(e)}")
@@ -307,6 +373,9 @@ async def run_agent_background(
             except Exception as e:
                 logger.warning(f"Error closing pubsub for {agent_run_id}: {str(e)}")
 
+        # Flush responses still queued in the publisher, with timeout
+        await publisher.close(timeout=30.0)
+
         # Set TTL on the response list in Redis
         await _cleanup_redis_response_list(agent_run_id)
 
@@ -316,12 +385,6 @@ async def run_agent_background(
         # Clean up the run lock
         await _cleanup_redis_run_lock(agent_run_id)
 
-        # Wait for all pending redis operations to complete, with timeout
-        try:
-            await asyncio.wait_for(asyncio.gather(*pending_redis_operations), timeout=30.0)
-        except asyncio.TimeoutError:
-            logger.warning(f"Timeout waiting for pending Redis operations for {agent_run_id}")
-
         logger.info(f"Agent run background task fully completed for: {agent_run_id} (Instance: {instance_id}) with final status: {final_status}")
 
 async def _cleanup_redis_instance_key(agent_run_id: str):
@@ -351,13 +414,12 @@ async def _cleanup_redis_run_lock(agent_run_id: str):
 REDIS_RESPONSE_LIST_TTL = 3600 * 24
 
 async def _cleanup_redis_response_list(agent_run_id: str):
-    """Set TTL on the Redis response list."""
-    response_list_key = f"agent_run:{agent_run_id}:responses"
+    """Set TTL on the Redis response list or stream."""
     try:
-        await redis.expire(response_list_key, REDIS_RESPONSE_LIST_TTL)
-        logger.debug(f"Set TTL ({REDIS_RESPONSE_LIST_TTL}s) on response list: {response_list_key}")
+        await expire_responses(agent_run_id, REDIS_RESPONSE_LIST_TTL)
+        logger.debug(f"Set TTL ({REDIS_RESPONSE_LIST_TTL}s) on responses for agent run: {agent_run_id}")
     except Exception as e:
-        logger.warning(f"Failed to set TTL on response list {response_list_key}: {str(e)}")
+        logger.warning(f"Failed to set TTL on responses for agent run {agent_run_id}: {str(e)}")
 
 async def update_agent_run_status(
     client,
@@ -383,6 +445,16 @@ async def update_agent_run_status(
         # Retry up to 3 times
         for retry in range(3):
             try:
+                pool = await postgres.get_pool()
+                if pool is not None:
+                    # A single UPDATE ... RETURNING, which doubles as the verification
+                    stored = await postgres.update_agent_run_status(pool, agent_run_id, status, error)
+                    if stored:
+                        logger.info(f"Updated agent run {agent_run_id}: status={stored.get('status')}, completed_at={stored.get('completed_at')} (retry {retry})")
+                        return True
+                    logger.error(f"Agent run {agent_run_id} not found while updating status to '{status}'")
+                    return False
+
                 update_result = await client.table('agent_runs').update(update_data).eq("id", agent_run_id).execute()
 
                 if hasattr(update_result, 'data') and update_result.data:
@@ -0,0 +1,156 @@
+"""
+Process-wide pool of resolved sandbox handles.
+
+Resolving the sandbox of a project takes a `projects` query plus a Daytona
+`get` (and a start when the sandbox was stopped or archived). Every sandbox tool
+of every agent run used to do this on its first call. The pool resolves each
+project's sandbox once and shares the handle across tools and runs:
+
+- Handles are keyed by project_id and fully re-resolved after `HANDLE_TTL`.
+- A handle not checked for `REVALIDATE_INTERVAL` is revalidated with
+  `get_or_start_sandbox`, which restarts a sandbox that auto-stopped meanwhile.
+- Resolution is single-flight: concurrent callers for the same project await
+  the same task, so parallel tool calls never create or start a sandbox twice.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from daytona_sdk import AsyncSandbox
+from sandbox.sandbox import get_or_start_sandbox, create_sandbox, delete_sandbox
+from sandbox.warm_pool import claim_sandbox
+from utils.logger import logger
+
+HANDLE_TTL = 30 * 60
+REVALIDATE_INTERVAL = 60
+MAX_HANDLES = 1000
+
+
+@dataclass
+class SandboxHandle:
+    """A resolved, started sandbox of a project."""
+    project_id: str
+    sandbox_id: str
+    sandbox_pass: Optional[str]
+    sandbox: AsyncSandbox
+    resolved_at: float = field(default_factory=time.monotonic)
+    validated_at: float = field(default_factory=time.monotonic)
+
+
+class SandboxHandlePool:
+    """LRU of sandbox handles keyed by project_id with single-flight resolution."""
+
+    def __init__(self, ttl: float = HANDLE_TTL, revalidate_interval: float = REVALIDATE_INTERVAL, max_handles: int = MAX_HANDLES):
+        self.ttl = ttl
+        self.revalidate_interval = revalidate_interval
+        self.max_handles = max_handles
+        self._handles: "OrderedDict[str, SandboxHandle]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get(self, client, project_id: str) -> SandboxHandle:
+        """Return a started sandbox handle for the project, resolving or creating it if needed."""
+        handle = self._handles.get(project_id)
+        now = time.monotonic()
+        if handle is not None and now - handle.resolved_at < self.ttl and now - handle.validated_at < self.revalidate_interval:
+            self._handles.move_to_end(project_id)
+            return handle
+
+        task = self._inflight.get(project_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(client, project_id, handle))
+            self._inflight[project_id] = task
+            task.add_done_callback(lambda t: self._inflight.pop(project_id, None) if self._inflight.get(project_id) is t else None)
+        # Shield so a cancelled caller doesn't cancel the resolution other callers are waiting on
+        return await asyncio.shield(task)
+
+    def invalidate(self, project_id: str):
+        """Forget the handle of a project, e.g. after its sandbox was deleted or replaced."""
+        self._handles.pop(project_id, None)
+
+    def _store(self, handle: SandboxHandle):
+        self._handles[handle.project_id] = handle
+        self._handles.move_to_end(handle.project_id)
+        while len(self._handles) > self.max_handles:
+            self._handles.popitem(last=False)
+
+    async def _refresh(self, client, project_id: str, handle: Optional[SandboxHandle]) -> SandboxHandle:
+        if handle is not None and time.monotonic() - handle.resolved_at < self.ttl:
+            try:
+                handle.sandbox = await get_or_start_sandbox(handle.sandbox_id)
+                handle.validated_at = time.monotonic()
+                self._handles.move_to_end(project_id)
+                return handle
+            except Exception as e:
+                logger.warning(f"Revalidating sandbox {handle.sandbox_id} for project {project_id} failed, re-resolving: {e}")
+                self.invalidate(project_id)
+
+        try:
+            handle = await self._resolve(client, project_id)
+        except Exception as e:
+            logger.error(f"Error retrieving/creating sandbox for project {project_id}: {str(e)}", exc_info=True)
+            raise e
+        self._store(handle)
+        return handle
+
+    async def _resolve(self, client, project_id: str) -> SandboxHandle:
+        """Look up the project's sandbox, creating and persisting one lazily if it has none."""
+        project = await client.table('projects').select('sandbox').eq('project_id', project_id).execute()
+        if not project.data or len(project.data) == 0:
+            raise ValueError(f"Project {project_id} not found")
+
+        sandbox_info = project.data[0].get('sandbox') or {}
+        if sandbox_info.get('id'):
+            sandbox = await get_or_start_sandbox(sandbox_info['id'])
+            return SandboxHandle(project_id, sandbox_info['id'], sandbox_info.get('pass'), sandbox)
+
+        logger.info(f"No sandbox recorded for project {project_id}; creating lazily")
+        claimed = await claim_sandbox(project_id)
+        if claimed:
+            sandbox_obj, sandbox_pass = claimed
+        else:
+            sandbox_pass = str(uuid.uuid4())
+            sandbox_obj = await create_sandbox(sandbox_pass, project_id)
+        sandbox_id = sandbox_obj.id
+
+        # Gather preview links and token (best-effort parsing)
+        try:
+            vnc_link = await sandbox_obj.get_preview_link(6080)
+            website_link = await sandbox_obj.get_preview_link(8080)
+            vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
+            website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
+            token = vnc_link.token if hasattr(vnc_link, 'token') else (str(vnc_link).split("token='")[1].split("'")[0] if "token='" in str(vnc_link) else None)
+        except Exception:
+            # If preview link extraction fails, still proceed but leave fields None
+            logger.warning(f"Failed to extract preview links for sandbox {sandbox_id}", exc_info=True)
+            vnc_url = None
+            website_url = None
+            token = None
+
+        # Persist sandbox metadata to project record
+        update_result = await client.table('projects').update({
+            'sandbox': {
+                'id': sandbox_id,
+                'pass': sandbox_pass,
+                'vnc_preview': vnc_url,
+                'sandbox_url': website_url,
+                'token': token
+            }
+        }).eq('project_id', project_id).execute()
+
+        if not update_result.data:
+            # Cleanup created sandbox if DB update failed
+            try:
+                await delete_sandbox(sandbox_id)
+            except Exception:
+                logger.error(f"Failed to delete sandbox {sandbox_id} after DB update failure", exc_info=True)
+            raise Exception("Database update failed when storing sandbox metadata")
+
+        sandbox = await get_or_start_sandbox(sandbox_id)
+        return SandboxHandle(project_id, sandbox_id, sandbox_pass, sandbox)
+
+
+sandbox_pool = SandboxHandlePool()
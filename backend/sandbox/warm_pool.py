@@ -0,0 +1,164 @@
+"""
+Warm pool of pre-created, unassigned sandboxes.
+
+Creating a sandbox (Daytona create plus starting supervisord) takes tens of
+seconds, which trigger and workflow sessions used to pay on every firing. With
+`SANDBOX_WARM_POOL_SIZE` > 0, sandboxes of the current snapshot are created
+ahead of time and parked in a Redis list per snapshot:
+
+- Sessions claim one with an atomic LPOP and fall back to creating a sandbox
+  when the pool is empty.
+- Every claim (and every miss) enqueues `replenish_sandbox_pool`, which tops
+  the pool back up under a lock, retires sandboxes parked for longer than
+  `MAX_PARKED_AGE` and drains pools of previous snapshots.
+- Parked sandboxes auto-stop like any other; a claimed one is started again by
+  `get_or_start_sandbox`, which is still much faster than creating one.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Optional, Set, Tuple
+
+from daytona_sdk import AsyncSandbox
+from services import redis
+from utils.config import config, Configuration
+from utils.logger import logger
+
+POOL_KEY_PREFIX = "sandbox_pool:"
+# Set of the pool keys that have held sandboxes, so pools of previous snapshots are found without KEYS
+POOL_KEYS_KEY = "sandbox_pools"
+REPLENISH_LOCK_TTL = 10 * 60
+REPLENISH_CONCURRENCY = 3
+# Parked sandboxes archive after 2h of inactivity (auto_archive_interval); restoring
+# an archived sandbox is about as slow as creating one, so retire them before
+MAX_PARKED_AGE = 90 * 60
+
+# The event loop only keeps weak references to tasks; hold background deletions until they finish
+_pending_deletes: Set[asyncio.Task] = set()
+
+
+def _pool_key(snapshot: Optional[str] = None) -> str:
+    return f"{POOL_KEY_PREFIX}{snapshot or Configuration.SANDBOX_SNAPSHOT_NAME}"
+
+
+def _is_expired(entry: dict) -> bool:
+    return time.time() - entry.get('created_at', 0) > MAX_PARKED_AGE
+
+
+def _schedule_replenish():
+    try:
+        from run_agent_background import replenish_sandbox_pool
+        replenish_sandbox_pool.send()
+    except Exception as e:
+        logger.warning(f"Failed to schedule sandbox pool replenishment: {e}")
+
+
+async def _delete_quietly(sandbox_id: str):
+    from sandbox.sandbox import delete_sandbox
+    try:
+        await delete_sandbox(sandbox_id)
+    except Exception:
+        pass
+
+
+def _schedule_delete(sandbox_id: str):
+    task = asyncio.create_task(_delete_quietly(sandbox_id))
+    _pending_deletes.add(task)
+    task.add_done_callback(_pending_deletes.discard)
+
+
+async def claim_sandbox(project_id: str) -> Optional[Tuple[AsyncSandbox, str]]:
+    """Take a started sandbox and its VNC password from the warm pool, or None when the pool is disabled or empty."""
+    if config.SANDBOX_WARM_POOL_SIZE <= 0:
+        return None
+
+    from sandbox.sandbox import get_or_start_sandbox
+
+    key = _pool_key()
+    try:
+        while True:
+            raw = await redis.lpop(key)
+            if raw is None:
+                logger.info(f"Sandbox warm pool {key} is empty")
+                return None
+
+            entry = json.loads(raw)
+            if _is_expired(entry):
+                _schedule_delete(entry['id'])
+                continue
+
+            try:
+                sandbox = await get_or_start_sandbox(entry['id'])
+            except Exception as e:
+                logger.warning(f"Discarding pooled sandbox {entry['id']}: {e}")
+                _schedule_delete(entry['id'])
+                continue
+
+            try:
+                await sandbox.set_labels({'id': project_id})
+            except Exception as e:
+                logger.debug(f"Failed to label pooled sandbox {entry['id']}: {e}")
+
+            logger.info(f"Claimed pooled sandbox {entry['id']} for project {project_id}")
+            return sandbox, entry['pass']
+    except Exception as e:
+        logger.warning(f"Failed to claim a pooled sandbox: {e}")
+        return None
+    finally:
+        _schedule_replenish()
+
+
+async def replenish(target_size: Optional[int] = None) -> int:
+    """Top the pool of the current snapshot up to its target size; returns how many sandboxes were created."""
+    target_size = config.SANDBOX_WARM_POOL_SIZE if target_size is None else target_size
+    lock_key = f"{_pool_key()}:replenish_lock"
+    if not await redis.set(lock_key, "1", nx=True, ex=REPLENISH_LOCK_TTL):
+        return 0
+
+    from sandbox.sandbox import create_sandbox
+
+    try:
+        key = _pool_key()
+        await _drain_stale_pools(key)
+        await redis.sadd(POOL_KEYS_KEY, key)
+
+        for raw in await redis.lrange(key, 0, -1):
+            entry = json.loads(raw)
+            if _is_expired(entry) and await redis.lrem(key, 1, raw):
+                await _delete_quietly(entry['id'])
+
+        missing = target_size - await redis.llen(key)
+        if missing <= 0:
+            return 0
+
+        semaphore = asyncio.Semaphore(REPLENISH_CONCURRENCY)
+
+        async def add_sandbox() -> bool:
+            async with semaphore:
+                sandbox_pass = str(uuid.uuid4())
+                try:
+                    sandbox = await create_sandbox(sandbox_pass)
+                except Exception as e:
+                    logger.error(f"Failed to create pooled sandbox: {e}")
+                    return False
+                await redis.rpush(key, json.dumps({'id': sandbox.id, 'pass': sandbox_pass, 'created_at': time.time()}))
+                return True
+
+        created = sum(await asyncio.gather(*(add_sandbox() for _ in range(missing))))
+        logger.info(f"Added {created} sandboxes to warm pool {key}")
+        return created
+    finally:
+        await redis.delete(lock_key)
+
+
+async def _drain_stale_pools(current: str):
+    """Delete the sandboxes parked in pools of other snapshots; only finds any after the snapshot changed."""
+    for key in await redis.smembers(POOL_KEYS_KEY):
+        if key == current:
+            continue
+        while (raw := await redis.lpop(key)) is not None:
+            await _delete_quietly(json.loads(raw)['id'])
+        await redis.srem(POOL_KEYS_KEY, key)
+        logger.info(f"Drained sandbox pool {key} of a previous snapshot")
@@ -5,12 +5,12 @@ stripe listen --forward-to localhost:8000/api/billing/webhook
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Request
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, List, Tuple
 import stripe
 from datetime import datetime, timezone, timedelta
 
 from supabase import Client as SupabaseClient
-from utils.cache import Cache
+from utils.cache import Cache, cached
 from utils.logger import logger
 from utils.config import config, EnvMode
 from services.supabase import DBConnection
@@ -237,139 +237,130 @@ async def create_stripe_customer(client, user_id: str, email: str) -> str:
     
     return customer.id
 
-async def get_user_subscription(user_id: str) -> Optional[Dict]:
-    """Get the current subscription for a user from Stripe."""
+def _billing_tags(*args) -> List[str]:
+    return [f"billing:{args[-1]}"]
+
+
+async def invalidate_billing_cache(account_id: str):
+    """Drop everything cached about an account's subscription, e.g. after a subscription webhook."""
     try:
-        result = await Cache.get(f"user_subscription:{user_id}")
-        if result:
-            return result
+        await Cache.invalidate_tag(f"billing:{account_id}")
+    except Exception as e:
+        logger.warning(f"Failed to invalidate billing cache for {account_id}: {str(e)}")
 
-        # Get customer ID
-        db = DBConnection()
-        client = await db.client
-        customer_id = await get_stripe_customer_id(client, user_id)
-        
-        if not customer_id:
-            await Cache.set(f"user_subscription:{user_id}", None, ttl=1 * 60)
-            return None
-            
-        # Get all active subscriptions for the customer
-        subscriptions = await stripe.Subscription.list_async(
-            customer=customer_id,
-            status='active'
-        )
-        # print("Found subscriptions:", subscriptions)
-        
-        # Check if we have any subscriptions
-        if not subscriptions or not subscriptions.get('data'):
-            await Cache.set(f"user_subscription:{user_id}", None, ttl=1 * 60)
-            return None
-            
-        # Filter subscriptions to only include our product's subscriptions
-        our_subscriptions = []
-        for sub in subscriptions['data']:
-            # Check if subscription items contain any of our price IDs
-            for item in sub.get('items', {}).get('data', []):
-                price_id = item.get('price', {}).get('id')
-                if price_id in [
-                    config.STRIPE_FREE_TIER_ID,
-                    config.STRIPE_TIER_2_20_ID, config.STRIPE_TIER_6_50_ID, config.STRIPE_TIER_12_100_ID,
-                    config.STRIPE_TIER_25_200_ID, config.STRIPE_TIER_50_400_ID, config.STRIPE_TIER_125_800_ID,
-                    config.STRIPE_TIER_200_1000_ID,
-                    # Yearly tiers
-                    config.STRIPE_TIER_2_20_YEARLY_ID, config.STRIPE_TIER_6_50_YEARLY_ID,
-                    config.STRIPE_TIER_12_100_YEARLY_ID, config.STRIPE_TIER_25_200_YEARLY_ID,
-                    config.STRIPE_TIER_50_400_YEARLY_ID, config.STRIPE_TIER_125_800_YEARLY_ID,
-                    config.STRIPE_TIER_200_1000_YEARLY_ID,
-                    # Yearly commitment tiers (monthly payments with 12-month commitment)
-                    config.STRIPE_TIER_2_17_YEARLY_COMMITMENT_ID,
-                    config.STRIPE_TIER_6_42_YEARLY_COMMITMENT_ID,
-                    config.STRIPE_TIER_25_170_YEARLY_COMMITMENT_ID
-                ]:
-                    our_subscriptions.append(sub)
-        
-        if not our_subscriptions:
-            await Cache.set(f"user_subscription:{user_id}", None, ttl=1 * 60)
-            return None
-            
-        # If there are multiple active subscriptions, we need to handle this
-        if len(our_subscriptions) > 1:
-            logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
-            
-            # Get the most recent subscription
-            most_recent = max(our_subscriptions, key=lambda x: x['created'])
-            
-            # Cancel all other subscriptions
-            for sub in our_subscriptions:
-                if sub['id'] != most_recent['id']:
-                    try:
-                        await stripe.Subscription.modify_async(
-                            sub['id'],
-                            cancel_at_period_end=True
-                        )
-                        logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
-            
-            return most_recent
 
-        result = our_subscriptions[0]
-        await Cache.set(f"user_subscription:{user_id}", result, ttl=1 * 60)
-        return result
-        
+async def get_user_subscription(user_id: str) -> Optional[Dict]:
+    """Get the current subscription for a user from Stripe."""
+    try:
+        return await _fetch_user_subscription(user_id)
     except Exception as e:
         logger.error(f"Error getting subscription from Stripe: {str(e)}")
         return None
 
-async def calculate_monthly_usage(client, user_id: str) -> float:
-    """Calculate total agent run minutes for the current month for a user."""
-    result = await Cache.get(f"monthly_usage:{user_id}")
-    if result:
-        return result
 
-    start_time = time.time()
+@cached("user_subscription", ttl=1 * 60, negative_ttl=1 * 60, tags=_billing_tags)
+async def _fetch_user_subscription(user_id: str) -> Optional[Dict]:
+    # Get customer ID
+    db = DBConnection()
+    client = await db.client
+    customer_id = await get_stripe_customer_id(client, user_id)
     
-    # Use get_usage_logs to fetch all usage data (it already handles the date filtering and batching)
-    total_cost = 0.0
-    page = 0
-    items_per_page = 1000
+    if not customer_id:
+        return None
+        
+    # Get all active subscriptions for the customer
+    subscriptions = await stripe.Subscription.list_async(
+        customer=customer_id,
+        status='active'
+    )
+    # print("Found subscriptions:", subscriptions)
     
-    while True:
-        # Get usage logs for this page
-        usage_result = await get_usage_logs(client, user_id, page, items_per_page)
+    # Check if we have any subscriptions
+    if not subscriptions or not subscriptions.get('data'):
+        return None
         
-        if not usage_result['logs']:
-            break
+    # Filter subscriptions to only include our product's subscriptions
+    our_subscriptions = []
+    for sub in subscriptions['data']:
+        # Check if subscription items contain any of our price IDs
+        for item in sub.get('items', {}).get('data', []):
+            price_id = item.get('price', {}).get('id')
+            if price_id in [
+                config.STRIPE_FREE_TIER_ID,
+                config.STRIPE_TIER_2_20_ID, config.STRIPE_TIER_6_50_ID, config.STRIPE_TIER_12_100_ID,
+                config.STRIPE_TIER_25_200_ID, config.STRIPE_TIER_50_400_ID, config.STRIPE_TIER_125_800_ID,
+                config.STRIPE_TIER_200_1000_ID,
+                # Yearly tiers
+                config.STRIPE_TIER_2_20_YEARLY_ID, config.STRIPE_TIER_6_50_YEARLY_ID,
+                config.STRIPE_TIER_12_100_YEARLY_ID, config.STRIPE_TIER_25_200_YEARLY_ID,
+                config.STRIPE_TIER_50_400_YEARLY_ID, config.STRIPE_TIER_125_800_YEARLY_ID,
+                config.STRIPE_TIER_200_1000_YEARLY_ID,
+                # Yearly commitment tiers (monthly payments with 12-month commitment)
+                config.STRIPE_TIER_2_17_YEARLY_COMMITMENT_ID,
+                config.STRIPE_TIER_6_42_YEARLY_COMMITMENT_ID,
+                config.STRIPE_TIER_25_170_YEARLY_COMMITMENT_ID
+            ]:
+                our_subscriptions.append(sub)
+    
+    if not our_subscriptions:
+        return None
         
-        # Sum up the estimated costs from this page
-        for log_entry in usage_result['logs']:
-            total_cost += log_entry['estimated_cost']
+    # If there are multiple active subscriptions, we need to handle this
+    if len(our_subscriptions) > 1:
+        logger.warning(f"User {user_id} has multiple active subscriptions: {[sub['id'] for sub in our_subscriptions]}")
         
-        # If there are no more pages, break
-        if not usage_result['has_more']:
-            break
-            
-        page += 1
-    
-    end_time = time.time()
-    execution_time = end_time - start_time
-    logger.info(f"Calculate monthly usage took {execution_time:.3f} seconds, total cost: {total_cost}")
-    
-    await Cache.set(f"monthly_usage:{user_id}", total_cost, ttl=2 * 60)
-    return total_cost
+        # Get the most recent subscription
+        most_recent = max(our_subscriptions, key=lambda x: x['created'])
+        
+        # Cancel all other subscriptions
+        for sub in our_subscriptions:
+            if sub['id'] != most_recent['id']:
+                try:
+                    await stripe.Subscription.modify_async(
+                        sub['id'],
+                        cancel_at_period_end=True
+                    )
+                    logger.info(f"Cancelled subscription {sub['id']} for user {user_id}")
+                except Exception as e:
+                    logger.error(f"Error cancelling subscription {sub['id']}: {str(e)}")
+        
+        return most_recent
 
+    return our_subscriptions[0]
 
-async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
-    """Get detailed usage logs for a user with pagination."""
-    # Get start of current month in UTC
-    now = datetime.now(timezone.utc)
+def get_usage_period_start(now: Optional[datetime] = None) -> datetime:
+    """Return the start of the current usage period (month) in UTC."""
+    now = now or datetime.now(timezone.utc)
     start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
     
     # Use fixed cutoff date: June 26, 2025 midnight UTC
     # Ignore all token counts before this date
     cutoff_date = datetime(2025, 6, 30, 9, 0, 0, tzinfo=timezone.utc)
     
-    start_of_month = max(start_of_month, cutoff_date)
+    return max(start_of_month, cutoff_date)
+
+
+async def calculate_monthly_usage(client, user_id: str) -> float:
+    """Calculate the LLM cost of the current month for a user.
+
+    Served from the monthly usage ledger. Only an account whose ledger entry has
+    never been reconciled this month pays for a full recomputation.
+    """
+    from services.usage_ledger import get_monthly_usage, reconcile_account
+
+    usage = await get_monthly_usage(client, user_id)
+    if usage is not None:
+        return usage
+
+    start_time = time.time()
+    total_cost = await reconcile_account(client, user_id)
+    logger.info(f"Calculate monthly usage took {time.time() - start_time:.3f} seconds, total cost: {total_cost}")
+    return total_cost
+
+
+async def get_usage_logs(client, user_id: str, page: int = 0, items_per_page: int = 1000) -> Dict:
+    """Get detailed usage logs for a user with pagination."""
+    start_of_month = get_usage_period_start()
     
     # First get all threads for this user in batches
     batch_size = 1000
@@ -543,6 +534,7 @@ def calculate_token_cost(prompt_tokens: int, completion_tokens: int, model: str)
         logger.error(f"Error calculating token cost for model {model}: {str(e)}")
         return 0.0
 
+@cached("allowed_models_for_user", ttl=1 * 60, key=lambda client, user_id: user_id, tags=_billing_tags)
 async def get_allowed_models_for_user(client, user_id: str):
     """
     Get the list of models allowed for a user based on their subscription tier.
@@ -551,10 +543,6 @@ async def get_allowed_models_for_user(client, user_id: str):
         List of model names allowed for the user's subscription tier.
     """
 
-    result = await Cache.get(f"allowed_models_for_user:{user_id}")
-    if result:
-        return result
-
     subscription = await get_user_subscription(user_id)
     tier_name = 'free'
     
@@ -571,9 +559,7 @@ async def get_allowed_models_for_user(client, user_id: str):
             tier_name = tier_info['name']
     
     # Return allowed models for this tier
-    result = MODEL_ACCESS_TIERS.get(tier_name, MODEL_ACCESS_TIERS['free'])  # Default to free tier if unknown
-    await Cache.set(f"allowed_models_for_user:{user_id}", result, ttl=1 * 60)
-    return result
+    return MODEL_ACCESS_TIERS.get(tier_name, MODEL_ACCESS_TIERS['free'])  # Default to free tier if unknown
 
 
 async def can_use_model(client, user_id: str, model_name: str):
@@ -1367,6 +1353,13 @@ async def stripe_webhook(request: Request):
                     ).eq('id', customer_id).execute()
                     logger.info(f"Webhook: Updated customer {customer_id} active status to FALSE after subscription deletion")
             
+            customer = await client.schema('basejump').from_('billing_customers') \
+                .select('account_id') \
+                .eq('id', customer_id) \
+                .execute()
+            for row in customer.data or []:
+                await invalidate_billing_cache(row['account_id'])
+            
             logger.info(f"Processed {event.type} event for customer {customer_id}")
         
         return {"status": "success"}
@@ -239,6 +239,11 @@ def prepare_params(
                 ]
                 cache_control_count += 1
             elif isinstance(content, list):
+                preset = sum(1 for item in content if isinstance(item, dict) and "cache_control" in item)
+                if preset:
+                    # The message placed its own breakpoints (e.g. ahead of a volatile trailing block)
+                    cache_control_count += preset
+                    continue
                 for item in content:
                     if cache_control_count >= max_cache_control_blocks:
                         break
@@ -0,0 +1,174 @@
+"""
+Optional direct Postgres path for the hottest queries.
+
+Everything else goes through the Supabase (PostgREST) client of `DBConnection`,
+where every query is an HTTP request with JSON encoding on both ends. With
+`DATABASE_URL` set and asyncpg installed, a per-process asyncpg pool serves:
+
+- message inserts (`ThreadManager.add_message` and the batched `add_messages`)
+- the LLM message range fetch of the message cache (`get_llm_messages`)
+- agent run status updates (`update_agent_run_status`), one round trip
+  instead of an update plus a verifying select
+- thread ownership lookups of `auth_utils`
+
+The queries are constants, so asyncpg prepares each of them once per pooled
+connection. That requires a direct or session-mode connection: Supabase's
+transaction pooler (port 6543) does not support prepared statements.
+
+Rows are returned as `to_jsonb(...)`, which formats UUIDs and timestamps the
+way PostgREST does, so callers get the same dicts from either path. When the
+pool is not configured or can't connect, the functions return None from
+`get_pool()` and callers use PostgREST.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.config import config
+from utils.logger import logger
+
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    asyncpg = None
+    ASYNCPG_AVAILABLE = False
+
+CONNECT_RETRY_INTERVAL = 60
+COMMAND_TIMEOUT = 30
+
+INSERT_MESSAGE = """
+    INSERT INTO messages (thread_id, type, content, is_llm_message, metadata, agent_id, agent_version_id)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+    RETURNING to_jsonb(messages.*)
+"""
+
+INSERT_MESSAGE_ROW = """
+    INSERT INTO messages (message_id, thread_id, type, content, is_llm_message, metadata, agent_id, agent_version_id, created_at, updated_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::text::timestamptz, $10::text::timestamptz)
+    ON CONFLICT (message_id) DO NOTHING
+"""
+
+FETCH_LLM_MESSAGES = """
+    SELECT jsonb_build_object('message_id', message_id, 'content', content, 'created_at', created_at)
+    FROM messages
+    WHERE thread_id = $1 AND is_llm_message = true
+      AND ($2::text IS NULL OR created_at >= $2::text::timestamptz)
+      AND NOT (message_id = ANY($3::uuid[]))
+    ORDER BY created_at
+"""
+
+UPDATE_AGENT_RUN_STATUS = """
+    UPDATE agent_runs
+    SET status = $2, completed_at = now(), error = coalesce($3, error)
+    WHERE id = $1
+    RETURNING jsonb_build_object('status', status, 'completed_at', completed_at)
+"""
+
+GET_THREAD_OWNERSHIP = """
+    SELECT jsonb_build_object('account_id', account_id, 'project_id', project_id)
+    FROM threads
+    WHERE thread_id = $1
+"""
+
+_pool: Optional["asyncpg.Pool"] = None
+_pool_lock: Optional[asyncio.Lock] = None
+_last_failure = 0.0
+_unavailable_logged = False
+
+
+async def _init_connection(connection):
+    for type_name in ('json', 'jsonb'):
+        await connection.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def get_pool() -> Optional["asyncpg.Pool"]:
+    """Return this process's pool, creating it on first use; None when the direct path is disabled or unreachable."""
+    global _pool, _pool_lock, _last_failure, _unavailable_logged
+
+    if _pool is not None:
+        return _pool
+    if not config.DATABASE_URL:
+        return None
+    if not ASYNCPG_AVAILABLE:
+        if not _unavailable_logged:
+            logger.warning("DATABASE_URL is set but asyncpg is not installed; using PostgREST for all queries")
+            _unavailable_logged = True
+        return None
+    if time.monotonic() - _last_failure < CONNECT_RETRY_INTERVAL:
+        return None
+
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is not None:
+            return _pool
+        try:
+            _pool = await asyncpg.create_pool(
+                config.DATABASE_URL,
+                min_size=config.DATABASE_POOL_MIN_SIZE,
+                max_size=config.DATABASE_POOL_MAX_SIZE,
+                command_timeout=COMMAND_TIMEOUT,
+                init=_init_connection,
+                server_settings={'application_name': 'suna-backend', 'timezone': 'UTC'},
+            )
+            logger.info(f"Created Postgres pool ({config.DATABASE_POOL_MIN_SIZE}-{config.DATABASE_POOL_MAX_SIZE} connections)")
+        except Exception as e:
+            _last_failure = time.monotonic()
+            logger.error(f"Failed to create Postgres pool, using PostgREST for {CONNECT_RETRY_INTERVAL}s: {e}")
+        return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        try:
+            await pool.close()
+        except Exception as e:
+            logger.warning(f"Error closing Postgres pool: {e}")
+
+
+async def insert_message(pool, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Insert a `messages` row built like ThreadManager.add_message's insert payload and return the stored row."""
+    return await pool.fetchval(
+        INSERT_MESSAGE,
+        data['thread_id'],
+        data['type'],
+        data['content'],
+        data['is_llm_message'],
+        data.get('metadata') or {},
+        data.get('agent_id'),
+        data.get('agent_version_id'),
+    )
+
+
+async def insert_message_rows(pool, rows: List[Dict[str, Any]]):
+    """Insert complete `messages` rows (ids and timestamps assigned by the caller) in one transaction; rows already stored are skipped."""
+    async with pool.acquire() as connection:
+        async with connection.transaction():
+            await connection.executemany(INSERT_MESSAGE_ROW, [
+                (
+                    row['message_id'], row['thread_id'], row['type'], row['content'], row['is_llm_message'],
+                    row.get('metadata') or {}, row.get('agent_id'), row.get('agent_version_id'),
+                    row['created_at'], row['updated_at'],
+                )
+                for row in rows
+            ])
+
+
+async def fetch_llm_messages(pool, thread_id: str, since: Optional[str] = None, exclude_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Return `message_id, content, created_at` of a thread's LLM messages (at or after `since`, except `exclude_ids`), oldest first."""
+    records = await pool.fetch(FETCH_LLM_MESSAGES, thread_id, since, exclude_ids or [])
+    return [record[0] for record in records]
+
+
+async def update_agent_run_status(pool, agent_run_id: str, status: str, error: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Set an agent run's status and completion time; returns the stored values, None if the run doesn't exist."""
+    return await pool.fetchval(UPDATE_AGENT_RUN_STATUS, agent_run_id, status, error)
+
+
+async def get_thread_ownership(pool, thread_id: str) -> Optional[Dict[str, Any]]:
+    return await pool.fetchval(GET_THREAD_OWNERSHIP, thread_id)
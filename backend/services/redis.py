@@ -3,7 +3,7 @@ import os
 from dotenv import load_dotenv
 import asyncio
 from utils.logger import logger
-from typing import List, Any
+from typing import List, Any, Optional
 from utils.retry import retry
 
 # Redis client and connection pool
@@ -166,6 +166,68 @@ async def lrange(key: str, start: int, end: int) -> List[str]:
     return await redis_client.lrange(key, start, end)
 
 
+async def lpop(key: str) -> Optional[str]:
+    """Remove and return the first element of a list."""
+    redis_client = await get_client()
+    return await redis_client.lpop(key)
+
+
+async def llen(key: str) -> int:
+    """Get the length of a list."""
+    redis_client = await get_client()
+    return await redis_client.llen(key)
+
+
+async def lrem(key: str, count: int, value: str) -> int:
+    """Remove occurrences of a value from a list."""
+    redis_client = await get_client()
+    return await redis_client.lrem(key, count, value)
+
+
+# Set operations
+async def sadd(key: str, *members: str) -> int:
+    """Add one or more members to a set."""
+    redis_client = await get_client()
+    return await redis_client.sadd(key, *members)
+
+
+async def smembers(key: str) -> set:
+    """Get all members of a set."""
+    redis_client = await get_client()
+    return await redis_client.smembers(key)
+
+
+async def srem(key: str, *members: str) -> int:
+    """Remove one or more members from a set."""
+    redis_client = await get_client()
+    return await redis_client.srem(key, *members)
+
+
+# Stream operations
+async def xadd(key: str, fields: dict, nomkstream: bool = False):
+    """Append an entry to a stream and return its ID."""
+    redis_client = await get_client()
+    return await redis_client.xadd(key, fields, nomkstream=nomkstream)
+
+
+async def xrange(key: str, min: str = "-", max: str = "+", count: int = None):
+    """Get a range of entries from a stream."""
+    redis_client = await get_client()
+    return await redis_client.xrange(key, min=min, max=max, count=count)
+
+
+async def xread(streams: dict, count: int = None, block: int = None):
+    """Read entries newer than the given IDs from one or more streams, optionally blocking."""
+    redis_client = await get_client()
+    return await redis_client.xread(streams, count=count, block=block)
+
+
+async def exists(*keys: str) -> int:
+    """Return how many of the given keys exist."""
+    redis_client = await get_client()
+    return await redis_client.exists(*keys)
+
+
 # Key management
 
 
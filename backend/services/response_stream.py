@@ -0,0 +1,249 @@
+"""
+Agent run response transport.
+
+Agent run responses are stored in Redis so that SSE clients can replay a run
+from the start and follow it live. Two transports are supported:
+
+- list (default): each response is RPUSHed to `agent_run:{id}:responses` and a
+  "new" notification is published on `agent_run:{id}:new_response`. Clients
+  subscribe and LRANGE from their last index on every notification.
+- stream (feature flag `redis_response_streams`): each response is XADDed to
+  `agent_run:{id}:stream`. Clients follow the run with a single blocking XREAD
+  from their last entry ID, which doubles as the SSE event id so reconnecting
+  clients can resume with `Last-Event-ID`. Control signals (END_STREAM, ERROR,
+  STOP) are written to the same stream, so no pub/sub connection is needed.
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from services import redis
+from services.supabase import DBConnection
+from flags.flags import is_enabled
+from utils.logger import logger
+
+RESPONSE_STREAMS_FLAG = "redis_response_streams"
+
+# Must stay below the Redis client socket timeout
+STREAM_BLOCK_MS = 10000
+STREAM_START_ID = "0-0"
+
+# Response publishing: responses arriving within this window are written in one pipelined round trip
+PUBLISH_BATCH_DELAY = 0.02
+PUBLISH_BATCH_MAX_ITEMS = 100
+PUBLISH_BATCH_MAX_BYTES = 256 * 1024
+# Maximum responses waiting to be written before publish() blocks the producer
+PUBLISH_MAX_PENDING = 1000
+PUBLISH_WRITE_RETRIES = 3
+
+
+def response_list_key(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:responses"
+
+
+def response_channel(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:new_response"
+
+
+def response_stream_key(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:stream"
+
+
+async def use_response_streams() -> bool:
+    """Whether new agent runs should publish their responses to a Redis Stream."""
+    return await is_enabled(RESPONSE_STREAMS_FLAG)
+
+
+async def run_uses_stream(agent_run_id: str) -> bool:
+    """Whether an existing agent run publishes to a Redis Stream rather than a list.
+
+    Runs keep the transport they started with, so a run that already has a
+    response list stays on the list transport even if the flag was enabled since.
+    """
+    if await redis.exists(response_stream_key(agent_run_id)):
+        return True
+    if await redis.exists(response_list_key(agent_run_id)):
+        return False
+    return await use_response_streams()
+
+
+async def append_stream_response(agent_run_id: str, response_json: str) -> str:
+    """Append a serialized response to the run's stream and return its entry ID."""
+    return await redis.xadd(response_stream_key(agent_run_id), {"data": response_json})
+
+
+async def append_stream_control(agent_run_id: str, signal: str):
+    """Write a control signal to the run's stream, if the run uses one."""
+    try:
+        await redis.xadd(response_stream_key(agent_run_id), {"control": signal}, nomkstream=True)
+    except Exception as e:
+        logger.warning(f"Failed to write control signal {signal} to stream for {agent_run_id}: {e}")
+
+
+async def get_all_responses(agent_run_id: str) -> List[Dict[str, Any]]:
+    """Return every stored response of a run, whichever transport it uses."""
+    stream_entries = await redis.xrange(response_stream_key(agent_run_id))
+    if stream_entries:
+        return [json.loads(fields["data"]) for _, fields in stream_entries if "data" in fields]
+    return [json.loads(r) for r in await redis.lrange(response_list_key(agent_run_id), 0, -1)]
+
+
+async def expire_responses(agent_run_id: str, ttl: int):
+    """Set a TTL on the stored responses of a run for both transports."""
+    await redis.expire(response_list_key(agent_run_id), ttl)
+    await redis.expire(response_stream_key(agent_run_id), ttl)
+
+
+async def delete_responses(agent_run_id: str):
+    """Delete the stored responses of a run for both transports."""
+    await redis.delete(response_list_key(agent_run_id))
+    await redis.delete(response_stream_key(agent_run_id))
+
+
+async def read_stream(
+    agent_run_id: str,
+    last_id: str = STREAM_START_ID,
+    follow: bool = True,
+) -> AsyncGenerator[Tuple[str, Dict[str, str]], None]:
+    """Yield `(entry_id, fields)` for every stream entry after `last_id`.
+
+    Existing entries are replayed with XRANGE first. With `follow`, new entries
+    are then read with a blocking XREAD until the stream key disappears (the
+    run was cleaned up) or the caller stops iterating. The key does not exist
+    until the run publishes its first response either, so before any entry was
+    seen a missing key only ends the reader once the run is no longer running.
+    """
+    key = response_stream_key(agent_run_id)
+    seen_entry = last_id != STREAM_START_ID
+    # XRANGE is inclusive; "(" makes the lower bound exclusive
+    for entry_id, fields in await redis.xrange(key, min=f"({last_id}" if last_id != STREAM_START_ID else "-"):
+        last_id = entry_id
+        seen_entry = True
+        yield entry_id, fields
+
+    while follow:
+        result = await redis.xread({key: last_id}, block=STREAM_BLOCK_MS)
+        if not result:
+            if not await redis.exists(key) and (seen_entry or not await _run_is_running(agent_run_id)):
+                logger.debug(f"Response stream {key} no longer exists, stopping reader")
+                return
+            continue
+        for _, entries in result:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                seen_entry = True
+                yield entry_id, fields
+
+
+async def _run_is_running(agent_run_id: str) -> bool:
+    client = await DBConnection().client
+    result = await client.table('agent_runs').select('status').eq('id', agent_run_id).execute()
+    return bool(result.data) and result.data[0].get('status') == 'running'
+
+
+class ResponsePublisher:
+    """Ordered, coalescing writer of agent run responses to Redis.
+
+    Responses are queued by `publish` and written by a single background task,
+    so they reach Redis in the order they were produced. Responses that arrive
+    within `PUBLISH_BATCH_DELAY` of each other (up to an item and byte budget)
+    are written with one pipelined round trip: a single multi-value RPUSH plus
+    one "new" notification for the list transport, or one XADD per response for
+    the stream transport. The queue is bounded, so a slow Redis applies
+    backpressure to the agent instead of growing memory with run length.
+    """
+
+    def __init__(self, agent_run_id: str, use_streams: bool):
+        self.agent_run_id = agent_run_id
+        self.use_streams = use_streams
+        self.published = 0
+        self.round_trips = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=PUBLISH_MAX_PENDING)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def publish(self, response_json: str):
+        """Queue a serialized response, waiting if too many are already pending."""
+        self.start()
+        await self._queue.put(response_json)
+
+    async def flush(self):
+        """Wait until every queued response has been written."""
+        if self._task is not None:
+            await self._queue.join()
+
+    async def close(self, timeout: float = 30.0):
+        """Flush pending responses (bounded by `timeout`) and stop the writer task."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout flushing {self._queue.qsize()} pending responses for {self.agent_run_id}")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        logger.debug(f"Published {self.published} responses for {self.agent_run_id} in {self.round_trips} Redis round trips")
+
+    async def _next_batch(self) -> List[str]:
+        batch = [await self._queue.get()]
+        size = len(batch[0])
+        deadline = asyncio.get_running_loop().time() + PUBLISH_BATCH_DELAY
+        while len(batch) < PUBLISH_BATCH_MAX_ITEMS and size < PUBLISH_BATCH_MAX_BYTES:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(item)
+            size += len(item)
+        return batch
+
+    async def _write(self, batch: List[str]):
+        redis_client = await redis.get_client()
+        pipe = redis_client.pipeline(transaction=False)
+        if self.use_streams:
+            stream_key = response_stream_key(self.agent_run_id)
+            for response_json in batch:
+                pipe.xadd(stream_key, {"data": response_json})
+        else:
+            pipe.rpush(response_list_key(self.agent_run_id), *batch)
+            pipe.publish(response_channel(self.agent_run_id), "new")
+        await pipe.execute()
+        self.round_trips += 1
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                for attempt in range(PUBLISH_WRITE_RETRIES):
+                    try:
+                        await self._write(batch)
+                        self.published += len(batch)
+                        break
+                    except Exception as e:
+                        if attempt == PUBLISH_WRITE_RETRIES - 1:
+                            logger.error(f"Failed to publish {len(batch)} responses for {self.agent_run_id}: {e}")
+                        else:
+                            await asyncio.sleep(0.1 * (2 ** attempt))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+def format_sse(response_json: str, event_id: Optional[str] = None) -> str:
+    """Format a serialized response as an SSE event."""
+    if event_id:
+        return f"id: {event_id}\ndata: {response_json}\n\n"
+    return f"data: {response_json}\n\n"
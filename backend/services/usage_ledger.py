@@ -0,0 +1,334 @@
+"""
+Incremental monthly usage ledger.
+
+Billing checks used to rebuild an account's LLM spend for the month by paging
+through every `assistant_response_end` message of every thread of the account.
+The ledger keeps a running total per account and month in the
+`monthly_usage_ledger` table instead:
+
+- `record_usage` adds the cost of each `assistant_response_end` message once
+  ThreadManager has stored it (one atomic `increment_monthly_usage` RPC), in a
+  background task off the path between LLM calls. Recording only stored rows
+  keeps a reconciliation from overwriting an increment whose message it could
+  not see yet, and never counts a message whose write failed.
+- `get_monthly_usage` is a primary-key lookup, cached in Redis until the next
+  increment.
+- `reconcile_account` recomputes the total from the messages table and
+  overwrites the ledger entry, correcting drift from lost increments or pricing
+  changes. Entries not reconciled for `RECONCILE_INTERVAL` are reconciled by the
+  `reconcile_usage_ledger` background actor; `utils/scripts/backfill_usage_ledger.py`
+  reconciles every active account.
+
+An entry that has never been reconciled only holds the increments recorded
+since it was created, so lookups ignore it and the caller falls back to
+`reconcile_account`.
+"""
+
+import asyncio
+import json
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from services import redis
+from services.billing import calculate_token_cost, get_usage_period_start
+from services.supabase import DBConnection
+from utils.cache import Cache
+from utils.logger import logger
+
+LEDGER_TABLE = 'monthly_usage_ledger'
+CACHE_TTL = 10 * 60
+RECONCILE_INTERVAL = timedelta(hours=1)
+RECONCILE_LOCK_TTL = 10 * 60
+RECONCILE_RETRIES = 3
+# Thread IDs per `in_` filter, keeps the PostgREST URL well below its length limit
+THREAD_ID_BATCH_SIZE = 200
+BATCH_SIZE = 1000
+
+db = DBConnection()
+
+# Threads never move between accounts, so the owner lookup can be cached for the process lifetime
+_thread_accounts: Dict[str, str] = {}
+# The event loop only keeps weak references to tasks; hold background increments until they finish
+_pending_records: Set[asyncio.Task] = set()
+
+
+def period_start_for(ts: Optional[datetime] = None) -> date:
+    """Return the ledger period (first day of the month, UTC) containing `ts`."""
+    ts = ts or datetime.now(timezone.utc)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc)
+    return date(ts.year, ts.month, 1)
+
+
+def _period_bounds(period_start: date) -> tuple[datetime, datetime]:
+    start = datetime(period_start.year, period_start.month, 1, tzinfo=timezone.utc)
+    if period_start.month == 12:
+        end = datetime(period_start.year + 1, 1, 1, tzinfo=timezone.utc)
+    else:
+        end = datetime(period_start.year, period_start.month + 1, 1, tzinfo=timezone.utc)
+    return get_usage_period_start(start), end
+
+
+def _cache_key(account_id: str) -> str:
+    return f"monthly_usage:{account_id}"
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def message_cost(content: Any) -> float:
+    """Return the cost of an `assistant_response_end` message content."""
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            return 0.0
+    if not isinstance(content, dict):
+        return 0.0
+    return usage_cost(content.get('usage'), content.get('model'))
+
+
+def usage_cost(usage: Any, model: Optional[str]) -> float:
+    """Return the cost of a `usage` block produced by `model`."""
+    if not isinstance(usage, dict):
+        return 0.0
+    return calculate_token_cost(
+        usage.get('prompt_tokens', 0),
+        usage.get('completion_tokens', 0),
+        model or 'unknown',
+    )
+
+
+async def _get_account_id(client, thread_id: str) -> Optional[str]:
+    account_id = _thread_accounts.get(thread_id)
+    if account_id:
+        return account_id
+    result = await client.table('threads').select('account_id').eq('thread_id', thread_id).execute()
+    if not result.data or not result.data[0].get('account_id'):
+        return None
+    account_id = result.data[0]['account_id']
+    _thread_accounts[thread_id] = account_id
+    return account_id
+
+
+async def record_usage(message: Dict[str, Any]):
+    """Add the cost of a stored `assistant_response_end` message to its account's ledger entry.
+
+    Failures are logged and swallowed; the next reconciliation corrects the total.
+    """
+    try:
+        cost = message_cost(message.get('content'))
+        if cost <= 0:
+            return
+
+        client = await db.client
+        account_id = await _get_account_id(client, message['thread_id'])
+        if not account_id:
+            return
+
+        created_at = _parse_timestamp(message.get('created_at')) or datetime.now(timezone.utc)
+        period_start = period_start_for(created_at)
+        if created_at < _period_bounds(period_start)[0]:
+            return
+
+        await client.rpc('increment_monthly_usage', {
+            'p_account_id': account_id,
+            'p_period_start': period_start.isoformat(),
+            'p_cost': cost,
+        }).execute()
+        await Cache.invalidate(_cache_key(account_id))
+    except Exception as e:
+        logger.warning(f"Failed to record usage for message {message.get('message_id')}: {e}")
+
+
+def schedule_record_usage(rows: Iterable[Dict[str, Any]]):
+    """Record the usage of the `assistant_response_end` rows among freshly stored `rows` in the background."""
+    for row in rows:
+        if row.get('type') != 'assistant_response_end':
+            continue
+        task = asyncio.create_task(record_usage(row))
+        _pending_records.add(task)
+        task.add_done_callback(_pending_records.discard)
+
+
+async def _get_entry(client, account_id: str, period_start: date) -> Optional[Dict[str, Any]]:
+    result = await client.table(LEDGER_TABLE) \
+        .select('total_cost, reconciled_at, updated_at') \
+        .eq('account_id', account_id) \
+        .eq('period_start', period_start.isoformat()) \
+        .execute()
+    return result.data[0] if result.data else None
+
+
+async def get_monthly_usage(client, account_id: str) -> Optional[float]:
+    """Return the account's cost for the current month, or None if the ledger cannot answer yet.
+
+    Stale entries are still served, but a background reconciliation is scheduled.
+    """
+    cached = await Cache.get(_cache_key(account_id))
+    if cached is not None:
+        return cached
+
+    period_start = period_start_for()
+    try:
+        entry = await _get_entry(client, account_id, period_start)
+    except Exception as e:
+        logger.warning(f"Failed to read usage ledger for account {account_id}: {e}")
+        return None
+
+    reconciled_at = _parse_timestamp(entry.get('reconciled_at')) if entry else None
+    if reconciled_at is None:
+        return None
+
+    if datetime.now(timezone.utc) - reconciled_at > RECONCILE_INTERVAL:
+        await schedule_reconcile(account_id, period_start)
+
+    total_cost = float(entry['total_cost'])
+    await Cache.set(_cache_key(account_id), total_cost, ttl=CACHE_TTL)
+    return total_cost
+
+
+async def schedule_reconcile(account_id: str, period_start: Optional[date] = None):
+    """Enqueue a background reconciliation of the account's ledger entry, at most once per lock period."""
+    period_start = period_start or period_start_for()
+    lock_key = f"usage_ledger_reconcile:{account_id}:{period_start.isoformat()}"
+    try:
+        if not await redis.set(lock_key, "1", ex=RECONCILE_LOCK_TTL, nx=True):
+            return
+        from run_agent_background import reconcile_usage_ledger
+        reconcile_usage_ledger.send(account_id, period_start.isoformat())
+    except Exception as e:
+        logger.warning(f"Failed to schedule usage ledger reconciliation for account {account_id}: {e}")
+
+
+async def _get_thread_ids(client, account_id: str) -> List[str]:
+    thread_ids = []
+    offset = 0
+    while True:
+        result = await client.table('threads') \
+            .select('thread_id') \
+            .eq('account_id', account_id) \
+            .order('created_at') \
+            .range(offset, offset + BATCH_SIZE - 1) \
+            .execute()
+        if not result.data:
+            break
+        thread_ids.extend(row['thread_id'] for row in result.data)
+        if len(result.data) < BATCH_SIZE:
+            break
+        offset += BATCH_SIZE
+    return thread_ids
+
+
+async def compute_monthly_usage(client, account_id: str, period_start: Optional[date] = None) -> float:
+    """Recompute an account's cost for a period from its `assistant_response_end` messages.
+
+    Only the usage block and model are selected, not the full response content.
+    """
+    period_start = period_start or period_start_for()
+    window_start, window_end = _period_bounds(period_start)
+    thread_ids = await _get_thread_ids(client, account_id)
+
+    total_cost = 0.0
+    for i in range(0, len(thread_ids), THREAD_ID_BATCH_SIZE):
+        batch = thread_ids[i:i + THREAD_ID_BATCH_SIZE]
+        offset = 0
+        while True:
+            result = await client.table('messages') \
+                .select('message_id, usage:content->usage, model:content->>model') \
+                .in_('thread_id', batch) \
+                .eq('type', 'assistant_response_end') \
+                .gte('created_at', window_start.isoformat()) \
+                .lt('created_at', window_end.isoformat()) \
+                .order('message_id') \
+                .range(offset, offset + BATCH_SIZE - 1) \
+                .execute()
+            if not result.data:
+                break
+            for row in result.data:
+                try:
+                    total_cost += usage_cost(row.get('usage'), row.get('model'))
+                except Exception as e:
+                    logger.warning(f"Error calculating usage cost for message {row.get('message_id')}: {e}")
+            if len(result.data) < BATCH_SIZE:
+                break
+            offset += BATCH_SIZE
+    return total_cost
+
+
+async def reconcile_account(client, account_id: str, period_start: Optional[date] = None) -> float:
+    """Recompute an account's ledger entry from its messages and store it. Returns the total.
+
+    The write only succeeds if no increment landed while the total was being
+    recomputed (compare-and-set on `updated_at`); otherwise it is retried.
+    """
+    period_start = period_start or period_start_for()
+    total_cost = 0.0
+    for attempt in range(RECONCILE_RETRIES):
+        entry = await _get_entry(client, account_id, period_start)
+        total_cost = await compute_monthly_usage(client, account_id, period_start)
+        now = datetime.now(timezone.utc).isoformat()
+        values = {'total_cost': total_cost, 'reconciled_at': now, 'updated_at': now}
+
+        try:
+            if entry is None:
+                result = await client.table(LEDGER_TABLE).insert({
+                    'account_id': account_id,
+                    'period_start': period_start.isoformat(),
+                    **values,
+                }).execute()
+            else:
+                result = await client.table(LEDGER_TABLE).update(values) \
+                    .eq('account_id', account_id) \
+                    .eq('period_start', period_start.isoformat()) \
+                    .eq('updated_at', entry['updated_at']) \
+                    .execute()
+        except Exception as e:
+            # A concurrent increment created the entry first
+            logger.debug(f"Usage ledger write for account {account_id} failed (attempt {attempt + 1}): {e}")
+            continue
+
+        if result.data:
+            if entry is not None and abs(float(entry['total_cost']) - total_cost) > 0.01:
+                logger.info(f"Reconciled usage ledger for account {account_id}: {float(entry['total_cost']):.4f} -> {total_cost:.4f}")
+            if period_start == period_start_for():
+                await Cache.set(_cache_key(account_id), total_cost, ttl=CACHE_TTL)
+            return total_cost
+
+    logger.warning(f"Could not store reconciled usage for account {account_id} after {RECONCILE_RETRIES} attempts")
+    return total_cost
+
+
+async def get_active_account_ids(client, period_start: Optional[date] = None) -> List[str]:
+    """Return the accounts with agent runs in a period."""
+    period_start = period_start or period_start_for()
+    window_start, window_end = _period_bounds(period_start)
+    account_ids = set()
+    offset = 0
+    while True:
+        result = await client.table('agent_runs') \
+            .select('id, threads!inner(account_id)') \
+            .gte('created_at', window_start.isoformat()) \
+            .lt('created_at', window_end.isoformat()) \
+            .order('id') \
+            .range(offset, offset + BATCH_SIZE - 1) \
+            .execute()
+        if not result.data:
+            break
+        for row in result.data:
+            thread = row.get('threads')
+            if isinstance(thread, list):
+                thread = thread[0] if thread else None
+            if thread and thread.get('account_id'):
+                account_ids.add(thread['account_id'])
+        if len(result.data) < BATCH_SIZE:
+            break
+        offset += BATCH_SIZE
+    return sorted(account_ids)
@@ -0,0 +1,54 @@
+-- Incremental monthly usage ledger
+-- Keeps a running LLM cost total per account and month so billing checks do not
+-- have to rescan every assistant_response_end message of the account.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS monthly_usage_ledger (
+    account_id UUID NOT NULL REFERENCES basejump.accounts(id) ON DELETE CASCADE,
+    period_start DATE NOT NULL,
+    total_cost NUMERIC(14, 6) NOT NULL DEFAULT 0,
+    reconciled_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc'::text, NOW()) NOT NULL,
+    PRIMARY KEY (account_id, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_monthly_usage_ledger_period_start ON monthly_usage_ledger(period_start);
+
+ALTER TABLE monthly_usage_ledger ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS monthly_usage_ledger_select_policy ON monthly_usage_ledger;
+CREATE POLICY monthly_usage_ledger_select_policy ON monthly_usage_ledger
+    FOR SELECT
+    USING (basejump.has_role_on_account(account_id) = true);
+
+-- Atomically add the cost of one assistant_response_end message to the ledger
+CREATE OR REPLACE FUNCTION increment_monthly_usage(
+    p_account_id UUID,
+    p_period_start DATE,
+    p_cost NUMERIC
+) RETURNS NUMERIC
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    new_total NUMERIC;
+BEGIN
+    INSERT INTO monthly_usage_ledger (account_id, period_start, total_cost, updated_at)
+    VALUES (p_account_id, p_period_start, p_cost, TIMEZONE('utc'::text, NOW()))
+    ON CONFLICT (account_id, period_start) DO UPDATE
+    SET total_cost = monthly_usage_ledger.total_cost + EXCLUDED.total_cost,
+        updated_at = EXCLUDED.updated_at
+    RETURNING total_cost INTO new_total;
+
+    RETURN new_total;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION increment_monthly_usage(UUID, DATE, NUMERIC) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION increment_monthly_usage(UUID, DATE, NUMERIC) TO service_role;
+
+GRANT SELECT ON TABLE monthly_usage_ledger TO authenticated;
+GRANT ALL PRIVILEGES ON TABLE monthly_usage_ledger TO service_role;
+
+COMMIT;
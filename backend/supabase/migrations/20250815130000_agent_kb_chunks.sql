@@ -0,0 +1,38 @@
+BEGIN;
+
+-- Chunks of agent knowledge base entries, written at ingest and used to build
+-- the per-agent BM25 retrieval index instead of injecting whole entries
+CREATE TABLE IF NOT EXISTS agent_knowledge_base_chunks (
+    chunk_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    entry_id UUID NOT NULL REFERENCES agent_knowledge_base_entries(entry_id) ON DELETE CASCADE,
+    agent_id UUID NOT NULL REFERENCES agents(agent_id) ON DELETE CASCADE,
+
+    chunk_index INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    content_tokens INTEGER NOT NULL,
+
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+
+    CONSTRAINT agent_kb_chunks_unique_index UNIQUE (entry_id, chunk_index)
+);
+
+CREATE INDEX IF NOT EXISTS idx_agent_kb_chunks_agent_id ON agent_knowledge_base_chunks(agent_id);
+CREATE INDEX IF NOT EXISTS idx_agent_kb_chunks_entry_id ON agent_knowledge_base_chunks(entry_id);
+
+ALTER TABLE agent_knowledge_base_chunks ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY agent_kb_chunks_user_access ON agent_knowledge_base_chunks
+    FOR ALL
+    USING (
+        EXISTS (
+            SELECT 1 FROM agents a
+            WHERE a.agent_id = agent_knowledge_base_chunks.agent_id
+            AND basejump.has_role_on_account(a.account_id) = true
+        )
+    );
+
+GRANT ALL PRIVILEGES ON TABLE agent_knowledge_base_chunks TO authenticated, service_role;
+
+COMMENT ON TABLE agent_knowledge_base_chunks IS 'Retrieval chunks of agent knowledge base entries';
+
+COMMIT;
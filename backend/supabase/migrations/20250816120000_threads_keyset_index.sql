@@ -0,0 +1,8 @@
+BEGIN;
+
+-- Serves the keyset-paginated thread listing (GET /threads): an account's
+-- threads ordered by (created_at, thread_id), newest first
+CREATE INDEX IF NOT EXISTS idx_threads_account_created_at
+    ON threads(account_id, created_at DESC, thread_id DESC);
+
+COMMIT;
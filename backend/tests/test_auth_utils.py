@@ -0,0 +1,62 @@
+import types
+
+import jwt
+import pytest
+
+from utils import auth_utils
+
+
+class FakeAuth:
+    def __init__(self, valid_tokens):
+        self.valid_tokens = valid_tokens
+        self.calls = 0
+
+    async def get_user(self, token):
+        self.calls += 1
+        if token not in self.valid_tokens:
+            raise Exception("invalid JWT")
+        return types.SimpleNamespace(user=types.SimpleNamespace(id=self.valid_tokens[token], email=None, role="authenticated"))
+
+
+@pytest.fixture
+def supabase_auth(monkeypatch):
+    monkeypatch.setattr(auth_utils.config, "SUPABASE_JWT_SECRET", None)
+    monkeypatch.setattr(auth_utils, "_verified_tokens", auth_utils._TTLCache(16, auth_utils.VERIFIED_TOKEN_TTL))
+    fake = FakeAuth({})
+
+    class FakeDBConnection:
+        @property
+        async def client(self):
+            return types.SimpleNamespace(auth=fake)
+
+    monkeypatch.setattr(auth_utils, "DBConnection", FakeDBConnection)
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_forged_hs256_token_is_rejected_without_secret(supabase_auth):
+    forged = jwt.encode({"sub": "someone-else"}, "not-the-secret", algorithm="HS256")
+    with pytest.raises(jwt.PyJWTError):
+        await auth_utils._decode_jwt(forged)
+    with pytest.raises(jwt.PyJWTError):
+        await auth_utils._decode_jwt(forged)
+    assert supabase_auth.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_hs256_token_verified_by_supabase_is_cached(supabase_auth):
+    token = jwt.encode({"sub": "user-1"}, "project-secret", algorithm="HS256")
+    supabase_auth.valid_tokens[token] = "user-1"
+    assert (await auth_utils._decode_jwt(token))["sub"] == "user-1"
+    assert (await auth_utils._decode_jwt(token))["sub"] == "user-1"
+    assert supabase_auth.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_hs256_token_verified_locally_with_secret(monkeypatch, supabase_auth):
+    monkeypatch.setattr(auth_utils.config, "SUPABASE_JWT_SECRET", "project-secret")
+    token = jwt.encode({"sub": "user-1"}, "project-secret", algorithm="HS256")
+    assert (await auth_utils._decode_jwt(token))["sub"] == "user-1"
+    with pytest.raises(jwt.PyJWTError):
+        await auth_utils._decode_jwt(jwt.encode({"sub": "user-1"}, "wrong", algorithm="HS256"))
+    assert supabase_auth.calls == 0
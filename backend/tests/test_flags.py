@@ -0,0 +1,73 @@
+import asyncio
+import logging
+
+import pytest
+
+from flags import flags
+
+
+class FakePipeline:
+    def __init__(self, store):
+        self.store = store
+        self.keys = []
+
+    def hgetall(self, key):
+        self.keys.append(key)
+
+    async def execute(self):
+        return [self.store[key] for key in self.keys]
+
+
+class FakeRedisClient:
+    def __init__(self, store):
+        self.store = store
+        self.smembers_calls = 0
+
+    async def smembers(self, key):
+        self.smembers_calls += 1
+        # Let every concurrent caller reach the snapshot check before the load finishes
+        await asyncio.sleep(0.01)
+        return {"beta"}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self.store)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_checks_share_one_load(monkeypatch):
+    client = FakeRedisClient({"feature_flag:beta": {"enabled": "true"}})
+
+    async def get_client():
+        return client
+
+    monkeypatch.setattr(flags.redis, "get_client", get_client)
+    manager = flags.FeatureFlagManager()
+    monkeypatch.setattr(manager, "_ensure_listener", lambda: None)
+
+    results = await asyncio.gather(*(manager.is_enabled("beta") for _ in range(10)))
+
+    assert results == [True] * 10
+    assert client.smembers_calls == 1
+    assert manager.cache_stats() == {'hits': 10, 'loads': 1, 'flags': 1}
+
+
+@pytest.mark.asyncio
+async def test_refresh_logs_redis_calls_saved(monkeypatch, caplog):
+    client = FakeRedisClient({"feature_flag:beta": {"enabled": "true"}})
+
+    async def get_client():
+        return client
+
+    monkeypatch.setattr(flags.redis, "get_client", get_client)
+    manager = flags.FeatureFlagManager()
+    monkeypatch.setattr(manager, "_ensure_listener", lambda: None)
+
+    with caplog.at_level(logging.INFO, logger=flags.logger.name):
+        for _ in range(3):
+            await manager.is_enabled("beta")
+        assert "checks served without a Redis call" not in caplog.text
+
+        # A load after the interval reports the counters
+        manager._stats_logged_at -= flags.STATS_LOG_INTERVAL
+        await manager._load_snapshot()
+    assert "3 checks served without a Redis call, 2 loads, 1 flags" in caplog.text
@@ -0,0 +1,14 @@
+from triggers.intake import EVENT_KEY_TTL, webhook_idempotency_key
+
+
+def test_identical_bodies_without_event_id_are_distinct_events():
+    body = {"event": "push", "ref": "main"}
+    first, _ = webhook_idempotency_key(body, {})
+    second, _ = webhook_idempotency_key(dict(body), {})
+    assert first != second
+
+
+def test_idempotency_header_is_deduplicated():
+    headers = {"idempotency-key": "evt_1"}
+    assert webhook_idempotency_key({"a": 1}, headers) == ("evt_1", EVENT_KEY_TTL)
+    assert webhook_idempotency_key({"a": 2}, headers) == ("evt_1", EVENT_KEY_TTL)
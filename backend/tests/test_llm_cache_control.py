@@ -0,0 +1,30 @@
+from services.llm import prepare_params
+
+
+def cache_marks(messages):
+    return [
+        item.get("text") or item.get("content")
+        for message in messages
+        for item in (message["content"] if isinstance(message["content"], list) else [])
+        if "cache_control" in item
+    ]
+
+
+def test_volatile_system_block_is_not_a_cache_breakpoint():
+    messages = [
+        {"role": "system", "content": [
+            {"type": "text", "text": "static", "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": "Today is Sunday"},
+        ]},
+        {"role": "user", "content": "first"},
+        {"role": "assistant", "content": "second"},
+        {"role": "user", "content": "third"},
+    ]
+    params = prepare_params(messages, "anthropic/claude-sonnet-4-20250514")
+    assert cache_marks(params["messages"]) == ["static", "first", "second"]
+
+
+def test_unmarked_blocks_get_cache_control():
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+    params = prepare_params(messages, "anthropic/claude-sonnet-4-20250514")
+    assert cache_marks(params["messages"]) == ["system", "hi"]
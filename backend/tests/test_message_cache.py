@@ -0,0 +1,101 @@
+import types
+
+import pytest
+
+from agentpress import message_cache
+from agentpress.message_cache import ThreadMessageCache
+
+
+class FakeQuery:
+    def __init__(self, table):
+        self.table = table
+        self.filters = []
+        self.bounds = None
+
+    def select(self, columns):
+        self.columns = [c.strip() for c in columns.split(',')]
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row[column] >= value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row[column] in values)
+        return self
+
+    def order(self, column):
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end + 1)
+        return self
+
+    async def execute(self):
+        self.table.queries.append(self.columns)
+        rows = sorted((row for row in self.table.rows if all(f(row) for f in self.filters)), key=lambda row: row['created_at'])
+        if self.bounds:
+            rows = rows[self.bounds[0]:self.bounds[1]]
+        return types.SimpleNamespace(data=[{c: row[c] for c in self.columns} for row in rows])
+
+
+class FakeMessagesTable:
+    def __init__(self):
+        self.rows = []
+        self.queries = []
+
+    def add(self, message_id, created_at, content):
+        self.rows.append({
+            'message_id': message_id, 'thread_id': 't1', 'is_llm_message': True,
+            'created_at': created_at, 'content': content,
+        })
+
+    def client(self):
+        return types.SimpleNamespace(table=lambda name: FakeQuery(self))
+
+
+@pytest.fixture
+def table(monkeypatch):
+    async def get_pool():
+        return None
+
+    async def get(key, default=None):
+        return default
+
+    monkeypatch.setattr(message_cache.postgres, "get_pool", get_pool)
+    monkeypatch.setattr(message_cache.redis, "get", get)
+    monkeypatch.setattr(message_cache.config, "THREAD_MESSAGE_CACHE_REDIS", False)
+    return FakeMessagesTable()
+
+
+@pytest.mark.asyncio
+async def test_returned_messages_do_not_share_nested_content(table):
+    table.add('m1', '2025-08-16T12:00:00+00:00', {'role': 'tool', 'tool_execution': {'result': {'output': {'x': 'long'}}}})
+    cache = ThreadMessageCache()
+
+    messages = await cache.get_messages(table.client(), 't1')
+    messages[0]['tool_execution']['result']['output']['x'] = 'truncated'
+
+    again = await cache.get_messages(table.client(), 't1')
+    assert again[0]['tool_execution']['result']['output']['x'] == 'long'
+
+
+@pytest.mark.asyncio
+async def test_late_row_with_older_created_at_is_fetched(table):
+    table.add('m1', '2025-08-16T12:00:00+00:00', {'role': 'user', 'content': 'a'})
+    table.add('m3', '2025-08-16T12:01:00+00:00', {'role': 'assistant', 'content': 'c'})
+    cache = ThreadMessageCache()
+    assert [m['message_id'] for m in await cache.get_messages(table.client(), 't1')] == ['m1', 'm3']
+
+    # Queued 30s before the newest cached row, committed only now
+    table.add('m2', '2025-08-16T12:00:30+00:00', {'role': 'assistant', 'content': 'b'})
+    table.queries.clear()
+    assert [m['message_id'] for m in await cache.get_messages(table.client(), 't1')] == ['m1', 'm2', 'm3']
+
+    # Cached rows of the overlap window are not downloaded again, only the new one
+    content_queries = [q for q in table.queries if 'content' in q]
+    assert len(content_queries) == 1
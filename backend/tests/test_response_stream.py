@@ -0,0 +1,74 @@
+import pytest
+
+from services import response_stream
+
+TIMEOUT = None
+
+
+class FakeStreams:
+    """A Redis stream fed by `reads`: each XREAD returns the next entry, or times out on TIMEOUT."""
+
+    def __init__(self):
+        self.entries = []
+        self.reads = []
+
+    async def xrange(self, key, min="-"):
+        return []
+
+    async def xread(self, streams, block=None):
+        (key, _), = streams.items()
+        entry = self.reads.pop(0) if self.reads else TIMEOUT
+        if entry is TIMEOUT:
+            return []
+        self.entries.append(entry)
+        return [(key, [entry])]
+
+    async def exists(self, key):
+        return 1 if self.entries else 0
+
+
+@pytest.fixture
+def streams(monkeypatch):
+    fake = FakeStreams()
+    for name in ("xrange", "xread", "exists"):
+        monkeypatch.setattr(response_stream.redis, name, getattr(fake, name))
+    return fake
+
+
+def run_status(monkeypatch, statuses):
+    calls = []
+
+    async def is_running(agent_run_id):
+        calls.append(agent_run_id)
+        return statuses.pop(0)
+
+    monkeypatch.setattr(response_stream, "_run_is_running", is_running)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_reader_waits_for_first_entry_of_running_run(monkeypatch, streams):
+    calls = run_status(monkeypatch, [True])
+    # The first XREAD times out before the run published anything
+    streams.reads = [TIMEOUT, ("1-0", {"data": "{}"})]
+    reader = response_stream.read_stream("r1")
+    assert await reader.__anext__() == ("1-0", {"data": "{}"})
+    assert calls == ["r1"]
+    await reader.aclose()
+
+
+@pytest.mark.asyncio
+async def test_reader_stops_when_run_ended_without_entries(monkeypatch, streams):
+    run_status(monkeypatch, [False])
+    assert [entry async for entry in response_stream.read_stream("r1")] == []
+
+
+@pytest.mark.asyncio
+async def test_reader_stops_when_stream_deleted_after_entries(monkeypatch, streams):
+    calls = run_status(monkeypatch, [])
+    streams.reads = [("1-0", {"data": "{}"})]
+    reader = response_stream.read_stream("r1")
+    assert await reader.__anext__() == ("1-0", {"data": "{}"})
+    streams.entries.clear()
+    assert [entry async for entry in reader] == []
+    assert calls == []
@@ -0,0 +1,105 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+from triggers import scheduler
+from triggers.scheduler import LocalScheduler
+
+EVERY_MINUTE = {"cron_expression": "* * * * *", "timezone": "UTC"}
+DUE = 1_800_000_000.0  # a minute boundary
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+class FakeQuery:
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        # Reading the triggers takes a while; the clock moves on meanwhile
+        self.db.clock.now += self.db.load_seconds
+        return types.SimpleNamespace(data=list(self.db.rows))
+
+
+class FakeDB:
+    def __init__(self, clock: FakeClock, rows, load_seconds: float):
+        self.clock = clock
+        self.rows = rows
+        self.load_seconds = load_seconds
+
+    @property
+    async def client(self):
+        return types.SimpleNamespace(table=lambda name: FakeQuery(self))
+
+
+def make_scheduler(monkeypatch, rows, start: float, load_seconds: float):
+    clock = FakeClock(start)
+    monkeypatch.setattr(scheduler, "time", types.SimpleNamespace(time=clock.time, monotonic=time.monotonic))
+    local = LocalScheduler(FakeDB(clock, rows, load_seconds))
+    fired = []
+
+    async def fire(entry, fire_time):
+        fired.append((entry.trigger_id, fire_time))
+
+    local._fire = fire
+    return local, clock, fired
+
+
+@pytest.mark.asyncio
+async def test_resync_across_due_time_fires_occurrence(monkeypatch):
+    rows = [{"trigger_id": "t1", "agent_id": "a1", "config": EVERY_MINUTE}]
+    local, clock, fired = make_scheduler(monkeypatch, rows, DUE - 10, load_seconds=15)
+
+    task = asyncio.create_task(local._run())
+    for _ in range(50):
+        if fired:
+            break
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert clock.now >= DUE
+    assert fired == [("t1", DUE)]
+
+
+@pytest.mark.asyncio
+async def test_reload_keeps_pending_occurrence_of_unchanged_trigger(monkeypatch):
+    rows = [{"trigger_id": "t1", "agent_id": "a1", "config": EVERY_MINUTE}]
+    local, clock, fired = make_scheduler(monkeypatch, rows, DUE - 30, load_seconds=0)
+    await local.load()
+    assert local.index.pop_due(clock.now) == []
+    assert local.index.next_fire("t1") == DUE
+
+    # The periodic resync reads the triggers across the due time
+    local._db.load_seconds = 40
+    await local.load()
+
+    due = local.index.pop_due(clock.now)
+    assert [(entry.trigger_id, fire_time) for entry, fire_time in due] == [("t1", DUE)]
+    assert local.index.next_fire("t1") == DUE + 60
+
+
+@pytest.mark.asyncio
+async def test_reload_schedules_new_trigger_from_last_processed_instant(monkeypatch):
+    rows = [{"trigger_id": "t1", "agent_id": "a1", "config": EVERY_MINUTE}]
+    local, clock, fired = make_scheduler(monkeypatch, rows, DUE - 30, load_seconds=0)
+    await local.load()
+    local.index.pop_due(clock.now)
+
+    rows.append({"trigger_id": "t2", "agent_id": "a2", "config": EVERY_MINUTE})
+    local._db.load_seconds = 40
+    await local.load()
+
+    due = local.index.pop_due(clock.now)
+    assert sorted((entry.trigger_id, fire_time) for entry, fire_time in due) == [("t1", DUE), ("t2", DUE)]
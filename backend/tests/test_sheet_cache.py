@@ -0,0 +1,28 @@
+from agent.tools import sb_sheets_tool
+from agent.tools.sb_sheets_tool import SandboxSheetsTool, SheetData, _CachedSheetFile
+
+MB = 1024 * 1024
+
+
+def cached(size, workbook=None):
+    return _CachedSheetFile(signature=("mtime", size), sheets={None: SheetData(headers=[], rows=[])}, workbook=workbook)
+
+
+def test_cache_is_bounded_by_total_source_size(monkeypatch):
+    monkeypatch.setattr(sb_sheets_tool, "SHEET_CACHE_MAX_BYTES", 10 * MB)
+    tool = SandboxSheetsTool("p1", None)
+    for name in ("a", "b", "c"):
+        tool._cache_file(f"/workspace/{name}.csv", cached(4 * MB))
+    assert list(tool._sheet_cache) == ["/workspace/b.csv", "/workspace/c.csv"]
+
+    tool._cache_file("/workspace/huge.csv", cached(11 * MB))
+    assert "/workspace/huge.csv" not in tool._sheet_cache
+
+
+def test_only_small_files_keep_their_workbook():
+    tool = SandboxSheetsTool("p1", None)
+    tool._cache_file("/workspace/small.xlsx", cached(MB, workbook=object()))
+    tool._cache_file("/workspace/large.xlsx", cached(sb_sheets_tool.SHEET_CACHE_MAX_WORKBOOK_BYTES + 1, workbook=object()))
+    assert tool._sheet_cache["/workspace/small.xlsx"].workbook is not None
+    assert tool._sheet_cache["/workspace/large.xlsx"].workbook is None
+    assert None in tool._sheet_cache["/workspace/large.xlsx"].sheets
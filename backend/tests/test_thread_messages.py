@@ -0,0 +1,113 @@
+import json
+import re
+import types
+from datetime import datetime
+
+import pytest
+
+from agent import api
+
+KEYSET = re.compile(r'created_at\.(gt|lt)\."([^"]+)",and\(created_at\.eq\."[^"]+",message_id\.(gt|lt)\.([0-9a-f-]+)\)')
+
+
+def ts(value):
+    return datetime.fromisoformat(value)
+
+
+class FakeQuery:
+    def __init__(self, table):
+        self.table = table
+        self.filters = []
+        self.descending = False
+        self.max_rows = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: ts(row[column]) > ts(value))
+        return self
+
+    def or_(self, condition):
+        op, created_at, _, message_id = KEYSET.fullmatch(condition).groups()
+        cursor = (ts(created_at), message_id)
+        if op == 'gt':
+            self.filters.append(lambda row: (ts(row['created_at']), row['message_id']) > cursor)
+        else:
+            self.filters.append(lambda row: (ts(row['created_at']), row['message_id']) < cursor)
+        return self
+
+    def order(self, column, desc=False):
+        self.descending = desc
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    async def execute(self):
+        rows = [row for row in self.table.rows if all(f(row) for f in self.filters)]
+        rows.sort(key=lambda row: (ts(row['created_at']), row['message_id']), reverse=self.descending)
+        return types.SimpleNamespace(data=rows[:self.max_rows])
+
+
+class FakeMessages:
+    def __init__(self):
+        self.rows = []
+
+    def insert(self, message_id, created_at, type):
+        self.rows.append({'message_id': message_id, 'thread_id': 't1', 'type': type, 'created_at': created_at})
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    table = FakeMessages()
+
+    class FakeDB:
+        @property
+        async def client(self):
+            return types.SimpleNamespace(table=lambda name: FakeQuery(table))
+
+    async def verify_thread_access(client, thread_id, user_id):
+        return True
+
+    monkeypatch.setattr(api, "db", FakeDB())
+    monkeypatch.setattr(api, "verify_thread_access", verify_thread_access)
+    return table
+
+
+async def poll(after=None):
+    response = await api.get_thread_messages(
+        "t1", types.SimpleNamespace(headers={}), user_id="u1", order="asc", limit=None,
+        after=after, before=None, since=None, exclude_types=None, include_content=True,
+    )
+    body = json.loads(response.body)
+    return [m['message_id'] for m in body['messages']], body['pagination']['next_cursor']
+
+
+@pytest.mark.asyncio
+async def test_poll_returns_row_committed_late_with_earlier_created_at(messages):
+    tool_started = "00000000-0000-0000-0000-000000000001"
+    browser_state = "00000000-0000-0000-0000-000000000002"
+    user_message = "00000000-0000-0000-0000-000000000003"
+
+    # browser_state is inserted right away with the database clock
+    messages.insert(browser_state, "2025-08-16T12:00:00.050+00:00", "browser_state")
+    ids, cursor = await poll()
+    assert ids == [browser_state]
+
+    # The run's writer stamped tool_started earlier, but its batch lands only now
+    messages.insert(tool_started, "2025-08-16T12:00:00.030+00:00", "tool")
+    ids, cursor = await poll(cursor)
+    assert tool_started in ids
+
+    # The cursor still advances over new rows
+    messages.insert(user_message, "2025-08-16T12:00:30+00:00", "user")
+    ids, cursor = await poll(cursor)
+    assert ids[-1] == user_message
+    ids, _ = await poll(cursor)
+    assert user_message not in ids
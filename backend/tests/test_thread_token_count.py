@@ -0,0 +1,64 @@
+import json
+import types
+
+import pytest
+from litellm.utils import token_counter
+
+from agentpress import context_manager
+from agentpress.context_manager import ContextManager, MessageTokenCache
+from agentpress.thread_manager import ThreadManager
+
+MODEL = "openrouter/moonshotai/kimi-k2"
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    # One token per character of content plus 3 per call, so counts are easy to follow
+    monkeypatch.setattr(context_manager, "token_counter", lambda model, messages: 3 + sum(len(str(m['content'])) for m in messages))
+    return types.SimpleNamespace(
+        context_manager=types.SimpleNamespace(token_cache=MessageTokenCache()),
+        _thread_token_counts={},
+        _thread_token_totals={},
+    )
+
+
+def count(manager, messages):
+    return ThreadManager.get_thread_token_count(manager, "t1", messages, "model")
+
+
+def test_tally_adds_new_and_drops_deleted_messages(manager):
+    assert count(manager, [{'message_id': 'm1', 'content': 'aaaa'}]) == 7
+    assert count(manager, [{'message_id': 'm1', 'content': 'aaaa'}, {'message_id': 'm2', 'content': 'bb'}]) == 9
+    assert count(manager, [{'message_id': 'm2', 'content': 'bb'}]) == 5
+    assert count(manager, []) == 0
+
+
+def test_tally_recounts_message_whose_content_changed(manager):
+    assert count(manager, [{'message_id': 'm1', 'content': 'a' * 100}, {'message_id': 'm2', 'content': 'bb'}]) == 105
+    # The same message compressed on a later iteration
+    assert count(manager, [{'message_id': 'm1', 'content': 'a' * 10}, {'message_id': 'm2', 'content': 'bb'}]) == 15
+    assert count(manager, [{'message_id': 'm1', 'content': 'a' * 100}, {'message_id': 'm2', 'content': 'bb'}]) == 105
+
+
+def tool_result(i, words):
+    return {'message_id': f"m{i}", 'role': 'user', 'content': json.dumps({'tool_execution': {'result': {'output': ' '.join(['word'] * words)}}})}
+
+
+def test_cached_count_matches_a_single_token_counter_call():
+    messages = [{'role': 'system', 'content': 'You are helpful.'}] + [tool_result(i, 50 + i) for i in range(40)]
+    assert MessageTokenCache().count_messages(messages, MODEL) == token_counter(model=MODEL, messages=messages)
+
+
+def test_compression_outcome_near_the_limit_is_unchanged():
+    # 300 tool results just under the 100k limit of the model; a plain sum of
+    # per-message counts would exceed it by the per-call overhead of 299 messages
+    messages = [tool_result(i, 312) for i in range(300)]
+    exact = token_counter(model=MODEL, messages=messages)
+    per_message_sum = sum(token_counter(model=MODEL, messages=[m]) for m in messages)
+    limit = 110 * 1000 - 10000
+    assert exact <= limit < per_message_sum, "fixture must sit between the exact count and the naive sum"
+
+    manager = ContextManager()
+    manager.token_cache = MessageTokenCache()
+    result = manager.compress_messages([dict(m) for m in messages], MODEL)
+    assert [m['content'] for m in result] == [m['content'] for m in messages]
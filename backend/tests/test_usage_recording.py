@@ -0,0 +1,60 @@
+import asyncio
+import types
+
+import pytest
+
+from agentpress import message_writer, thread_manager
+from agentpress.message_writer import MessageWriter
+from agentpress.thread_manager import ThreadManager
+from services import usage_ledger
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = types.SimpleNamespace(rows=[], recorded=[], fail=False)
+
+    async def get_pool():
+        return object()
+
+    async def insert_message_rows(pool, rows):
+        if store.fail:
+            raise Exception("connection reset")
+        store.rows.extend(row['message_id'] for row in rows)
+
+    async def record_usage(message):
+        # The ledger is only incremented for rows a reconciliation can already see
+        assert message['message_id'] in store.rows
+        store.recorded.append(message['message_id'])
+
+    monkeypatch.setattr(thread_manager.postgres, "get_pool", get_pool)
+    monkeypatch.setattr(thread_manager.postgres, "insert_message_rows", insert_message_rows)
+    monkeypatch.setattr(usage_ledger, "record_usage", record_usage)
+    monkeypatch.setattr(message_writer, "INSERT_RETRIES", 1)
+    manager = types.SimpleNamespace(db=None)
+    store.writer = MessageWriter(lambda rows: ThreadManager.add_messages(manager, rows))
+    return store
+
+
+async def settle():
+    await asyncio.gather(*list(usage_ledger._pending_records))
+
+
+@pytest.mark.asyncio
+async def test_usage_is_recorded_after_the_row_is_stored(store):
+    store.writer.add("t1", "assistant", {"role": "assistant"})
+    end = store.writer.add("t1", "assistant_response_end", {"usage": {"prompt_tokens": 10}})
+    assert store.recorded == []
+
+    await store.writer.flush()
+    await settle()
+    assert store.recorded == [end['message_id']]
+
+
+@pytest.mark.asyncio
+async def test_usage_is_not_recorded_when_the_write_fails(store):
+    store.fail = True
+    store.writer.add("t1", "assistant_response_end", {"usage": {"prompt_tokens": 10}})
+    with pytest.raises(Exception):
+        await store.writer.flush()
+    await settle()
+    assert store.recorded == []
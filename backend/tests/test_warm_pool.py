@@ -0,0 +1,212 @@
+import asyncio
+import json
+import time
+import types
+
+import pytest
+
+from sandbox import handle_pool, sandbox as sandbox_module, warm_pool
+
+SNAPSHOT = "snapshot-v2"
+POOL_KEY = f"{warm_pool.POOL_KEY_PREFIX}{SNAPSHOT}"
+
+
+class FakeRedis:
+    def __init__(self):
+        self.strings = {}
+        self.lists = {}
+        self.sets = {}
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = value
+        return True
+
+    async def delete(self, key):
+        self.strings.pop(key, None)
+        self.lists.pop(key, None)
+
+    async def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+
+    async def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    async def lpop(self, key):
+        values = self.lists.get(key)
+        return values.pop(0) if values else None
+
+    async def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    async def lrem(self, key, count, value):
+        values = self.lists.get(key, [])
+        if value in values:
+            values.remove(value)
+            return 1
+        return 0
+
+    async def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+
+    async def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    async def srem(self, key, *members):
+        self.sets.get(key, set()).difference_update(members)
+
+    async def keys(self, pattern):
+        raise AssertionError("KEYS scans the whole keyspace")
+
+
+class FakeSandbox:
+    def __init__(self, sandbox_id):
+        self.id = sandbox_id
+        self.labels = {}
+
+    async def set_labels(self, labels):
+        self.labels = labels
+
+    async def get_preview_link(self, port):
+        return types.SimpleNamespace(url=f"https://{port}-{self.id}.example", token="token")
+
+
+class FakeDaytona:
+    def __init__(self):
+        self.created = []
+        self.deleted = []
+        self.broken = set()
+
+    async def create_sandbox(self, password, project_id=None):
+        sandbox = FakeSandbox(f"new-{len(self.created)}")
+        self.created.append(sandbox.id)
+        return sandbox
+
+    async def get_or_start_sandbox(self, sandbox_id):
+        if sandbox_id in self.broken:
+            raise Exception("sandbox is in an error state")
+        return FakeSandbox(sandbox_id)
+
+    async def delete_sandbox(self, sandbox_id):
+        self.deleted.append(sandbox_id)
+
+
+def parked(sandbox_id, age=0):
+    return json.dumps({'id': sandbox_id, 'pass': f"pass-{sandbox_id}", 'created_at': time.time() - age})
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = FakeRedis()
+    for name in ("set", "delete", "rpush", "lrange", "lpop", "llen", "lrem", "sadd", "smembers", "srem", "keys"):
+        monkeypatch.setattr(warm_pool.redis, name, getattr(fake, name))
+    return fake
+
+
+@pytest.fixture
+def daytona(monkeypatch):
+    fake = FakeDaytona()
+    for name in ("create_sandbox", "get_or_start_sandbox", "delete_sandbox"):
+        monkeypatch.setattr(sandbox_module, name, getattr(fake, name))
+        monkeypatch.setattr(handle_pool, name, getattr(fake, name))
+    return fake
+
+
+@pytest.fixture
+def replenish_requests(monkeypatch):
+    monkeypatch.setattr(warm_pool.config, "SANDBOX_WARM_POOL_SIZE", 2)
+    monkeypatch.setattr(warm_pool.Configuration, "SANDBOX_SNAPSHOT_NAME", SNAPSHOT)
+    requests = []
+    monkeypatch.setattr(warm_pool, "_schedule_replenish", lambda: requests.append(1))
+    return requests
+
+
+async def settle_deletes():
+    await asyncio.gather(*list(warm_pool._pending_deletes))
+
+
+@pytest.mark.asyncio
+async def test_claim_from_empty_pool_returns_none(fake_redis, daytona, replenish_requests):
+    assert await warm_pool.claim_sandbox("p1") is None
+    assert replenish_requests == [1]
+    assert daytona.created == []
+
+
+@pytest.mark.asyncio
+async def test_claim_labels_and_returns_parked_sandbox(fake_redis, daytona, replenish_requests):
+    await fake_redis.rpush(POOL_KEY, parked("s1"))
+    sandbox, sandbox_pass = await warm_pool.claim_sandbox("p1")
+    assert (sandbox.id, sandbox_pass, sandbox.labels) == ("s1", "pass-s1", {'id': "p1"})
+    assert await fake_redis.llen(POOL_KEY) == 0
+    assert replenish_requests == [1]
+
+
+@pytest.mark.asyncio
+async def test_claim_skips_and_deletes_expired_entries(fake_redis, daytona, replenish_requests):
+    await fake_redis.rpush(POOL_KEY, parked("old", age=warm_pool.MAX_PARKED_AGE + 60), parked("fresh"))
+    sandbox, _ = await warm_pool.claim_sandbox("p1")
+    await settle_deletes()
+    assert sandbox.id == "fresh"
+    assert daytona.deleted == ["old"]
+    assert not warm_pool._pending_deletes
+
+
+@pytest.mark.asyncio
+async def test_failed_claim_falls_back_to_creation(fake_redis, daytona, replenish_requests):
+    await fake_redis.rpush(POOL_KEY, parked("broken"))
+    daytona.broken.add("broken")
+
+    class FakeProjects:
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: self
+
+        async def execute(self):
+            return types.SimpleNamespace(data=[{'project_id': "p1", 'sandbox': {}}])
+
+    client = types.SimpleNamespace(table=lambda name: FakeProjects())
+    handle = await handle_pool.SandboxHandlePool()._resolve(client, "p1")
+    await settle_deletes()
+
+    assert handle.sandbox_id == "new-0"
+    assert daytona.deleted == ["broken"]
+    assert await fake_redis.llen(POOL_KEY) == 0
+
+
+@pytest.mark.asyncio
+async def test_replenish_tops_up_retires_expired_and_drains_previous_snapshots(fake_redis, daytona, replenish_requests):
+    previous_pool = f"{warm_pool.POOL_KEY_PREFIX}snapshot-v1"
+    await fake_redis.rpush(previous_pool, parked("v1-a"), parked("v1-b"))
+    await fake_redis.sadd(warm_pool.POOL_KEYS_KEY, previous_pool)
+    await fake_redis.rpush(POOL_KEY, parked("expired", age=warm_pool.MAX_PARKED_AGE + 60))
+
+    assert await warm_pool.replenish() == 2
+
+    assert sorted(daytona.deleted) == ["expired", "v1-a", "v1-b"]
+    assert await fake_redis.llen(previous_pool) == 0
+    assert [json.loads(raw)['id'] for raw in await fake_redis.lrange(POOL_KEY, 0, -1)] == ["new-0", "new-1"]
+    assert f"{POOL_KEY}:replenish_lock" not in fake_redis.strings
+    assert fake_redis.sets[warm_pool.POOL_KEYS_KEY] == {POOL_KEY}
+
+
+@pytest.mark.asyncio
+async def test_replenish_is_guarded_by_lock(monkeypatch, fake_redis, daytona, replenish_requests):
+    release = asyncio.Event()
+    create = daytona.create_sandbox
+
+    async def slow_create(password, project_id=None):
+        await release.wait()
+        return await create(password, project_id)
+
+    monkeypatch.setattr(sandbox_module, "create_sandbox", slow_create)
+    first = asyncio.create_task(warm_pool.replenish())
+    await asyncio.sleep(0)
+    # A second replenishment while the first holds the lock creates nothing
+    assert await warm_pool.replenish() == 0
+    release.set()
+    assert await first == 2
+
+    # The lock is released afterwards, and the pool is full
+    assert f"{POOL_KEY}:replenish_lock" not in fake_redis.strings
+    assert await warm_pool.replenish() == 0
+    assert len(daytona.created) == 2
@@ -9,7 +9,7 @@ import json
 import hmac
 
 from services.supabase import DBConnection
-from utils.auth_utils import get_current_user_id_from_jwt
+from utils.auth_utils import get_current_user_id_from_jwt, verify_agent_access as verify_agent_ownership
 from utils.logger import logger
 from flags.flags import is_enabled
 from utils.config import config
@@ -18,6 +18,8 @@ from services.billing import check_billing_status, can_use_model
 from .trigger_service import get_trigger_service, TriggerType
 from .provider_service import get_provider_service
 from .execution_service import get_execution_service
+from .intake import enqueue_trigger_event, webhook_idempotency_key
+from .scheduler import start_local_scheduler, stop_local_scheduler, get_local_scheduler
 from .utils import get_next_run_time, get_human_readable_schedule
 
 
@@ -129,14 +131,16 @@ WorkflowStepRequest.model_rebuild()
 def initialize(database: DBConnection):
     global db
     db = database
+    start_local_scheduler(database)
+
+
+async def cleanup():
+    await stop_local_scheduler()
 
 
 async def verify_agent_access(agent_id: str, user_id: str):
     client = await db.client
-    result = await client.table('agents').select('agent_id').eq('agent_id', agent_id).eq('account_id', user_id).execute()
-    
-    if not result.data:
-        raise HTTPException(status_code=404, detail="Agent not found or access denied")
+    await verify_agent_ownership(client, agent_id, user_id)
 
 
 async def sync_workflows_to_version_config(agent_id: str):
@@ -290,6 +294,7 @@ async def get_agent_upcoming_runs(
             if trigger.is_active and trigger.trigger_type == TriggerType.SCHEDULE
         ]
         
+        scheduler = get_local_scheduler()
         upcoming_runs = []
         for trigger in schedule_triggers:
             config = trigger.config
@@ -300,7 +305,9 @@ async def get_agent_upcoming_runs(
                 continue
                 
             try:
-                next_run = get_next_run_time(cron_expression, user_timezone)
+                next_run = scheduler.next_run_time(trigger.trigger_id) if scheduler else None
+                if not next_run:
+                    next_run = get_next_run_time(cron_expression, user_timezone)
                 if not next_run:
                     continue
                 
@@ -549,62 +556,22 @@ async def trigger_webhook(
         except:
             pass
         
-        # Process trigger event
-        trigger_service = get_trigger_service(db)
-        result = await trigger_service.process_trigger_event(trigger_id, raw_data)
-        
-        if not result.success:
-            return JSONResponse(
-                status_code=400,
-                content={"success": False, "error": result.error_message}
-            )
-        
-        # Execute if needed
-        if result.should_execute_agent or result.should_execute_workflow:
-            trigger = await trigger_service.get_trigger(trigger_id)
-            if trigger:
-                logger.info(f"Executing agent {trigger.agent_id} for trigger {trigger_id}")
-                
-                from .trigger_service import TriggerEvent
-                event = TriggerEvent(
-                    trigger_id=trigger_id,
-                    agent_id=trigger.agent_id,
-                    trigger_type=trigger.trigger_type,
-                    raw_data=raw_data
-                )
-                
-                execution_service = get_execution_service(db)
-                execution_result = await execution_service.execute_trigger_result(
-                    agent_id=trigger.agent_id,
-                    trigger_result=result,
-                    trigger_event=event
-                )
-                
-                logger.info(f"Agent execution result: {execution_result}")
-                
-                return JSONResponse(content={
-                    "success": True,
-                    "message": "Trigger processed and agent execution started",
-                    "execution": execution_result,
-                    "trigger_result": {
-                        "should_execute_agent": result.should_execute_agent,
-                        "should_execute_workflow": result.should_execute_workflow,
-                        "agent_prompt": result.agent_prompt
-                    }
-                })
-            else:
-                logger.warning(f"Trigger {trigger_id} not found for execution")
-        
-        logger.info(f"Webhook processed but no execution needed")
-        return JSONResponse(content={
-            "success": True,
-            "message": "Trigger processed successfully (no execution needed)",
-            "trigger_result": {
-                "should_execute_agent": result.should_execute_agent,
-                "should_execute_workflow": result.should_execute_workflow
+        # Queue the event; the trigger runs in a background worker
+        idempotency_key, ttl = webhook_idempotency_key(raw_data, request.headers)
+        event_id, queued = await enqueue_trigger_event(trigger_id, raw_data, idempotency_key, ttl)
+        
+        return JSONResponse(
+            status_code=202,
+            content={
+                "success": True,
+                "message": "Trigger event queued" if queued else "Duplicate trigger event ignored",
+                "event_id": event_id,
+                "duplicate": not queued
             }
-        })
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing webhook trigger: {e}")
         return JSONResponse(
@@ -130,9 +130,14 @@ class SessionManager:
         
         try:
             from sandbox.sandbox import create_sandbox, delete_sandbox
+            from sandbox.warm_pool import claim_sandbox
             
-            sandbox_pass = str(uuid.uuid4())
-            sandbox = await create_sandbox(sandbox_pass, project_id)
+            claimed = await claim_sandbox(project_id)
+            if claimed:
+                sandbox, sandbox_pass = claimed
+            else:
+                sandbox_pass = str(uuid.uuid4())
+                sandbox = await create_sandbox(sandbox_pass, project_id)
             sandbox_id = sandbox.id
             
             vnc_link = await sandbox.get_preview_link(6080)
@@ -0,0 +1,224 @@
+"""
+Asynchronous intake of trigger events.
+
+Webhook endpoints only authenticate the request, record the event under an
+idempotency key and enqueue it; the `process_trigger_webhook` actor then runs
+the trigger and starts the agent or workflow. This keeps responses well within
+the 8s timeout of the Supabase Cron job and keeps webhook bursts out of the
+request path:
+
+- Duplicate deliveries of an event (provider retries, cron double fires) are
+  coalesced on the idempotency key, both while queued and after processing.
+- Processing is admitted through per-agent and per-account slots; an event
+  that finds no free slot is re-enqueued with a delay instead of piling up
+  concurrent project/sandbox/thread creation.
+"""
+
+import random
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from services import redis
+from services.supabase import DBConnection
+from utils.config import config
+from utils.logger import logger
+
+EVENT_KEY_TTL = 24 * 3600
+UNKEYED_EVENT_TTL = 10 * 60
+PROCESSING_LOCK_TTL = 5 * 60
+SLOT_TTL = 5 * 60
+ADMISSION_RETRY_DELAY_MS = (1000, 5000)
+MAX_ADMISSION_ATTEMPTS = 100
+
+# trigger_id -> (agent_id, account_id); neither changes for the lifetime of a trigger
+_trigger_scopes: Dict[str, Tuple[str, str]] = {}
+MAX_TRIGGER_SCOPES = 10000
+
+
+def schedule_idempotency_key(fire_time: datetime) -> str:
+    """One event per trigger and firing minute, whichever scheduler backend delivers it."""
+    return f"schedule:{fire_time.astimezone(timezone.utc).strftime('%Y%m%dT%H%M')}"
+
+
+def webhook_idempotency_key(raw_data: Dict[str, Any], headers) -> Tuple[str, int]:
+    """Derive the idempotency key of a webhook delivery and how long to remember it."""
+    explicit = headers.get("idempotency-key") or headers.get("x-idempotency-key") or headers.get("webhook-id")
+    if explicit:
+        return explicit, EVENT_KEY_TTL
+
+    if (headers.get("x-trigger-source") or "").lower() == "schedule":
+        # The cron job posts the same body on every run: one event per firing minute
+        return schedule_idempotency_key(datetime.now(timezone.utc)), EVENT_KEY_TTL
+
+    # Without an event id two identical bodies may be two legitimate events, so every
+    # such delivery is its own event; the key only guards the queued event itself
+    return f"request:{uuid.uuid4()}", UNKEYED_EVENT_TTL
+
+
+def _event_key(trigger_id: str, idempotency_key: str) -> str:
+    return f"trigger_event:{trigger_id}:{idempotency_key}"
+
+
+async def enqueue_trigger_event(
+    trigger_id: str,
+    raw_data: Dict[str, Any],
+    idempotency_key: str,
+    ttl: int = EVENT_KEY_TTL,
+    trigger_type: Optional[str] = None,
+    context: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, bool]:
+    """Queue a trigger event for processing. Returns the event id and whether it was queued (False for a duplicate)."""
+    event_key = _event_key(trigger_id, idempotency_key)
+    event_id = str(uuid.uuid4())
+
+    if not await redis.set(event_key, f"queued:{event_id}", ex=ttl, nx=True):
+        existing = await redis.get(event_key) or ""
+        logger.info(f"Coalesced duplicate event for trigger {trigger_id} ({idempotency_key}): {existing}")
+        return existing.split(":", 1)[-1] or event_id, False
+
+    from run_agent_background import process_trigger_webhook
+    try:
+        process_trigger_webhook.send(
+            trigger_id=trigger_id,
+            event_id=event_id,
+            event_key=event_key,
+            event_ttl=ttl,
+            raw_data=raw_data,
+            trigger_type=trigger_type,
+            context=context,
+        )
+    except Exception:
+        await redis.delete(event_key)
+        raise
+
+    logger.info(f"Queued event {event_id} for trigger {trigger_id}")
+    return event_id, True
+
+
+async def _get_trigger_scope(client, trigger_id: str) -> Optional[Tuple[str, str]]:
+    scope = _trigger_scopes.get(trigger_id)
+    if scope:
+        return scope
+
+    trigger = await client.table('agent_triggers').select('agent_id').eq('trigger_id', trigger_id).execute()
+    if not trigger.data:
+        return None
+    agent_id = trigger.data[0]['agent_id']
+    agent = await client.table('agents').select('account_id').eq('agent_id', agent_id).execute()
+    if not agent.data:
+        return None
+
+    if len(_trigger_scopes) >= MAX_TRIGGER_SCOPES:
+        _trigger_scopes.clear()
+    scope = _trigger_scopes[trigger_id] = (agent_id, agent.data[0]['account_id'])
+    return scope
+
+
+async def _acquire_slot(scope: str, limit: int, holder: str) -> Optional[str]:
+    # A slot is a key with a TTL, so slots of a crashed worker free themselves
+    for index in random.sample(range(limit), limit):
+        slot_key = f"trigger_slot:{scope}:{index}"
+        if await redis.set(slot_key, holder, ex=SLOT_TTL, nx=True):
+            return slot_key
+    return None
+
+
+async def _release_slot(slot_key: Optional[str]):
+    if slot_key:
+        try:
+            await redis.delete(slot_key)
+        except Exception as e:
+            logger.warning(f"Failed to release trigger slot {slot_key}: {e}")
+
+
+async def process_trigger_event(
+    db: DBConnection,
+    trigger_id: str,
+    event_id: str,
+    event_key: str,
+    event_ttl: int,
+    raw_data: Dict[str, Any],
+    trigger_type: Optional[str] = None,
+    context: Optional[Dict[str, Any]] = None,
+    attempt: int = 0,
+) -> Optional[int]:
+    """Process a queued trigger event. Returns a delay in ms when it could not be admitted yet and must be re-enqueued."""
+    state = await redis.get(event_key)
+    if state and not state.startswith("queued:"):
+        logger.info(f"Skipping event {event_id} for trigger {trigger_id}: already {state.split(':', 1)[0]}")
+        return None
+
+    lock_key = f"{event_key}:lock"
+    if not await redis.set(lock_key, event_id, ex=PROCESSING_LOCK_TTL, nx=True):
+        logger.info(f"Event {event_id} for trigger {trigger_id} is already being processed")
+        return None
+
+    agent_slot = account_slot = None
+    outcome = "failed"
+    try:
+        client = await db.client
+        scope = await _get_trigger_scope(client, trigger_id)
+        if not scope:
+            logger.warning(f"Dropping event {event_id}: trigger {trigger_id} not found")
+            return None
+        agent_id, account_id = scope
+
+        agent_slot = await _acquire_slot(f"agent:{agent_id}", config.TRIGGER_INTAKE_MAX_PER_AGENT, event_id)
+        if agent_slot:
+            account_slot = await _acquire_slot(f"account:{account_id}", config.TRIGGER_INTAKE_MAX_PER_ACCOUNT, event_id)
+        if not agent_slot or not account_slot:
+            if attempt + 1 >= MAX_ADMISSION_ATTEMPTS:
+                logger.error(f"Dropping event {event_id} for trigger {trigger_id}: not admitted after {attempt + 1} attempts")
+                return None
+            outcome = "queued"
+            return random.randint(*ADMISSION_RETRY_DELAY_MS)
+
+        from .trigger_service import get_trigger_service, TriggerEvent, TriggerType
+        from .execution_service import get_execution_service
+
+        trigger_service = get_trigger_service(db)
+        result = await trigger_service.process_trigger_event(trigger_id, raw_data)
+        if not result.success:
+            logger.warning(f"Trigger {trigger_id} rejected event {event_id}: {result.error_message}")
+            return None
+
+        if result.should_execute_agent or result.should_execute_workflow:
+            trigger = await trigger_service.get_trigger(trigger_id)
+            if not trigger:
+                logger.warning(f"Trigger {trigger_id} not found for execution")
+                return None
+
+            event = TriggerEvent(
+                trigger_id=trigger_id,
+                agent_id=trigger.agent_id,
+                trigger_type=TriggerType(trigger_type) if trigger_type else trigger.trigger_type,
+                raw_data=raw_data,
+                context=context or {},
+            )
+            execution_service = get_execution_service(db)
+            execution_result = await execution_service.execute_trigger_result(
+                agent_id=trigger.agent_id,
+                trigger_result=result,
+                trigger_event=event
+            )
+            logger.info(f"Agent execution result for event {event_id}: {execution_result}")
+        else:
+            logger.info(f"Event {event_id} for trigger {trigger_id} processed, no execution needed")
+
+        outcome = "done"
+        return None
+
+    except Exception as e:
+        logger.error(f"Error processing event {event_id} for trigger {trigger_id}: {e}", exc_info=True)
+        return None
+
+    finally:
+        await _release_slot(account_slot)
+        await _release_slot(agent_slot)
+        if outcome != "queued":
+            try:
+                await redis.set(event_key, f"{outcome}:{event_id}", ex=event_ttl)
+            except Exception as e:
+                logger.warning(f"Failed to record outcome of event {event_id}: {e}")
+        await redis.delete(lock_key)
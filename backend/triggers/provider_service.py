@@ -78,6 +78,15 @@ class ScheduleProvider(TriggerProvider):
         return config
     
     async def setup_trigger(self, trigger: Trigger) -> bool:
+        if config.TRIGGER_SCHEDULER_BACKEND == "local":
+            from .scheduler import publish_schedule_change
+            try:
+                await publish_schedule_change(trigger.trigger_id, trigger.agent_id, trigger.config)
+                return True
+            except Exception as e:
+                logger.error(f"Failed to publish schedule of trigger {trigger.trigger_id}: {e}")
+                return False
+        
         try:
             webhook_url = f"{self._webhook_base_url}/api/triggers/{trigger.trigger_id}/webhook"
             cron_expression = trigger.config['cron_expression']
@@ -145,6 +154,17 @@ class ScheduleProvider(TriggerProvider):
             return False
     
     async def teardown_trigger(self, trigger: Trigger) -> bool:
+        if config.TRIGGER_SCHEDULER_BACKEND == "local":
+            from .scheduler import publish_schedule_change
+            try:
+                await publish_schedule_change(trigger.trigger_id)
+            except Exception as e:
+                logger.error(f"Failed to publish removal of schedule trigger {trigger.trigger_id}: {e}")
+                return False
+            # Triggers created under the Supabase Cron backend still have a job to remove
+            if not trigger.config.get('cron_job_name'):
+                return True
+        
         try:
             job_name = trigger.config.get('cron_job_name') or f"trigger_{trigger.trigger_id}"
             client = await self._db.client
@@ -0,0 +1,346 @@
+"""
+Local scheduler backend for schedule triggers.
+
+With `TRIGGER_SCHEDULER_BACKEND=local`, schedule triggers no longer become
+Supabase Cron jobs that call back into the webhook endpoint. Instead every API
+process keeps a `ScheduleIndex` (a heap of next-fire times of all active
+schedule triggers) and fires due triggers itself:
+
+- The index is loaded from `agent_triggers` at startup, kept in sync through
+  the `trigger_schedules` pub/sub channel on create/update/delete, and fully
+  reloaded every `RESYNC_INTERVAL` to heal missed messages.
+- Firing goes through the trigger intake under the same per-minute idempotency
+  key the cron webhook uses, so exactly one process (and only one of cron and
+  local while migrating) fires each occurrence.
+- `get_agent_upcoming_runs` reads next-fire times from the index instead of
+  recomputing croniter for every trigger on every request.
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import croniter
+import pytz
+
+from services import redis
+from services.supabase import DBConnection
+from utils.config import config
+from utils.logger import logger
+
+SCHEDULE_CHANNEL = "trigger_schedules"
+LOAD_PAGE_SIZE = 1000
+RESYNC_INTERVAL = 10 * 60
+MAX_SLEEP = 30
+FIRE_CONCURRENCY = 50
+
+_versions = itertools.count()
+
+
+# Triggers share a handful of schedules and are (re)computed for the same instant
+# in bulk (index load, a minute's due occurrences), so croniter mostly runs once
+# per distinct (expression, timezone) instead of once per trigger
+@functools.lru_cache(maxsize=65536)
+def next_fire_time(cron_expression: str, user_timezone: str, after: float) -> Optional[float]:
+    """Epoch seconds of the first occurrence of the cron expression (in the user's timezone) after `after`."""
+    try:
+        start = datetime.fromtimestamp(after, pytz.timezone(user_timezone or 'UTC'))
+        return croniter.croniter(cron_expression, start).get_next(datetime).timestamp()
+    except Exception as e:
+        logger.warning(f"Invalid schedule '{cron_expression}' ({user_timezone}): {e}")
+        return None
+
+
+def schedule_payload(trigger_id: str, agent_id: str, trigger_config: Dict[str, Any], fire_time: float) -> Dict[str, Any]:
+    """Event payload of a schedule occurrence, same shape as the body of the Supabase Cron job."""
+    return {
+        "trigger_id": trigger_id,
+        "agent_id": agent_id,
+        "execution_type": trigger_config.get('execution_type', 'agent'),
+        "agent_prompt": trigger_config.get('agent_prompt'),
+        "workflow_id": trigger_config.get('workflow_id'),
+        "workflow_input": trigger_config.get('workflow_input', {}),
+        "timestamp": datetime.fromtimestamp(fire_time, timezone.utc).isoformat()
+    }
+
+
+@dataclass
+class ScheduleEntry:
+    trigger_id: str
+    agent_id: str
+    config: Dict[str, Any]
+    next_fire: float
+    version: int
+
+
+class ScheduleIndex:
+    """Heap of next-fire times with O(1) lookup by trigger_id; replaced entries are dropped lazily from the heap."""
+
+    def __init__(self):
+        self._entries: Dict[str, ScheduleEntry] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        # Latest instant `pop_due` has fired up to; reloads schedule from here so no occurrence falls in between
+        self.processed_until: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def build_entry(trigger_id: str, agent_id: str, trigger_config: Dict[str, Any], now: float) -> Optional[ScheduleEntry]:
+        cron_expression = trigger_config.get('cron_expression')
+        if not cron_expression:
+            return None
+        next_fire = next_fire_time(cron_expression, trigger_config.get('timezone', 'UTC'), now)
+        if next_fire is None:
+            return None
+        return ScheduleEntry(trigger_id, agent_id, trigger_config, next_fire, next(_versions))
+
+    def replace_all(self, entries: List[ScheduleEntry]):
+        self._entries = {entry.trigger_id: entry for entry in entries}
+        self._heap = [(entry.next_fire, entry.version, entry.trigger_id) for entry in self._entries.values()]
+        heapq.heapify(self._heap)
+
+    def upsert(self, trigger_id: str, agent_id: str, trigger_config: Dict[str, Any], now: Optional[float] = None) -> Optional[float]:
+        entry = self.build_entry(trigger_id, agent_id, trigger_config, now or time.time())
+        if entry is None:
+            self.remove(trigger_id)
+            return None
+        self._push(entry)
+        return entry.next_fire
+
+    def remove(self, trigger_id: str):
+        self._entries.pop(trigger_id, None)
+
+    def get(self, trigger_id: str) -> Optional[ScheduleEntry]:
+        return self._entries.get(trigger_id)
+
+    def next_fire(self, trigger_id: str) -> Optional[float]:
+        entry = self._entries.get(trigger_id)
+        return entry.next_fire if entry else None
+
+    def peek(self) -> Optional[float]:
+        while self._heap:
+            next_fire, version, trigger_id = self._heap[0]
+            entry = self._entries.get(trigger_id)
+            if entry is not None and entry.version == version:
+                return next_fire
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: float) -> List[Tuple[ScheduleEntry, float]]:
+        """Remove the occurrences due at `now` and reschedule their triggers; returns (entry, fire_time) pairs."""
+        self.processed_until = max(now, self.processed_until or now)
+        due = []
+        while self.peek() is not None and self._heap[0][0] <= now:
+            fire_time, _, trigger_id = heapq.heappop(self._heap)
+            entry = self._entries[trigger_id]
+            due.append((entry, fire_time))
+            next_fire = next_fire_time(entry.config['cron_expression'], entry.config.get('timezone', 'UTC'), max(fire_time, now))
+            if next_fire is None:
+                self.remove(trigger_id)
+                continue
+            self._push(ScheduleEntry(trigger_id, entry.agent_id, entry.config, next_fire, next(_versions)))
+        return due
+
+    def _push(self, entry: ScheduleEntry):
+        self._entries[entry.trigger_id] = entry
+        heapq.heappush(self._heap, (entry.next_fire, entry.version, entry.trigger_id))
+
+
+class LocalScheduler:
+    """Fires schedule triggers of the index in this process, claiming each occurrence through the intake."""
+
+    def __init__(self, db: DBConnection):
+        self._db = db
+        self.index = ScheduleIndex()
+        self.loaded = False
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(FIRE_CONCURRENCY)
+        self._tasks: List[asyncio.Task] = []
+        self._firing: Set[asyncio.Task] = set()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._listen())]
+            logger.info("Started local trigger scheduler")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def next_run_time(self, trigger_id: str) -> Optional[datetime]:
+        next_fire = self.index.next_fire(trigger_id) if self.loaded else None
+        return datetime.fromtimestamp(next_fire, timezone.utc) if next_fire else None
+
+    def apply_change(self, change: Dict[str, Any]):
+        if change.get('action') == 'upsert':
+            self.index.upsert(change['trigger_id'], change['agent_id'], change.get('config') or {})
+        else:
+            self.index.remove(change['trigger_id'])
+        self._wakeup.set()
+
+    async def load(self):
+        load_started = time.time()
+        client = await self._db.client
+        rows, last_id = [], None
+        while True:
+            query = client.table('agent_triggers').select('trigger_id, agent_id, config') \
+                .eq('trigger_type', 'schedule').eq('is_active', True) \
+                .order('trigger_id').limit(LOAD_PAGE_SIZE)
+            if last_id:
+                query = query.gt('trigger_id', last_id)
+            page = (await query.execute()).data or []
+            rows.extend(page)
+            if len(page) < LOAD_PAGE_SIZE:
+                break
+            last_id = page[-1]['trigger_id']
+
+        def unchanged(row: Dict[str, Any]) -> Optional[ScheduleEntry]:
+            existing = self.index.get(row['trigger_id'])
+            if existing is not None and existing.agent_id == row['agent_id'] and existing.config == (row.get('config') or {}):
+                return existing
+            return None
+
+        def build(after: float, changed: List[Dict[str, Any]]) -> Dict[str, ScheduleEntry]:
+            entries = (ScheduleIndex.build_entry(row['trigger_id'], row['agent_id'], row.get('config') or {}, after) for row in changed)
+            return {entry.trigger_id: entry for entry in entries if entry}
+
+        start = time.monotonic()
+        # New and changed triggers are scheduled from the last instant already fired, not from the end
+        # of the load, so occurrences falling due while the triggers were read are still fired
+        after = self.index.processed_until if self.index.processed_until is not None else load_started
+        changed = [row for row in rows if unchanged(row) is None]
+        changed_ids = {row['trigger_id'] for row in changed}
+        built = await asyncio.to_thread(build, after, changed)
+        entries = []
+        for row in rows:
+            # Unchanged triggers keep their pending occurrence (as of now, after any firing during the build)
+            entry = unchanged(row)
+            if entry is None:
+                if row['trigger_id'] in changed_ids:
+                    entry = built.get(row['trigger_id'])
+                else:
+                    # Changed through a pub/sub update while the build ran
+                    entry = ScheduleIndex.build_entry(row['trigger_id'], row['agent_id'], row.get('config') or {}, after)
+            if entry:
+                entries.append(entry)
+        self.index.replace_all(entries)
+        self.loaded = True
+        self._wakeup.set()
+        logger.info(f"Loaded {len(entries)} schedule triggers in {time.monotonic() - start:.2f}s")
+
+    async def _run(self):
+        last_sync = None
+        while True:
+            try:
+                # Fire what is due before a resync, and again after it for what fell due during the load
+                self._fire_due()
+                if last_sync is None or time.monotonic() - last_sync > RESYNC_INTERVAL:
+                    await self.load()
+                    last_sync = time.monotonic()
+                    self._fire_due()
+
+                next_fire = self.index.peek()
+                delay = MAX_SLEEP if next_fire is None else min(max(next_fire - time.time(), 0), MAX_SLEEP)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in local trigger scheduler: {e}", exc_info=True)
+                await asyncio.sleep(5)
+
+    def _fire_due(self):
+        for entry, fire_time in self.index.pop_due(time.time()):
+            task = asyncio.create_task(self._fire(entry, fire_time))
+            self._firing.add(task)
+            task.add_done_callback(self._firing.discard)
+
+    async def _fire(self, entry: ScheduleEntry, fire_time: float):
+        from .intake import enqueue_trigger_event, schedule_idempotency_key
+        async with self._semaphore:
+            try:
+                payload = schedule_payload(entry.trigger_id, entry.agent_id, entry.config, fire_time)
+                event_id, queued = await enqueue_trigger_event(
+                    entry.trigger_id, payload,
+                    schedule_idempotency_key(datetime.fromtimestamp(fire_time, timezone.utc))
+                )
+                if queued:
+                    logger.info(f"Fired schedule trigger {entry.trigger_id} ({time.time() - fire_time:.3f}s after due): event {event_id}")
+            except Exception as e:
+                logger.error(f"Failed to fire schedule trigger {entry.trigger_id}: {e}")
+
+    async def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = await redis.create_pubsub()
+                await pubsub.subscribe(SCHEDULE_CHANNEL)
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message.get('type') == 'message':
+                        self.apply_change(json.loads(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Schedule change listener failed, resubscribing: {e}")
+                await asyncio.sleep(5)
+                # Changes published while disconnected were missed
+                try:
+                    self._fire_due()
+                    await self.load()
+                    self._fire_due()
+                except Exception as load_error:
+                    logger.error(f"Failed to reload schedule triggers: {load_error}")
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe(SCHEDULE_CHANNEL)
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+
+_scheduler: Optional[LocalScheduler] = None
+
+
+def start_local_scheduler(db: DBConnection) -> Optional[LocalScheduler]:
+    global _scheduler
+    if config.TRIGGER_SCHEDULER_BACKEND != "local":
+        return None
+    if _scheduler is None:
+        _scheduler = LocalScheduler(db)
+    _scheduler.start()
+    return _scheduler
+
+
+async def stop_local_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.stop()
+        _scheduler = None
+
+
+def get_local_scheduler() -> Optional[LocalScheduler]:
+    return _scheduler if _scheduler is not None and _scheduler.loaded else None
+
+
+async def publish_schedule_change(trigger_id: str, agent_id: Optional[str] = None, trigger_config: Optional[Dict[str, Any]] = None):
+    """Propagate a created/updated (with config) or removed (without) schedule to every scheduler."""
+    change = {"action": "upsert" if trigger_config is not None else "remove", "trigger_id": trigger_id}
+    if trigger_config is not None:
+        change.update(agent_id=agent_id, config=trigger_config)
+    if _scheduler is not None:
+        _scheduler.apply_change(change)
+    await redis.publish(SCHEDULE_CHANNEL, json.dumps(change, default=str))
@@ -1,13 +1,213 @@
 import sentry
 from fastapi import HTTPException, Request, Header
-from typing import Optional
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+import httpx
 import jwt
-from jwt.exceptions import PyJWTError
+from jwt.exceptions import PyJWTError, PyJWKSetError
 from utils.logger import structlog
 from utils.config import config
 import os
 from services.supabase import DBConnection
-from services import redis
+from services import postgres, redis
+from utils.cache import Cache
+
+JWKS_REFRESH_INTERVAL = 10 * 60
+JWKS_MIN_REFETCH_INTERVAL = 30
+VERIFIED_TOKEN_TTL = 5 * 60
+# Tokens checked through Supabase Auth are cached briefly, since their expiry isn't read from the token
+REMOTE_VERIFIED_TOKEN_TTL = 60
+VERIFIED_TOKEN_CACHE_SIZE = 4096
+OWNER_LOCAL_TTL = 60
+OWNER_REDIS_TTL = 10 * 60
+
+
+class _TTLCache:
+    """Small in-process LRU with per-entry expiry."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str):
+        self._data.pop(key, None)
+
+
+_verified_tokens = _TTLCache(VERIFIED_TOKEN_CACHE_SIZE, VERIFIED_TOKEN_TTL)
+_jwks: Dict[str, Any] = {"keys": {}, "fetched_at": 0.0}
+_jwks_lock = asyncio.Lock()
+_remote_verification_logged = False
+
+# Access decisions already taken in the current request, so repeated checks of
+# the same thread or agent (dependencies, nested helpers) don't query again
+_request_access_memo: ContextVar[Optional[Dict[str, bool]]] = ContextVar("request_access_memo", default=None)
+
+
+def start_request_auth_scope():
+    """Start a fresh memo of access decisions for the current request. Called by the request middleware."""
+    _request_access_memo.set({})
+
+
+def _memo_granted(key: str) -> bool:
+    memo = _request_access_memo.get()
+    return memo is not None and memo.get(key, False)
+
+
+def _memo_grant(key: str):
+    memo = _request_access_memo.get()
+    if memo is not None:
+        memo[key] = True
+
+
+async def _get_jwks_key(kid: Optional[str]):
+    """Return the Supabase signing key with the given kid, refreshing the cached JWKS when needed."""
+    key = _jwks["keys"].get(kid)
+    if key is not None and time.monotonic() - _jwks["fetched_at"] < JWKS_REFRESH_INTERVAL:
+        return key
+
+    async with _jwks_lock:
+        key = _jwks["keys"].get(kid)
+        elapsed = time.monotonic() - _jwks["fetched_at"]
+        # Unknown kids only trigger a refetch every JWKS_MIN_REFETCH_INTERVAL, so forged tokens can't hammer the endpoint
+        if (key is not None and elapsed < JWKS_REFRESH_INTERVAL) or (key is None and elapsed < JWKS_MIN_REFETCH_INTERVAL):
+            return key
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as http:
+                response = await http.get(f"{config.SUPABASE_URL}/auth/v1/.well-known/jwks.json")
+                response.raise_for_status()
+            try:
+                keys = {k.key_id: k for k in jwt.PyJWKSet.from_dict(response.json()).keys}
+            except PyJWKSetError:
+                keys = {}
+            _jwks["keys"] = keys
+        except Exception as e:
+            structlog.get_logger().error(f"Failed to fetch Supabase JWKS: {e}")
+        _jwks["fetched_at"] = time.monotonic()
+        return _jwks["keys"].get(kid)
+
+
+async def _verify_with_supabase(token: str) -> Dict[str, Any]:
+    """Check a token with Supabase Auth and return the claims the API uses."""
+    try:
+        client = await DBConnection().client
+        response = await client.auth.get_user(token)
+    except Exception as e:
+        raise jwt.InvalidTokenError(f"Token rejected by Supabase Auth: {e}")
+    if response is None or response.user is None:
+        raise jwt.InvalidTokenError("Token rejected by Supabase Auth")
+    return {'sub': response.user.id, 'email': response.user.email, 'role': response.user.role}
+
+
+async def _decode_jwt(token: str) -> Dict[str, Any]:
+    """
+    Verify a Supabase JWT and return its claims.
+
+    HS256 tokens are verified locally with SUPABASE_JWT_SECRET, or through
+    Supabase Auth when no secret is configured; asymmetric ones against the
+    project's cached JWKS. Verified claims are cached per token until they
+    expire, so repeated requests with the same token skip signature checks.
+
+    Raises:
+        PyJWTError: If the token is malformed, expired or its signature is invalid
+    """
+    global _remote_verification_logged
+
+    payload = _verified_tokens.get(token)
+    if payload is not None:
+        return payload
+
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get('alg')
+    if algorithm == 'HS256':
+        if not config.SUPABASE_JWT_SECRET:
+            if not _remote_verification_logged:
+                structlog.get_logger().warning(
+                    "SUPABASE_JWT_SECRET is not configured; HS256 tokens are verified through Supabase Auth. "
+                    "Set it to verify them locally."
+                )
+                _remote_verification_logged = True
+            payload = await _verify_with_supabase(token)
+            _verified_tokens.set(token, payload, REMOTE_VERIFIED_TOKEN_TTL)
+            return payload
+        payload = jwt.decode(token, config.SUPABASE_JWT_SECRET, algorithms=['HS256'], options={"verify_aud": False})
+    elif algorithm in ('RS256', 'ES256'):
+        signing_key = await _get_jwks_key(header.get('kid'))
+        if signing_key is None:
+            raise jwt.InvalidTokenError("Unknown token signing key")
+        payload = jwt.decode(token, signing_key.key, algorithms=[algorithm], options={"verify_aud": False})
+    else:
+        raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {algorithm}")
+
+    ttl = VERIFIED_TOKEN_TTL
+    if payload.get('exp'):
+        ttl = min(ttl, payload['exp'] - time.time())
+    if ttl > 0:
+        _verified_tokens.set(token, payload, ttl)
+    return payload
+
+
+async def _get_cached_ownership(kind: str, entity_id: str, load: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+    """Ownership of a thread/agent from the in-process LRU, then Redis, then the database."""
+    return await Cache.get_or_load(f"auth_owner:{kind}:{entity_id}", load, OWNER_REDIS_TTL, l1_ttl=OWNER_LOCAL_TTL)
+
+
+async def invalidate_ownership_cache(kind: str, entity_id: str):
+    """Forget the cached owner of a thread or agent ("thread"/"agent"), e.g. after it was deleted."""
+    try:
+        await Cache.invalidate(f"auth_owner:{kind}:{entity_id}")
+    except Exception as e:
+        structlog.get_logger().warning(f"Failed to invalidate ownership of {kind}:{entity_id}: {e}")
+
+
+async def _get_thread_ownership(client, thread_id: str) -> Optional[dict]:
+    async def load():
+        pool = await postgres.get_pool()
+        if pool is not None:
+            return await postgres.get_thread_ownership(pool, thread_id)
+        result = await client.table('threads').select('account_id, project_id').eq('thread_id', thread_id).execute()
+        return result.data[0] if result.data else None
+    return await _get_cached_ownership("thread", thread_id, load)
+
+
+async def _get_agent_ownership(client, agent_id: str) -> Optional[dict]:
+    async def load():
+        result = await client.table('agents').select('agent_id, account_id').eq('agent_id', agent_id).execute()
+        return result.data[0] if result.data else None
+    return await _get_cached_ownership("agent", agent_id, load)
+
+
+_api_key_service = None
+
+
+async def _get_api_key_service():
+    global _api_key_service
+    if _api_key_service is None:
+        from services.api_keys import APIKeyService
+        db = DBConnection()
+        await db.initialize()
+        _api_key_service = APIKeyService(db)
+    return _api_key_service
 
 async def _get_user_id_from_account_cached(account_id: str) -> Optional[str]:
     """
@@ -94,10 +294,7 @@ async def get_current_user_id_from_jwt(request: Request) -> str:
             
             public_key, secret_key = x_api_key.split(':', 1)
             
-            from services.api_keys import APIKeyService
-            db = DBConnection()
-            await db.initialize()
-            api_key_service = APIKeyService(db)
+            api_key_service = await _get_api_key_service()
             
             validation_result = await api_key_service.validate_api_key(public_key, secret_key)
             
@@ -149,7 +346,7 @@ async def get_current_user_id_from_jwt(request: Request) -> str:
     token = auth_header.split(' ')[1]
     
     try:
-        payload = jwt.decode(token, options={"verify_signature": False})
+        payload = await _decode_jwt(token)
         user_id = payload.get('sub')
         
         if not user_id:
@@ -188,15 +385,15 @@ async def get_account_id_from_thread(client, thread_id: str) -> str:
         HTTPException: If the thread is not found or if there's an error
     """
     try:
-        response = await client.table('threads').select('account_id').eq('thread_id', thread_id).execute()
+        thread = await _get_thread_ownership(client, thread_id)
         
-        if not response.data or len(response.data) == 0:
+        if not thread:
             raise HTTPException(
                 status_code=404,
                 detail="Thread not found"
             )
         
-        account_id = response.data[0].get('account_id')
+        account_id = thread.get('account_id')
         
         if not account_id:
             raise HTTPException(
@@ -254,8 +451,7 @@ async def get_user_id_from_stream_auth(
         # Try to get user_id from token in query param (for EventSource which can't set headers)
         if token:
             try:
-                # For Supabase JWT, we just need to decode and extract the user ID
-                payload = jwt.decode(token, options={"verify_signature": False})
+                payload = await _decode_jwt(token)
                 user_id = payload.get('sub')
                 if user_id:
                     sentry.sentry.set_user({ "id": user_id })
@@ -304,16 +500,19 @@ async def verify_thread_access(client, thread_id: str, user_id: str):
     Raises:
         HTTPException: If the user doesn't have access to the thread
     """
+    memo_key = f"thread:{thread_id}:{user_id}"
+    if _memo_granted(memo_key):
+        return True
+
     try:
-        # Query the thread to get account information
-        thread_result = await client.table('threads').select('*').eq('thread_id', thread_id).execute()
+        # Ownership is cached; public visibility and membership can change at any time and are always queried
+        thread_data = await _get_thread_ownership(client, thread_id)
 
-        if not thread_result.data or len(thread_result.data) == 0:
+        if not thread_data:
             raise HTTPException(status_code=404, detail="Thread not found")
-        
-        thread_data = thread_result.data[0]
 
         if thread_data['account_id'] == user_id:
+            _memo_grant(memo_key)
             return True
         
         # Check if project is public
@@ -322,6 +521,7 @@ async def verify_thread_access(client, thread_id: str, user_id: str):
             project_result = await client.table('projects').select('is_public').eq('project_id', project_id).execute()
             if project_result.data and len(project_result.data) > 0:
                 if project_result.data[0].get('is_public'):
+                    _memo_grant(memo_key)
                     return True
             
         account_id = thread_data.get('account_id')
@@ -329,6 +529,7 @@ async def verify_thread_access(client, thread_id: str, user_id: str):
         if account_id:
             account_user_result = await client.schema('basejump').from_('account_user').select('account_role').eq('user_id', user_id).eq('account_id', account_id).execute()
             if account_user_result.data and len(account_user_result.data) > 0:
+                _memo_grant(memo_key)
                 return True
         raise HTTPException(status_code=403, detail="Not authorized to access this thread")
     except HTTPException:
@@ -369,8 +570,7 @@ async def get_optional_user_id(request: Request) -> Optional[str]:
     token = auth_header.split(' ')[1]
     
     try:
-        # For Supabase JWT, we just need to decode and extract the user ID
-        payload = jwt.decode(token, options={"verify_signature": False})
+        payload = await _decode_jwt(token)
         
         # Supabase stores the user ID in the 'sub' claim
         user_id = payload.get('sub')
@@ -415,18 +615,18 @@ async def verify_agent_access(client, agent_id: str, user_id: str) -> dict:
         user_id: The user ID to check permissions for
         
     Returns:
-        dict: Agent data if access is granted
+        dict: The agent's agent_id and account_id if access is granted
         
     Raises:
         HTTPException: If the user doesn't have access to the agent or agent doesn't exist
     """
     try:
-        agent_result = await client.table('agents').select('*').eq('agent_id', agent_id).eq('account_id', user_id).execute()
+        agent = await _get_agent_ownership(client, agent_id)
         
-        if not agent_result.data:
+        if not agent or agent['account_id'] != user_id:
             raise HTTPException(status_code=404, detail="Agent not found or access denied")
         
-        return agent_result.data[0]
+        return agent
         
     except HTTPException:
         raise
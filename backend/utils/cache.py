@@ -1,26 +1,385 @@
+"""
+Two-tier read-through cache: a bounded in-process LRU (L1) in front of Redis (L2).
+
+`Cache.get`/`Cache.set`/`Cache.invalidate` are plain Redis JSON helpers.
+`Cache.get_or_load` and the `cached` decorator build a read-through cache on
+top of them:
+
+- Single flight: concurrent misses of a key in a process share one load. Across
+  processes, a short Redis lock lets one process load while the others briefly
+  wait for its result.
+- Probabilistic early refresh (XFetch): as an entry approaches expiry, a read
+  refreshes it in the background with a probability that grows with how long
+  the load takes, so hot keys don't expire under load all at once.
+- Negative caching: a loader result of None is remembered for `negative_ttl`
+  when one is given, otherwise it is not cached.
+- Tags: entries can be invalidated as a group, e.g. everything cached for an
+  account's billing. Invalidations are published on `INVALIDATION_CHANNEL` so
+  every process drops its L1 copies right away.
+- Per-namespace hit/miss counters, see `Cache.metrics()`.
+
+L1 hands out the same object to every caller: treat cached values as read-only.
+"""
+
+import asyncio
+import functools
 import json
-from typing import Any
+import math
+import random
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from services import redis
 from services.redis import get_client
+from utils.logger import logger
+
+KEY_PREFIX = "cache:"
+TAG_PREFIX = "cache_tag:"
+LOCK_PREFIX = "cache_lock:"
+INVALIDATION_CHANNEL = "cache_invalidations"
+
+L1_MAX_ENTRIES = 10000
+L1_TTL = 30
+LOAD_LOCK_TTL = 10
+LOAD_LOCK_WAIT = 2.0
+LOAD_LOCK_POLL = 0.05
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires_at: float
+    # How long the load took, scales the early refresh window
+    delta: float
+
+
+class _LocalLRU:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[_Entry]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        entry, local_expires_at = item
+        if time.time() >= local_expires_at:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: _Entry, ttl: float):
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        self._data[key] = (entry, time.time() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _new_counters() -> Dict[str, int]:
+    return {'l1_hits': 0, 'l2_hits': 0, 'negative_hits': 0, 'misses': 0, 'loads': 0, 'coalesced': 0, 'early_refreshes': 0, 'errors': 0}
 
 
 class _cache:
+    def __init__(self, l1_max_entries: int = L1_MAX_ENTRIES):
+        self._local = _LocalLRU(l1_max_entries)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(_new_counters)
+        self._listener: Optional[asyncio.Task] = None
+        self._background: set = set()
+
     async def get(self, key: str):
         redis = await get_client()
-        key = f"cache:{key}"
+        key = f"{KEY_PREFIX}{key}"
         result = await redis.get(key)
         if result:
             return json.loads(result)
         return None
 
     async def set(self, key: str, value: Any, ttl: int = 15 * 60):
+        self._local.pop(key)
         redis = await get_client()
-        key = f"cache:{key}"
+        key = f"{KEY_PREFIX}{key}"
         await redis.set(key, json.dumps(value), ex=ttl)
 
     async def invalidate(self, key: str):
-        redis = await get_client()
-        key = f"cache:{key}"
-        await redis.delete(key)
+        await self._invalidate_keys([key])
+
+    async def invalidate_tag(self, tag: str):
+        """Invalidate every entry stored with the tag."""
+        tag_key = f"{TAG_PREFIX}{tag}"
+        try:
+            client = await get_client()
+            keys = sorted(await client.smembers(tag_key))
+            await client.delete(tag_key)
+        except Exception as e:
+            # Without the tag index we can't tell which entries to drop; at least
+            # this process must not serve them from L1
+            logger.warning(f"Failed to read cache tag {tag}, clearing local cache: {e}")
+            self._local.clear()
+            return
+        if keys:
+            await self._invalidate_keys(keys)
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Counters per namespace (the key up to its first colon) plus the hit ratio."""
+        result = {}
+        for namespace, counters in self._counters.items():
+            hits = counters['l1_hits'] + counters['l2_hits']
+            lookups = hits + counters['misses']
+            result[namespace] = {**counters, 'hit_ratio': round(hits / lookups, 4) if lookups else None}
+        return result
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: int,
+        *,
+        negative_ttl: Optional[int] = None,
+        l1_ttl: float = L1_TTL,
+        tags: Iterable[str] = (),
+        beta: float = 1.0,
+        namespace: Optional[str] = None,
+    ) -> Any:
+        """Return the cached value of the key, loading and caching it with `loader` on a miss."""
+        counters = self._counters[namespace or key.split(":", 1)[0]]
+        load = functools.partial(self._load, key, loader, ttl, negative_ttl, l1_ttl, list(tags), counters)
+
+        now = time.time()
+        entry = self._local.get(key)
+        if entry is not None:
+            counters['l1_hits'] += 1
+        else:
+            entry = await self._read(key, counters)
+            if entry is not None:
+                counters['l2_hits'] += 1
+                self._local.set(key, entry, min(l1_ttl, entry.expires_at - now))
+                self._ensure_listener()
+
+        if entry is None:
+            counters['misses'] += 1
+            return await load(wait=True)
+
+        if entry.value is None:
+            counters['negative_hits'] += 1
+        # XFetch: refresh with probability exp(-remaining / (delta * beta))
+        if key not in self._inflight and now - entry.delta * beta * math.log(1.0 - random.random()) >= entry.expires_at:
+            counters['early_refreshes'] += 1
+            self._spawn(load(wait=False))
+        return entry.value
+
+    async def _load(self, key, loader, ttl, negative_ttl, l1_ttl, tags, counters, wait: bool) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            counters['coalesced'] += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leading load was cancelled, not this caller: load ourselves
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await self._load_once(key, loader, ttl, negative_ttl, l1_ttl, tags, counters, wait)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load_once(self, key, loader, ttl, negative_ttl, l1_ttl, tags, counters, wait: bool) -> Any:
+        lock_key = f"{LOCK_PREFIX}{key}"
+        try:
+            locked = await redis.set(lock_key, "1", ex=LOAD_LOCK_TTL, nx=True)
+        except Exception:
+            locked = None
+
+        if locked is False:
+            # Another process is loading the key: use its result once stored
+            if not wait:
+                return None
+            deadline = time.monotonic() + LOAD_LOCK_WAIT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(LOAD_LOCK_POLL)
+                entry = await self._read(key, counters)
+                if entry is not None:
+                    self._local.set(key, entry, min(l1_ttl, entry.expires_at - time.time()))
+                    return entry.value
+
+        try:
+            counters['loads'] += 1
+            started = time.monotonic()
+            value = await loader()
+            delta = time.monotonic() - started
+
+            entry_ttl = ttl if value is not None else negative_ttl
+            if entry_ttl:
+                entry = _Entry(value, time.time() + entry_ttl, delta)
+                await self._write(key, entry, entry_ttl, tags, counters)
+                self._local.set(key, entry, min(l1_ttl, entry_ttl))
+                self._ensure_listener()
+            return value
+        finally:
+            if locked:
+                try:
+                    await redis.delete(lock_key)
+                except Exception:
+                    pass
+
+    async def _read(self, key: str, counters: Dict[str, int]) -> Optional[_Entry]:
+        try:
+            raw = await redis.get(f"{KEY_PREFIX}{key}")
+        except Exception as e:
+            counters['errors'] += 1
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return None
+        if not raw:
+            return None
+        try:
+            data = json.loads(raw)
+            # Values written by Cache.set, e.g. before a key moved to get_or_load, are misses
+            if isinstance(data, dict) and data.get('_rt') == 1:
+                return _Entry(data['v'], data['e'], data['d'])
+        except (ValueError, KeyError):
+            pass
+        return None
+
+    async def _write(self, key: str, entry: _Entry, ttl: int, tags: List[str], counters: Dict[str, int]):
+        try:
+            client = await get_client()
+            pipe = client.pipeline(transaction=False)
+            pipe.set(f"{KEY_PREFIX}{key}", json.dumps({'_rt': 1, 'v': entry.value, 'e': entry.expires_at, 'd': entry.delta}, default=str), ex=ttl)
+            for tag in tags:
+                tag_key = f"{TAG_PREFIX}{tag}"
+                pipe.sadd(tag_key, key)
+                pipe.expire(tag_key, max(ttl, L1_TTL) * 2)
+            await pipe.execute()
+        except Exception as e:
+            counters['errors'] += 1
+            logger.warning(f"Cache write failed for {key}: {e}")
+
+    async def _invalidate_keys(self, keys: List[str]):
+        for key in keys:
+            self._local.pop(key)
+        client = await get_client()
+        await client.delete(*(f"{KEY_PREFIX}{key}" for key in keys))
+        try:
+            await client.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+        except Exception as e:
+            logger.warning(f"Failed to broadcast cache invalidation of {len(keys)} keys: {e}")
+
+    def _spawn(self, coro: Awaitable[Any]):
+        async def run():
+            try:
+                await coro
+            except Exception as e:
+                logger.warning(f"Background cache refresh failed: {e}")
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _ensure_listener(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        pubsub = None
+        try:
+            pubsub = await redis.create_pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message.get('type') == 'message':
+                    for key in json.loads(message['data']):
+                        self._local.pop(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Invalidations published from now on are missed; the next L1 write restarts the listener
+            logger.warning(f"Cache invalidation listener stopped: {e}")
+            self._local.clear()
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.unsubscribe(INVALIDATION_CHANNEL)
+                    await pubsub.close()
+                except Exception:
+                    pass
 
 
 Cache = _cache()
+
+
+def cached(
+    namespace: str,
+    ttl: int,
+    *,
+    key: Optional[Callable[..., Any]] = None,
+    tags: Optional[Callable[..., Iterable[str]]] = None,
+    negative_ttl: Optional[int] = None,
+    l1_ttl: float = L1_TTL,
+    beta: float = 1.0,
+):
+    """
+    Cache the results of an async function with `Cache.get_or_load`.
+
+    The cache key is `{namespace}:{key(*args, **kwargs)}`, by default the
+    arguments joined with colons. `tags(*args, **kwargs)` names the tags of an
+    entry. The wrapper gets an `invalidate(*args, **kwargs)` coroutine for the
+    entry of those arguments and keeps the original function as `uncached`.
+
+    Example:
+        @cached("allowed_models_for_user", ttl=60, key=lambda client, user_id: user_id)
+        async def get_allowed_models_for_user(client, user_id: str): ...
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        def make_key(*args, **kwargs) -> str:
+            if key is not None:
+                suffix = key(*args, **kwargs)
+            else:
+                suffix = ":".join([str(arg) for arg in args] + [f"{k}={v}" for k, v in sorted(kwargs.items())])
+            return f"{namespace}:{suffix}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await Cache.get_or_load(
+                make_key(*args, **kwargs),
+                lambda: func(*args, **kwargs),
+                ttl,
+                negative_ttl=negative_ttl,
+                l1_ttl=l1_ttl,
+                tags=tags(*args, **kwargs) if tags else (),
+                beta=beta,
+                namespace=namespace,
+            )
+
+        async def invalidate(*args, **kwargs):
+            await Cache.invalidate(make_key(*args, **kwargs))
+
+        wrapper.invalidate = invalidate
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
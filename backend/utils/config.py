@@ -222,6 +222,12 @@ class Configuration:
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
     SUPABASE_SERVICE_ROLE_KEY: str
+    SUPABASE_JWT_SECRET: Optional[str] = None
+    # Direct Postgres connection string (session mode, not the transaction pooler) for the
+    # asyncpg fast path of hot queries; requires asyncpg, PostgREST is used when unset
+    DATABASE_URL: Optional[str] = None
+    DATABASE_POOL_MIN_SIZE: int = 1
+    DATABASE_POOL_MAX_SIZE: int = 10
     
     # Redis configuration
     REDIS_HOST: str
@@ -271,6 +277,23 @@ class Configuration:
 
 
 
+    # Thread message cache: mirror cached LLM message rows into Redis so new workers can hydrate threads
+    THREAD_MESSAGE_CACHE_REDIS: bool = False
+
+    # Agent knowledge base retrieval: token budget and number of chunks injected into the system prompt
+    KNOWLEDGE_BASE_MAX_TOKENS: int = 4000
+    KNOWLEDGE_BASE_TOP_K: int = 8
+
+    # Trigger intake: trigger events processed concurrently per agent and per account
+    TRIGGER_INTAKE_MAX_PER_AGENT: int = 2
+    TRIGGER_INTAKE_MAX_PER_ACCOUNT: int = 5
+
+    # Schedule triggers backend: "supabase_cron" (a cron job per trigger calling the webhook) or "local" (in-process scheduler)
+    TRIGGER_SCHEDULER_BACKEND: str = "supabase_cron"
+
+    # Pre-created sandboxes of the current snapshot kept ready for new sessions (0 disables the warm pool)
+    SANDBOX_WARM_POOL_SIZE: int = 0
+
     # API Keys system configuration
     API_KEY_SECRET: str = "default-secret-key-change-in-production"
     API_KEY_LAST_USED_THROTTLE_SECONDS: int = 900
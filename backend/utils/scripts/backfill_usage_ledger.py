@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Monthly Usage Ledger Backfill
+
+Rebuilds `monthly_usage_ledger` entries from existing assistant_response_end
+messages. Run it once after deploying the ledger, and periodically (e.g. from
+cron) as a full reconciliation of every account active in the period.
+
+Usage:
+    python backfill_usage_ledger.py                              # All accounts with runs this month
+    python backfill_usage_ledger.py --period 2025-07-01           # All accounts with runs in July 2025
+    python backfill_usage_ledger.py --account-id <account_id>     # A single account
+    python backfill_usage_ledger.py --concurrency 10
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from services import redis
+from services.supabase import DBConnection
+from services.usage_ledger import get_active_account_ids, period_start_for, reconcile_account
+
+
+async def backfill(period_start: date, account_ids, concurrency: int):
+    db = DBConnection()
+    await db.initialize()
+    await redis.initialize_async()
+    client = await db.client
+
+    if not account_ids:
+        print(f"🔍 Finding accounts with agent runs since {period_start.isoformat()}...")
+        account_ids = await get_active_account_ids(client, period_start)
+    print(f"📒 Rebuilding usage ledger for {len(account_ids)} accounts ({period_start.isoformat()})")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = []
+    total = 0.0
+
+    async def reconcile(account_id: str):
+        nonlocal total
+        async with semaphore:
+            try:
+                total += await reconcile_account(client, account_id, period_start)
+            except Exception as e:
+                failed.append((account_id, str(e)))
+
+    start = time.time()
+    await asyncio.gather(*(reconcile(account_id) for account_id in account_ids))
+
+    print(f"✅ Backfill completed in {time.time() - start:.1f}s")
+    print(f"   📦 Accounts: {len(account_ids) - len(failed)}")
+    print(f"   💰 Total cost: ${total:.2f}")
+    print(f"   ❌ Failed: {len(failed)}")
+    for account_id, error in failed:
+        print(f"   - {account_id}: {error}")
+
+    await redis.close()
+    await DBConnection.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the monthly usage ledger from existing messages")
+    parser.add_argument("--period", type=date.fromisoformat, default=None, help="Any date in the month to rebuild (default: current month)")
+    parser.add_argument("--account-id", action="append", dest="account_ids", default=[], help="Only rebuild these accounts")
+    parser.add_argument("--concurrency", type=int, default=5)
+    args = parser.parse_args()
+
+    period_start = period_start_for() if args.period is None else date(args.period.year, args.period.month, 1)
+    asyncio.run(backfill(period_start, args.account_ids, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Image Pipeline Benchmark: event loop lag under concurrent image calls
+
+Serves generated photos from a local HTTP server (with a simulated network
+delay) and runs N concurrent see_image-style calls, fetch plus compress, while
+a probe task measures how late the event loop wakes it up. Compares the
+previous inline path (blocking requests.head/get, PIL in the handler) with
+the image pipeline (httpx fetch, PIL in the process pool), cold and with the
+content-hash cache warm.
+
+Usage:
+    python benchmark_image_pipeline.py                      # 8 concurrent calls
+    python benchmark_image_pipeline.py --concurrency 4 16 --width 3000 --height 2000
+"""
+
+import argparse
+import asyncio
+import io
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+from PIL import Image
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from agent.tools.utils.image_pipeline import (
+    DEFAULT_JPEG_QUALITY,
+    DEFAULT_MAX_HEIGHT,
+    DEFAULT_MAX_WIDTH,
+    compress_image,
+    fetch_image,
+    get_image_pool,
+    image_cache,
+)
+
+PROBE_INTERVAL = 0.005
+NETWORK_DELAY = 0.05
+
+
+def build_images(count: int, width: int, height: int) -> list:
+    """Distinct JPEG photos (noise over a gradient), so cold runs never hit the cache."""
+    images = []
+    for i in range(count):
+        gradient = Image.radial_gradient("L").resize((width, height))
+        noise = Image.effect_noise((width, height), 40 + i)
+        img = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=92)
+        images.append(output.getvalue())
+    return images
+
+
+def serve(images: list) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, body: bool):
+            time.sleep(NETWORK_DELAY)
+            data = images[int(self.path.strip("/"))]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if body:
+                self.wfile.write(data)
+
+        def do_HEAD(self):
+            self._send(body=False)
+
+        def do_GET(self):
+            self._send(body=True)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def legacy_compress(image_bytes: bytes) -> bytes:
+    img = Image.open(io.BytesIO(image_bytes))
+    width, height = img.size
+    if width > DEFAULT_MAX_WIDTH or height > DEFAULT_MAX_HEIGHT:
+        ratio = min(DEFAULT_MAX_WIDTH / width, DEFAULT_MAX_HEIGHT / height)
+        img = img.resize((int(width * ratio), int(height * ratio)), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=DEFAULT_JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+async def legacy_see_image(url: str) -> int:
+    requests.head(url, timeout=10)
+    image_bytes = requests.get(url, timeout=10).content
+    return len(legacy_compress(image_bytes))
+
+
+async def pipeline_see_image(url: str) -> int:
+    image_bytes, mime_type = await fetch_image(url)
+    compressed, _ = await compress_image(image_bytes, mime_type)
+    return len(compressed)
+
+
+async def measure(see_image, urls: list) -> dict:
+    lags = []
+    stop = asyncio.Event()
+
+    async def probe():
+        while not stop.is_set():
+            expected = time.perf_counter() + PROBE_INTERVAL
+            await asyncio.sleep(PROBE_INTERVAL)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+    start = time.perf_counter()
+    await asyncio.gather(*(see_image(url) for url in urls))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+
+    lags.sort()
+    return {
+        "wall_ms": elapsed * 1000,
+        "max_lag_ms": lags[-1] * 1000,
+        "p99_lag_ms": lags[int(len(lags) * 0.99) - 1] * 1000 if len(lags) > 1 else lags[-1] * 1000,
+    }
+
+
+async def run(args):
+    # Start the workers and import httpx's transport up front (a long-running worker has done
+    # both already), so one-time startup costs are not part of the first measurement
+    pool = get_image_pool()
+    await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(pool, time.sleep, 0.1) for _ in range(4)))
+    warmup_server = serve(build_images(1, 64, 64))
+    await fetch_image(f"http://127.0.0.1:{warmup_server.server_address[1]}/0")
+    warmup_server.shutdown()
+
+    print(f"{'calls':>6} {'path':>16} {'wall ms':>9} {'max lag ms':>11} {'p99 lag ms':>11}")
+    for concurrency in args.concurrency:
+        images = build_images(concurrency, args.width, args.height)
+        server = serve(images)
+        urls = [f"http://127.0.0.1:{server.server_address[1]}/{i}" for i in range(concurrency)]
+        image_cache.clear()
+        cases = [
+            ("legacy", legacy_see_image),
+            ("pipeline (cold)", pipeline_see_image),
+            ("pipeline (warm)", pipeline_see_image),
+        ]
+        for name, see_image in cases:
+            result = await measure(see_image, urls)
+            print(f"{concurrency:>6} {name:>16} {result['wall_ms']:>9.0f} {result['max_lag_ms']:>11.1f} {result['p99_lag_ms']:>11.1f}")
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure event loop lag of concurrent image fetch and compression")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[8])
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Knowledge Base Retrieval Benchmark
+
+Builds a synthetic agent knowledge base and compares the injected context of
+the current path (get_agent_knowledge_base_context: whole entries, newest first,
+until the token budget is hit) with BM25 chunk retrieval. Each query asks about
+a fact planted in one random entry; the benchmark reports prompt size,
+selection latency and how often the fact made it into the prompt.
+
+Usage:
+    python benchmark_kb_retrieval.py                               # 50 entries of 20KB
+    python benchmark_kb_retrieval.py --entries 200 --entry-size 100000 --queries 200
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from knowledge_base.retrieval import (
+    BM25Index, KnowledgeChunk, chunk_text, estimate_tokens, format_context, select_chunks,
+)
+
+WORDS = (
+    "system data process customer order invoice payment account report service request "
+    "policy product shipping return warranty support ticket refund delivery schedule team "
+    "project release feature update config deploy server network storage backup security"
+).split()
+
+
+def build_entries(count: int, size: int, rng: random.Random):
+    entries = []
+    for i in range(count):
+        paragraphs = []
+        length = 0
+        while length < size:
+            paragraph = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))) + "."
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        entries.append({"entry_id": f"entry-{i}", "name": f"Document {i}", "paragraphs": paragraphs})
+    return entries
+
+
+def plant_fact(entry, rng: random.Random, fact_id: int) -> str:
+    code = f"zephyr{fact_id}"
+    fact = f"The escalation contact for region {code} is the {code} operations desk."
+    paragraphs = entry["paragraphs"]
+    paragraphs.insert(rng.randrange(len(paragraphs)), fact)
+    return code
+
+
+def current_context(entries, max_tokens: int) -> str:
+    """Mirror of get_agent_knowledge_base_context: whole entries newest first, stop at the first that doesn't fit."""
+    parts, used = [], 0
+    for entry in reversed(entries):
+        content = "\n\n".join(entry["paragraphs"])
+        tokens = estimate_tokens(content)
+        if used + tokens > max_tokens:
+            break
+        parts.append(f"\n\n## {entry['name']}\n{content}")
+        used += tokens
+    return "".join(parts)
+
+
+def build_index(entries) -> BM25Index:
+    chunks = []
+    for entry in entries:
+        for i, chunk in enumerate(chunk_text("\n\n".join(entry["paragraphs"]))):
+            chunks.append(KnowledgeChunk(entry["entry_id"], entry["name"], i, chunk, estimate_tokens(chunk)))
+    return BM25Index(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge base context selection")
+    parser.add_argument("--entries", type=int, default=50)
+    parser.add_argument("--entry-size", type=int, default=20000, help="Characters per entry")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--max-tokens", type=int, default=2000, help="Agent knowledge budget (half of the 4000 token total)")
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    entries = build_entries(args.entries, args.entry_size, rng)
+    queries = []
+    for q in range(args.queries):
+        code = plant_fact(rng.choice(entries), rng, q)
+        queries.append((f"Who is the escalation contact for region {code}?", code))
+
+    total_tokens = sum(estimate_tokens("\n\n".join(e["paragraphs"])) for e in entries)
+    print(f"Knowledge base: {args.entries} entries, ~{total_tokens} tokens, budget {args.max_tokens} tokens")
+
+    start = time.perf_counter()
+    index = build_index(entries)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"Index build: {len(index.chunks)} chunks in {build_ms:.1f} ms (once per change of the agent's entries)")
+
+    for label, select in (
+        ("current", lambda query: current_context(entries, args.max_tokens)),
+        ("retrieval", lambda query: format_context(select_chunks(index, query, args.top_k, args.max_tokens)) or ""),
+    ):
+        latencies, sizes, hits = [], [], 0
+        for query, code in queries:
+            start = time.perf_counter()
+            context = select(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            sizes.append(estimate_tokens(context))
+            hits += code in context
+        print(f"{label:>10}: {statistics.mean(sizes):7.0f} tokens/prompt  "
+              f"{statistics.mean(latencies):7.2f} ms/selection  "
+              f"fact found in {hits}/{len(queries)} prompts")
+
+
+if __name__ == "__main__":
+    main()
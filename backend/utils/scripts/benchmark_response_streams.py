@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Agent Run Response Transport Load Benchmark
+
+Simulates one agent run streaming responses to many concurrent SSE viewers on a
+local Redis, once with the list + pub/sub transport and once with the Redis
+Streams transport, and reports Redis commands executed, end-to-end delivery
+time and peak client connections for each.
+
+Usage:
+    python benchmark_response_streams.py                           # 200 viewers, 2000 chunks
+    python benchmark_response_streams.py --viewers 500 --chunks 5000 --host localhost --port 6379
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import redis.asyncio as aioredis
+
+
+async def command_count(client: aioredis.Redis) -> int:
+    stats = await client.info("commandstats")
+    return sum(v["calls"] for v in stats.values())
+
+
+async def list_writer(client, run_id: str, chunks: int, payload: str):
+    list_key, channel = f"bench:{run_id}:responses", f"bench:{run_id}:new_response"
+    for i in range(chunks):
+        await client.rpush(list_key, json.dumps({"type": "assistant", "i": i, "content": payload}))
+        await client.publish(channel, "new")
+    await client.rpush(list_key, json.dumps({"type": "status", "status": "completed"}))
+    await client.publish(channel, "new")
+
+
+async def list_viewer(client, run_id: str, ready: asyncio.Event) -> int:
+    list_key, channel = f"bench:{run_id}:responses", f"bench:{run_id}:new_response"
+    pubsub = client.pubsub()
+    await pubsub.subscribe(channel)
+    ready.set()
+    received = 0
+    try:
+        received += len(await client.lrange(list_key, 0, -1))
+        async for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            new = await client.lrange(list_key, received, -1)
+            for raw in new:
+                received += 1
+                if json.loads(raw).get("type") == "status":
+                    return received
+    finally:
+        await pubsub.unsubscribe(channel)
+        await pubsub.aclose()
+    return received
+
+
+async def stream_writer(client, run_id: str, chunks: int, payload: str):
+    key = f"bench:{run_id}:stream"
+    for i in range(chunks):
+        await client.xadd(key, {"data": json.dumps({"type": "assistant", "i": i, "content": payload})})
+    await client.xadd(key, {"data": json.dumps({"type": "status", "status": "completed"})})
+
+
+async def stream_viewer(client, run_id: str, ready: asyncio.Event) -> int:
+    key = f"bench:{run_id}:stream"
+    last_id = "0-0"
+    received = 0
+    ready.set()
+    while True:
+        result = await client.xread({key: last_id}, block=5000)
+        for _, entries in result or []:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                received += 1
+                if json.loads(fields["data"]).get("type") == "status":
+                    return received
+
+
+async def run_case(name, writer, viewer, args):
+    pool = aioredis.ConnectionPool(host=args.host, port=args.port, decode_responses=True, max_connections=args.viewers * 2 + 10)
+    client = aioredis.Redis(connection_pool=pool)
+    admin = aioredis.Redis(host=args.host, port=args.port, decode_responses=True)
+    run_id = str(uuid.uuid4())
+    payload = "x" * args.chunk_size
+
+    readies = [asyncio.Event() for _ in range(args.viewers)]
+    viewers = [asyncio.create_task(viewer(client, run_id, ready)) for ready in readies]
+    await asyncio.gather(*(ready.wait() for ready in readies))
+
+    commands_before = await command_count(admin)
+    start = time.perf_counter()
+    await writer(client, run_id, args.chunks, payload)
+    received = await asyncio.gather(*viewers)
+    elapsed = time.perf_counter() - start
+    commands = await command_count(admin) - commands_before - 1  # minus the INFO call itself
+    peak_connections = len(pool._in_use_connections) + len(pool._available_connections)
+
+    await admin.delete(f"bench:{run_id}:responses", f"bench:{run_id}:stream")
+    await client.aclose()
+    await pool.aclose()
+    await admin.aclose()
+
+    assert all(r == args.chunks + 1 for r in received), f"{name}: viewers missed responses"
+    print(f"{name:>12}: {elapsed * 1000:8.0f} ms  {commands:9d} Redis commands  "
+          f"{commands / (args.chunks + 1):7.1f} per chunk  {peak_connections:4d} connections")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark agent run response transports on a local Redis")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--viewers", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"{args.viewers} viewers, {args.chunks} chunks of {args.chunk_size} chars")
+    await run_case("list+pubsub", list_writer, list_viewer, args)
+    await run_case("streams", stream_writer, stream_viewer, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Sheet Analysis Benchmark: row lists vs ColumnarSheet
+
+Generates a sales-like sheet (string cells, as read from CSV, with blanks and
+non-numeric values mixed in) and times the previous analyze_sheet approach
+(converting every cell with to_float once per aggregate, grouping into per-key
+row lists and aggregating with statistics.mean) against the vectorized
+ColumnarSheet engine, for the ungrouped summary, a group_by and a row filter.
+
+Usage:
+    python benchmark_sheet_analysis.py                      # 10k, 100k and 1M rows
+    python benchmark_sheet_analysis.py --rows 50000 --repeat 5
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from statistics import mean
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from agent.tools.utils.columnar_sheet import ColumnarSheet
+
+HEADERS = ["region", "product", "revenue", "units", "discount", "note"]
+NUMERIC_COLUMNS = ["revenue", "units", "discount"]
+
+
+def build_rows(count: int) -> list:
+    rng = random.Random(42)
+    regions = ["NA", "EU", "APAC", "LATAM", "MEA", ""]
+    products = [f"product-{i}" for i in range(200)]
+    rows = []
+    for _ in range(count):
+        rows.append([
+            rng.choice(regions),
+            rng.choice(products),
+            f"{rng.uniform(0, 5000):.2f}" if rng.random() > 0.05 else "",
+            str(rng.randint(0, 100)),
+            f"{rng.random():.3f}" if rng.random() > 0.2 else "n/a",
+            "ok",
+        ])
+    return rows
+
+
+def to_float(v):
+    if v is None:
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return float(str(v).strip())
+    except Exception:
+        return None
+
+
+def legacy_summary(headers, rows, columns):
+    idx_map = {h: i for i, h in enumerate(headers)}
+    out = []
+    for fn in (len, sum, mean, min, max):
+        values_per_col = []
+        for col in columns:
+            c_idx = idx_map[col]
+            vals = [to_float(r[c_idx]) for r in rows if len(r) > c_idx]
+            vals = [v for v in vals if v is not None]
+            values_per_col.append(fn(vals) if vals or fn is len else None)
+        out.append(values_per_col)
+    return out
+
+
+def legacy_group_by(headers, rows, key, columns):
+    idx_map = {h: i for i, h in enumerate(headers)}
+    g_idx = idx_map[key]
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[g_idx] if len(row) > g_idx else None, []).append(row)
+    out = []
+    for group_key, group_rows in groups.items():
+        row_out = [group_key]
+        for col in columns:
+            c_idx = idx_map[col]
+            vals = [to_float(r[c_idx]) for r in group_rows if len(r) > c_idx]
+            vals = [v for v in vals if v is not None]
+            row_out.extend([len(vals), sum(vals) if vals else None, mean(vals) if vals else None,
+                            min(vals) if vals else None, max(vals) if vals else None])
+        out.append(row_out)
+    return out
+
+
+def legacy_filter(headers, rows, column, threshold):
+    c_idx = headers.index(column)
+    values = [to_float(r[c_idx]) if len(r) > c_idx else None for r in rows]
+    return [i for i, v in enumerate(values) if v is not None and v > threshold]
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sheet analysis on row lists and on ColumnarSheet")
+    parser.add_argument("--rows", type=int, nargs="*", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is reported")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'operation':>10} {'legacy ms':>10} {'columnar ms':>12} {'speedup':>8}")
+    for count in args.rows:
+        rows = build_rows(count)
+        cases = {
+            "summary": (
+                lambda: legacy_summary(HEADERS, rows, NUMERIC_COLUMNS),
+                # A fresh ColumnarSheet per run, so parsing is part of the measurement
+                lambda: ColumnarSheet(HEADERS, rows).aggregate(NUMERIC_COLUMNS),
+            ),
+            "group_by": (
+                lambda: legacy_group_by(HEADERS, rows, "region", NUMERIC_COLUMNS),
+                lambda: ColumnarSheet(HEADERS, rows).group_by("region", NUMERIC_COLUMNS),
+            ),
+            "filter": (
+                lambda: legacy_filter(HEADERS, rows, "revenue", 2500),
+                lambda: ColumnarSheet(HEADERS, rows).where("revenue", ">", 2500).nonzero(),
+            ),
+        }
+        for name, (legacy, columnar) in cases.items():
+            legacy_ms = timed(legacy, args.repeat)
+            columnar_ms = timed(columnar, args.repeat)
+            print(f"{count:>9} {name:>10} {legacy_ms:>10.1f} {columnar_ms:>12.1f} {legacy_ms / columnar_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+XML Tool Call Scanner Benchmark
+
+Compares the streaming StreamingXMLToolScanner against the previous approach of
+rescanning the whole accumulated buffer on every delta (including the fallback
+loop over every registered function name) and removing matches with str.replace.
+
+Usage:
+    python benchmark_xml_scanner.py                        # 100KB response, 5-char deltas
+    python benchmark_xml_scanner.py --size 200000 --delta 5 --tools 80
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to the path so we can import modules
+backend_dir = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from agentpress.xml_tool_parser import StreamingXMLToolScanner
+
+
+def build_response(size: int, tool_calls: int) -> str:
+    """Build a response of roughly `size` characters with `tool_calls` invoke blocks spread through it."""
+    invoke = (
+        '<function_calls>\n<invoke name="create_file">\n'
+        '<parameter name="file_path">src/example.py</parameter>\n'
+        '<parameter name="file_contents">print("hello")</parameter>\n'
+        '</invoke>\n</function_calls>\n'
+    )
+    prose_len = max(0, size - tool_calls * len(invoke))
+    prose = ("The quick brown fox jumps over the lazy dog. " * (prose_len // 45 + 1))[:prose_len]
+    segment = len(prose) // (tool_calls + 1) if tool_calls else len(prose)
+    parts = []
+    for i in range(tool_calls):
+        parts.append(prose[i * segment:(i + 1) * segment])
+        parts.append(invoke)
+    parts.append(prose[tool_calls * segment:])
+    return ''.join(parts)
+
+
+def rescan_extract(content: str, function_names: list) -> list:
+    """The previous full-buffer extraction: <function_calls> blocks, else a scan per function name."""
+    chunks = []
+    pos = 0
+    while pos < len(content):
+        start = content.find('<function_calls>', pos)
+        if start == -1:
+            break
+        end = content.find('</function_calls>', start)
+        if end == -1:
+            break
+        chunks.append(content[start:end + len('</function_calls>')])
+        pos = end + len('</function_calls>')
+    if not chunks:
+        for name in function_names:
+            content.find(f"<{name.replace('_', '-')}", 0)
+    return chunks
+
+
+def run_rescan(response: str, delta: int, function_names: list) -> int:
+    buffer = ""
+    found = 0
+    for i in range(0, len(response), delta):
+        buffer += response[i:i + delta]
+        for chunk in rescan_extract(buffer, function_names):
+            buffer = buffer.replace(chunk, "", 1)
+            found += 1
+    return found
+
+
+def run_scanner(response: str, delta: int) -> int:
+    scanner = StreamingXMLToolScanner()
+    found = 0
+    for i in range(0, len(response), delta):
+        found += len(scanner.feed(response[i:i + delta]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming XML tool call extraction")
+    parser.add_argument("--size", type=int, default=100_000, help="Response size in characters")
+    parser.add_argument("--delta", type=int, default=5, help="Characters per streamed delta")
+    parser.add_argument("--tools", type=int, default=60, help="Number of registered function names")
+    parser.add_argument("--calls", type=int, default=10, help="Number of tool calls in the response")
+    args = parser.parse_args()
+
+    function_names = [f"tool_function_{i}" for i in range(args.tools)]
+    response = build_response(args.size, args.calls)
+    # A response without any tool call exercises the per-function-name fallback on every delta
+    prose_only = build_response(args.size, 0)
+
+    print(f"Response: {len(response)} chars, {len(response) // args.delta} deltas of {args.delta} chars, {args.tools} tools")
+    for label, text in (("with tool calls", response), ("prose only", prose_only)):
+        start = time.perf_counter()
+        rescan_found = run_rescan(text, args.delta, function_names)
+        rescan_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scanner_found = run_scanner(text, args.delta)
+        scanner_time = time.perf_counter() - start
+
+        print(f"[{label}] rescan:  {rescan_time * 1000:9.1f} ms  ({rescan_found} blocks)")
+        print(f"[{label}] scanner: {scanner_time * 1000:9.1f} ms  ({scanner_found} invokes)")
+        print(f"[{label}] speedup: {rescan_time / scanner_time:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, asdict
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator
 import httpx
 from datetime import datetime
 
@@ -56,10 +56,10 @@ class ProjectData:
     name: str
     description: str
     account_id: str
-    sandbox: Dict[str, Any]
     is_public: bool
     created_at: str
     updated_at: str
+    sandbox: Optional[Dict[str, Any]] = None  # Not included in thread listings
 
 
 @dataclass
@@ -128,10 +128,12 @@ class Message:
 
 @dataclass
 class PaginationInfo:
-    page: int
+    page: Optional[int]  # None for cursor requests
     limit: int
-    total: int
-    pages: int
+    total: Optional[int]  # None unless a count was requested
+    pages: Optional[int]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
 
 
 @dataclass
@@ -143,6 +145,10 @@ class ThreadsResponse:
 @dataclass
 class MessagesResponse:
     messages: List[Message]
+    has_more: bool = False
+    next_cursor: Optional[str] = None  # Pass as `after` (asc) or `before` (desc) to continue
+    etag: Optional[str] = None
+    not_modified: bool = False  # True when `etag` still matched; `messages` is empty then
 
 
 @dataclass
@@ -319,56 +325,80 @@ class ThreadsClient:
             response.raise_for_status()
             return response.json()
 
+    def _thread_from_dict(self, thread_data: Dict[str, Any]) -> Thread:
+        project_data = None
+        if thread_data.get("project"):
+            project_data = from_dict(ProjectData, thread_data["project"])
+
+        agent_runs_data = []
+        if thread_data.get("recent_agent_runs"):
+            agent_runs_data = [
+                from_dict(AgentRunApiResponse, run_data)
+                for run_data in thread_data["recent_agent_runs"]
+            ]
+
+        return from_dict(
+            Thread,
+            {
+                **thread_data,
+                "project": project_data,
+                "recent_agent_runs": agent_runs_data,
+            },
+        )
+
     async def get_threads(
         self,
         page: int = 1,
         limit: int = 1000,
+        cursor: Optional[str] = None,
+        count: Optional[str] = None,
     ) -> ThreadsResponse:
-        """Get all threads for the current user with associated project data.
+        """Get a page of the current user's threads, newest first, with a summary of their projects.
 
         Args:
-            page: Page number (1-based)
+            page: Page number (1-based), ignored when a cursor is given
             limit: Number of items per page (max 1000)
+            cursor: `pagination.next_cursor` of the previous page
+            count: How to compute `pagination.total`: "exact", "estimated" or "none"
+                (server default: exact for pages, none for cursors)
 
         Returns:
-            ThreadsResponse containing paginated threads
+            ThreadsResponse containing the page and its pagination info
         """
-        params = {
-            "page": page,
-            "limit": limit,
-        }
+        params: Dict[str, Any] = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        else:
+            params["page"] = page
+        if count:
+            params["count"] = count
 
         response = await self.client.get("/threads", params=params)
         data = self._handle_response(response)
 
-        # Convert threads data
-        threads = []
-        for thread_data in data["threads"]:
-            project_data = None
-            if thread_data.get("project"):
-                project_data = from_dict(ProjectData, thread_data["project"])
-
-            agent_runs_data = []
-            if thread_data.get("recent_agent_runs"):
-                agent_runs_data = [
-                    from_dict(AgentRunApiResponse, run_data)
-                    for run_data in thread_data["recent_agent_runs"]
-                ]
-
-            thread = from_dict(
-                Thread,
-                {
-                    **thread_data,
-                    "project": project_data,
-                    "recent_agent_runs": agent_runs_data,
-                },
-            )
-            threads.append(thread)
-
+        threads = [self._thread_from_dict(thread_data) for thread_data in data["threads"]]
         pagination = from_dict(PaginationInfo, data["pagination"])
 
         return ThreadsResponse(threads=threads, pagination=pagination)
 
+    async def iter_threads(self, page_size: int = 100) -> AsyncIterator[Thread]:
+        """Iterate over all of the current user's threads, newest first, fetching pages by cursor.
+
+        Args:
+            page_size: Number of threads fetched per request (max 1000)
+
+        Yields:
+            Thread, with a project summary but without sandbox details
+        """
+        cursor = None
+        while True:
+            response = await self.get_threads(limit=page_size, cursor=cursor, count="none")
+            for thread in response.threads:
+                yield thread
+            cursor = response.pagination.next_cursor
+            if not cursor:
+                return
+
     async def get_thread(self, thread_id: str) -> Thread:
         """Get a specific thread by ID with complete related data.
 
@@ -400,25 +430,74 @@ class ThreadsClient:
         )
 
     async def get_thread_messages(
-        self, thread_id: str, order: str = "desc"
+        self,
+        thread_id: str,
+        order: str = "desc",
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        since: Optional[str] = None,
+        exclude_types: Optional[List[str]] = None,
+        include_content: bool = True,
+        etag: Optional[str] = None,
     ) -> MessagesResponse:
-        """Get ALL messages for a thread.
+        """Get a window of a thread's messages (all of them by default).
+
+        To poll for new messages, pass order="asc" with the `next_cursor` of the
+        previous response as `after` and its `etag`. The response is then empty
+        with `not_modified` set if nothing changed.
 
         Args:
             thread_id: The thread ID
             order: Order by created_at: 'asc' or 'desc'
+            limit: Maximum number of messages to return (max 1000)
+            after: Cursor; only messages after it
+            before: Cursor; only messages before it
+            since: ISO timestamp; only messages created after it
+            exclude_types: Message types to leave out, e.g. ["status", "browser_state"]
+            include_content: False leaves out message content
+            etag: ETag of a previous response with the same parameters
 
         Returns:
-            MessagesResponse containing all messages
+            MessagesResponse containing the messages and the cursor to continue from
         """
-        params = {"order": order}
+        params: Dict[str, Any] = {"order": order}
+        if limit:
+            params["limit"] = limit
+        if after:
+            params["after"] = after
+        if before:
+            params["before"] = before
+        if since:
+            params["since"] = since
+        if exclude_types:
+            params["exclude_types"] = exclude_types
+        if not include_content:
+            params["include_content"] = "false"
+
         response = await self.client.get(
-            f"/threads/{thread_id}/messages", params=params
+            f"/threads/{thread_id}/messages",
+            params=params,
+            headers={"If-None-Match": etag} if etag else None,
         )
+        if response.status_code == 304:
+            return MessagesResponse(
+                messages=[], next_cursor=after if order == "asc" else before,
+                etag=etag, not_modified=True,
+            )
         data = self._handle_response(response)
 
-        messages = [from_dict(Message, msg_data) for msg_data in data["messages"]]
-        return MessagesResponse(messages=messages)
+        messages = [
+            from_dict(Message, {"content": None, **msg_data})
+            for msg_data in data["messages"]
+        ]
+        pagination = data.get("pagination", {})
+        return MessagesResponse(
+            messages=messages,
+            has_more=pagination.get("has_more", False),
+            next_cursor=pagination.get("next_cursor"),
+            etag=response.headers.get("ETag"),
+        )
 
     async def add_message_to_thread(self, thread_id: str, message: str) -> Message:
         """Add a simple message to a thread.